@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the startup cost of the plugin.
+
+pytest imports the plugin on every run through its pytest11 entry point,
+whether or not there are markdown files to collect. Each measure runs in
+a fresh interpreter, and reports the median over the repeats of:
+
+- import: ``import pytest_markdoctest`` after pytest is imported, i.e.
+  what every pytest run pays;
+- first collection: importing what collecting the first markdown file
+  needs, i.e. ``pytest_markdoctest.markdown``;
+- pytest, no markdown: ``pytest --collect-only`` of a python test file,
+  with and without the plugin (``-p no:markdoctest``).
+
+Usage::
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --repeat 20 --json out.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from typing import Dict, List
+
+_IMPORT = """
+import time
+import pytest, _pytest.doctest
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def time_import(module: str, repeat: int) -> float:
+    """
+    Median time to import module, after pytest, in a fresh interpreter.
+    """
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT.format(module=module)], check=True, stdout=subprocess.PIPE, universal_newlines=True
+        ).stdout
+        times.append(float(out))
+    return statistics.median(times)
+
+
+def time_command(args: List[str], cwd: str, repeat: int) -> float:
+    """
+    Median wall time of a command.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=10, help="number of timed runs, the median is reported")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as json")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, float] = {}
+    results["import"] = time_import("pytest_markdoctest", args.repeat)
+    results["first collection"] = (
+        time_import("pytest_markdoctest, pytest_markdoctest.markdown", args.repeat) - results["import"]
+    )
+    with tempfile.TemporaryDirectory(prefix="markdoctest-bench-") as tmp:
+        Path(tmp, "test_startup.py").write_text("def test_startup():\n    pass\n")
+        pytest_args = [sys.executable, "-m", "pytest", "--collect-only", "-q", "-p", "no:cacheprovider"]
+        without_plugin = pytest_args + ["-p", "no:markdoctest"]
+        results["pytest, no markdown"] = time_command(pytest_args, tmp, args.repeat)
+        results["pytest, no markdown, without plugin"] = time_command(without_plugin, tmp, args.repeat)
+    results["plugin overhead"] = results["pytest, no markdown"] - results["pytest, no markdown, without plugin"]
+
+    for name, seconds in results.items():
+        print("%-38s %8.1f ms" % (name, seconds * 1000))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of parsing, collecting and running markdown doctests.
+
+Synthetic corpora of markdown files are written to a temporary directory,
+then for each corpus this measures:
+
+- parse: ``parse_markdown_file`` on every file, i.e. scanning the code
+  blocks, ``PythonCodeBlockParser.get_doctest`` and ``ScriptBlockParser``;
+- collect: ``pytest --collect-only`` in process, i.e. ``DoctestMarkdown.collect``
+  and pytest's overhead, with the parse cache disabled;
+- run: ``MarkDoctestRunner.run`` on every parsed block.
+
+Each phase reports its best time over the repeats, blocks per second and
+the peak memory allocated, as measured by tracemalloc.
+
+Usage::
+
+    python benchmarks/bench_markdoctest.py
+    python benchmarks/bench_markdoctest.py --corpus huge --scale 2 --repeat 5 --json out.json
+"""
+
+import argparse
+import doctest
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from pytest_markdoctest import MarkDoctestRunner, parse_markdown_file
+
+from typing import Callable, Dict, List, Tuple
+
+# Corpora: name -> function(scale) returning {filename: text}
+
+
+def _repl_block(i: int) -> str:
+    return "```python\n>>> x%d = %d\n>>> x%d * 2\n%d\n>>> print('line')\nline\n```\n" % (i, i, i, 2 * i)
+
+
+def _script_block(i: int) -> str:
+    return (
+        "```python\n"
+        "def f%d(a, b=%d):\n"
+        "    if a > b:\n"
+        "        return a - b\n"
+        "    return [a + k for k in range(3)]\n"
+        "\n"
+        "y%d = f%d(%d)\n"
+        "for k in range(3):\n"
+        "    y%d = f%d(k)\n"
+        "```\n"
+    ) % (i, i, i, i, i, i, i)
+
+
+def _comment_block(i: int) -> str:
+    return (
+        "<!-- a comment -->\n"
+        "<!-- doctest: +ELLIPSIS -->\n"
+        "<!-- doctest: +NORMALIZE_WHITESPACE -->\n"
+        "```python\n>>> list(range(%d))\n[0, ...]\n```\n"
+    ) % (i + 10)
+
+
+def _prose(i: int) -> str:
+    return "## Section %d\n\nSome *markdown* prose with `inline code` and a [link](https://example.com).\n\n" % i
+
+
+def _document(blocks: List[str]) -> str:
+    return "".join(_prose(i) + block + "\n" for i, block in enumerate(blocks))
+
+
+def many_small(scale: int) -> Dict[str, str]:
+    return {"test_small_%d.md" % n: _document([_repl_block(i) for i in range(5)]) for n in range(200 * scale)}
+
+
+def few_huge(scale: int) -> Dict[str, str]:
+    blocks = [_repl_block(i) if i % 2 else _script_block(i) for i in range(2000 * scale)]
+    return {"test_huge_%d.md" % n: _document(blocks) for n in range(2)}
+
+
+def repl_heavy(scale: int) -> Dict[str, str]:
+    return {"test_repl_%d.md" % n: _document([_repl_block(i) for i in range(100)]) for n in range(10 * scale)}
+
+
+def script_heavy(scale: int) -> Dict[str, str]:
+    return {"test_script_%d.md" % n: _document([_script_block(i) for i in range(100)]) for n in range(10 * scale)}
+
+
+def comment_heavy(scale: int) -> Dict[str, str]:
+    return {"test_comment_%d.md" % n: _document([_comment_block(i) for i in range(100)]) for n in range(10 * scale)}
+
+
+def pathological(scale: int) -> Dict[str, str]:
+    # comments without a block, lines ending with backticks, nested
+    # fences and unclosed fences, which made the former regex backtrack.
+    noise = "<!-- x -->\n" * 20 + "\n" + "text ```\n" * 50 + "````\n```python\nnested\n```\n````\n"
+    blocks = [noise + _repl_block(i) for i in range(200 * scale)]
+    return {"test_pathological.md": _document(blocks) + "```python\nunclosed\n" * 100}
+
+
+CORPORA: Dict[str, Callable[[int], Dict[str, str]]] = {
+    "small": many_small,
+    "huge": few_huge,
+    "repl": repl_heavy,
+    "script": script_heavy,
+    "comment": comment_heavy,
+    "pathological": pathological,
+}
+
+
+def measure(func: Callable[[], int], repeat: int) -> Tuple[float, int, int]:
+    """
+    Best time of func over repeats, the number of blocks it returned and
+    the peak memory allocated during its last call.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        blocks = func()
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, blocks, peak
+
+
+class _CountItems:
+    def __init__(self):
+        self.count = 0
+
+    def pytest_collection_finish(self, session):
+        self.count = len(session.items)
+
+
+def bench_corpus(name: str, scale: int, repeat: int, encoding: str = "utf-8") -> Dict[str, dict]:
+    with tempfile.TemporaryDirectory(prefix="markdoctest-bench-") as tmp:
+        root = Path(tmp)
+        for filename, text in CORPORA[name](scale).items():
+            root.joinpath(filename).write_text(text, encoding=encoding)
+        paths = sorted(root.glob("*.md"))
+
+        def parse():
+            return sum(len(parse_markdown_file(path, encoding)) for path in paths)
+
+        def collect():
+            counter = _CountItems()
+            args = [str(root), "--collect-only", "-q", "-p", "no:cacheprovider", "-o", "markdoctest_parse_cache_size=0"]
+            with open(os.devnull, "w") as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    pytest.main(args, plugins=[counter])
+                finally:
+                    sys.stdout = stdout
+            return counter.count
+
+        parsed = [parse_markdown_file(path, encoding) for path in paths]
+
+        def run():
+            blocks = 0
+            for tests in parsed:
+                runner = MarkDoctestRunner(verbose=False, optionflags=doctest.ELLIPSIS, globs={"__name__": "__main__"})
+                for test in tests:
+                    if test.examples:
+                        runner.run(test, out=[])
+                        blocks += 1
+            return blocks
+
+        results = {}
+        for phase, func in (("parse", parse), ("collect", collect), ("run", run)):
+            seconds, blocks, peak = measure(func, repeat)
+            results[phase] = {
+                "seconds": seconds,
+                "blocks": blocks,
+                "blocks_per_second": blocks / seconds if seconds else float("inf"),
+                "peak_memory": peak,
+            }
+        return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", action="append", choices=sorted(CORPORA), help="corpora to run, default: all")
+    parser.add_argument("--scale", type=int, default=1, help="multiply the size of the corpora")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed repeats, the best is reported")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as json")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print("%-13s %-8s %8s %10s %12s %12s" % ("corpus", "phase", "blocks", "seconds", "blocks/s", "peak KiB"))
+    for name in args.corpus or list(CORPORA):
+        results[name] = bench_corpus(name, args.scale, args.repeat)
+        for phase, r in results[name].items():
+            print(
+                "%-13s %-8s %8d %10.4f %12.0f %12.0f"
+                % (name, phase, r["blocks"], r["seconds"], r["blocks_per_second"], r["peak_memory"] / 1024)
+            )
+        collect, run = results[name]["collect"]["seconds"], results[name]["run"]["seconds"]
+        print("%-13s collection / run time: %.2f" % (name, collect / run if run else float("inf")))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,25 +26,46 @@ __author__ = """Qimai Li"""
 __email__ = "liqimai@qq.com"
 __version__ = "0.1.0"
 
-import re
 from pathlib import Path
-import doctest
-import sys
-import ast
 import pytest
 
 from pytest import Parser, Config, Collector
-from _pytest.pathlib import fnmatch_ex
-from _pytest.doctest import (
-    DoctestItem,
-    get_optionflags,
-    _get_checker,
-    _get_continue_on_failure,
-    _init_runner_class,
-)
 
 from typing import Optional
-from typing import Iterable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pytest_markdoctest.markdown import DoctestMarkdown
+
+# Only the hooks live in this module, which pytest imports on every run
+# through the pytest11 entry point. Parsers, the runner and the caches
+# are imported when they are first needed, mostly on the first markdown
+# file collected. Their names are still importable from here, see
+# __getattr__ below.
+_LAZY_NAMES = {
+    "DoctestMarkdown": "markdown",
+    "MarkDoctestRunner": "markdown",
+    "AnyOutputChecker": "markdown",
+    "ReplBlockParser": "markdown",
+    "ScriptBlockParser": "markdown",
+    "PythonCodeBlockParser": "markdown",
+    "WHOLE_BLOCK": "markdown",
+    "parse_markdown": "markdown",
+    "parse_markdown_bytes": "markdown",
+    "parse_markdown_file": "markdown",
+}
+
+
+def __getattr__(name: str):
+    # PEP 562, lazily import the names moved out of this module
+    module = _LAZY_NAMES.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    import importlib
+
+    value = getattr(importlib.import_module("pytest_markdoctest." + module), name)
+    globals()[name] = value
+    return value
 
 
 def pytest_addoption(parser: Parser) -> None:
@@ -57,6 +78,229 @@ def pytest_addoption(parser: Parser) -> None:
         help="markdown doctests file matching pattern, default: test*.md",
         dest="doctestmarkdown",
     )
+    group.addoption(
+        "--markdoctest-collect-workers",
+        action="store",
+        type=int,
+        default=0,
+        metavar="N",
+        help="parse markdown files in N worker processes during collection, default: 0 (no workers)",
+        dest="markdoctest_collect_workers",
+    )
+    group.addoption(
+        "--markdoctest-dist",
+        action="store_true",
+        default=False,
+        help="with pytest-xdist, run all items of a markdown file on the same worker, "
+        "and balance files by their duration in previous runs",
+        dest="markdoctest_dist",
+    )
+    group.addoption(
+        "--markdoctest-changed",
+        action="store_true",
+        default=False,
+        help="only run the markdown blocks that changed, depend on a changed block, or failed since they last passed",
+        dest="markdoctest_changed",
+    )
+    group.addoption(
+        "--markdoctest-checkpoint",
+        action="store_true",
+        default=False,
+        help="save the globals of markdown files after each block in the pytest cache, "
+        "so that a block selected alone resumes from the nearest checkpoint instead of re-running all blocks before it",
+        dest="markdoctest_checkpoint",
+    )
+    group.addoption(
+        "--markdoctest-profile",
+        action="store",
+        nargs="?",
+        const="time",
+        default=None,
+        choices=["time", "memory", "cprofile"],
+        help="record the wall and cpu time of every markdown example and show the slowest ones; "
+        "'memory' also traces the memory they allocate, 'cprofile' runs them under cProfile",
+        dest="markdoctest_profile",
+    )
+    group.addoption(
+        "--markdoctest-profile-output",
+        action="store",
+        default=None,
+        metavar="PATH",
+        help="write the markdown examples profile as json, or as pstats if PATH ends with .pstats",
+        dest="markdoctest_profile_output",
+    )
+    group.addoption(
+        "--markdoctest-trace",
+        action="store",
+        default=None,
+        metavar="PATH",
+        help="write a span per markdown block and example to PATH, as JSON lines",
+        dest="markdoctest_trace",
+    )
+    group.addoption(
+        "--markdoctest-watch",
+        action="store_true",
+        default=False,
+        help="after running the tests, watch the markdown files and rerun their blocks from the first edited one",
+        dest="markdoctest_watch",
+    )
+    group.addoption(
+        "--markdoctest-daemon",
+        action="store",
+        default=None,
+        metavar="SOCKET",
+        help="run markdown files in the daemon listening at SOCKET, "
+        "started with: python -m pytest_markdoctest.daemon SOCKET [preloaded modules]",
+        dest="markdoctest_daemon",
+    )
+    parser.addini(
+        "markdoctest_parse_cache_size",
+        type="string",
+        default="1024",
+        help="max number of parsed markdown files kept in the pytest cache, 0 disables the parse cache",
+    )
+    parser.addini(
+        "markdoctest_code_cache_size",
+        type="string",
+        default="0",
+        help="max number of markdown files whose compiled examples are kept in the pytest cache, default: 0 (disabled)",
+    )
+    parser.addini(
+        "markdoctest_checkpoint_cache_size",
+        type="string",
+        default="256",
+        help="max number of checkpoints kept in the pytest cache with --markdoctest-checkpoint",
+    )
+    parser.addini(
+        "markdoctest_block_dependencies",
+        type="bool",
+        default=False,
+        help="run independent groups of blocks of a markdown file in separate namespaces, "
+        "found by analyzing the names each block defines and uses",
+    )
+    parser.addini(
+        "markdoctest_whole_block",
+        type="bool",
+        default=False,
+        help="run each script block as a whole, instead of statement by statement",
+    )
+    parser.addini(
+        "markdoctest_output_limit",
+        type="string",
+        default="0",
+        help="max characters of the output of an example kept in memory, beyond which only its head and tail "
+        "are kept and it is compared with the expected output as it is printed, default: 0 (no limit)",
+    )
+    parser.addini(
+        "markdoctest_timeout",
+        type="string",
+        default="0",
+        help="max seconds a markdown block may run, unless it has a TIMEOUT directive, default: 0 (no limit)",
+    )
+    parser.addini(
+        "markdoctest_maxrss",
+        type="string",
+        default="0",
+        help="max memory a markdown block may allocate, e.g. 512M, unless it has a MAXRSS directive, " "default: 0 (no limit)",
+    )
+    parser.addini(
+        "markdoctest_code_classes",
+        type="linelist",
+        default=[],
+        help="'info = strategy' lines, mapping the code class of fences, e.g. python3, "
+        "or classes in braces, e.g. {.python .doctest}, to auto, repl, script or skip",
+    )
+    parser.addini(
+        "markdoctest_prefilter",
+        type="bool",
+        default=True,
+        help="do not collect markdown files without a python fence, found by a bytes search cached by mtime",
+    )
+    parser.addini(
+        "markdoctest_mmap",
+        type="bool",
+        default=False,
+        help="scan markdown files through mmap, decoding only python blocks",
+    )
+    parser.addini(
+        "markdoctest_watch_interval",
+        type="string",
+        default="0.2",
+        help="seconds between checks of the markdown files with --markdoctest-watch, where inotify is not available",
+    )
+
+
+def pytest_addhooks(pluginmanager) -> None:
+    from pytest_markdoctest import hookspec
+
+    pluginmanager.add_hookspecs(hookspec)
+
+
+def pytest_configure(config: Config) -> None:
+    from pytest_markdoctest.cache import CodeCache, DurationRecorder, ParseCache
+
+    parse_cache = ParseCache.from_config(config)
+    if parse_cache is not None:
+        config.pluginmanager.register(parse_cache, ParseCache.name)
+    code_cache = CodeCache.from_config(config)
+    if code_cache is not None:
+        config.pluginmanager.register(code_cache, CodeCache.name)
+    if not hasattr(config, "workerinput"):  # not a pytest-xdist worker
+        config.pluginmanager.register(DurationRecorder(config), DurationRecorder.name)
+    if config.getoption("markdoctest_changed") and getattr(config, "cache", None) is not None:
+        from pytest_markdoctest.changed import ChangedSelector
+        from pytest_markdoctest.fingerprint import ModuleIndex
+
+        module_index = ModuleIndex(config)
+        config.pluginmanager.register(module_index, ModuleIndex.name)
+        config.pluginmanager.register(ChangedSelector(config, module_index), ChangedSelector.name)
+    if config.getoption("markdoctest_checkpoint"):
+        from pytest_markdoctest.checkpoint import CheckpointStore
+
+        checkpoints = CheckpointStore.from_config(config)
+        if checkpoints is not None:
+            config.pluginmanager.register(checkpoints, CheckpointStore.name)
+    if config.getoption("markdoctest_watch"):
+        from pytest_markdoctest.checkpoint import CheckpointStore, MemoryCheckpoints
+        from pytest_markdoctest.watch import MarkdownWatcher
+
+        config.pluginmanager.register(MarkdownWatcher(config), MarkdownWatcher.name)
+        if not config.pluginmanager.has_plugin(CheckpointStore.name):
+            # reruns resume from the checkpoint before the first edited block
+            max_entries = int(config.getini("markdoctest_checkpoint_cache_size"))
+            config.pluginmanager.register(MemoryCheckpoints(max_entries), CheckpointStore.name)
+    daemon = config.getoption("markdoctest_daemon")
+    if daemon is not None:
+        from pytest_markdoctest.daemon import DaemonClient
+
+        config.pluginmanager.register(DaemonClient(config, daemon), DaemonClient.name)
+    profile = config.getoption("markdoctest_profile")
+    if profile is not None:
+        from pytest_markdoctest.profiling import Profiler
+
+        output = config.getoption("markdoctest_profile_output")
+        if output is not None and output.endswith(".pstats") and profile != "cprofile":
+            raise pytest.UsageError("--markdoctest-profile-output=%s requires --markdoctest-profile=cprofile" % output)
+        config.pluginmanager.register(Profiler(config, profile, output), Profiler.name)
+    trace = config.getoption("markdoctest_trace")
+    if trace is not None:
+        from pytest_markdoctest.tracing import TraceExporter
+
+        config.pluginmanager.register(TraceExporter(config, trace), TraceExporter.name)
+    workers = config.getoption("markdoctest_collect_workers")
+    if workers > 0:
+        from pytest_markdoctest.parallel import CollectPool
+
+        config.pluginmanager.register(CollectPool(config, workers), CollectPool.name)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config: Config, log):
+    if config.getoption("markdoctest_dist"):
+        from pytest_markdoctest.scheduling import MarkdownScheduling
+
+        return MarkdownScheduling(config, log)
+    return None
 
 
 def pytest_collect_file(
@@ -65,232 +309,44 @@ def pytest_collect_file(
 ) -> Optional["DoctestMarkdown"]:
     config = parent.config
     if file_path.suffix == ".md" and _is_doctest_markdown(config, file_path, parent):
+        if not _may_have_blocks(config, file_path, parent):
+            return None
+        from pytest_markdoctest.markdown import DoctestMarkdown
+
         md: DoctestMarkdown = DoctestMarkdown.from_parent(parent, path=file_path)
         return md
 
 
 def _is_doctest_markdown(config: Config, path: Path, parent: Collector) -> bool:
-    if path.suffix in (".md") and parent.session.isinitpath(path):
-        return True
-    globs = config.getoption("doctestmarkdown") or ["test*.md"]
-    # globs = None or ["test*.md"]
-    return any(fnmatch_ex(glob, path) for glob in globs)
-
-
-class DoctestMarkdown(pytest.Module):
-    obj = None
-
-    # regular expression for markdown code blocks like
-    # ```python
-    # some python code
-    # ```
-    _CODE_BLOCK_RE = re.compile(
-        r"""
-        (?P<option_list>            # html comment with doctest option
-                                    # such as <!--- doctest: ... --->
-            (
-                ^                       # Necessarily at the beginning of a new line
-                [ \t]*                  # Possibly leading spaces
-                <!--([^\n]*?)-->             # html comment
-                [ \t]*                  # trailing spaces
-                \n                      # a newline
-            )*                      # Zero or more html comments
-        )
-        ^                           # Necessarily at the beginning of a new line
-        (?P<code_all>
-            (?P<code_start>
-                [ \t]*              # Possibly leading spaces
-                \`{3,}              # 3 code marks (backticks) or more
-            )
-            [ \t]*                  # Possibly some spaces or tab
-            (?P<code_class>[\w\-\.]+)?    # or a code class like html, ruby, perl
-            (?:[^\n]*)?             # possibly some text before newline
-            \n                      # newline
-            (?P<code_content>.*?)   # enclosed content
-            # \n+
-            (?<!`)
-            (?P=code_start)         # balanced closing block marks
-            (?!`)
-        )
-        $                # and a new line or end of string
-        """,
-        re.DOTALL | re.MULTILINE | re.VERBOSE,
-    )
+    # matching is memoized, isinitpath is not
+    return _match_doctest_markdown(config, path) or parent.session.isinitpath(path)
 
-    def collect(self) -> Iterable[DoctestItem]:
-
-        # Inspired by doctest.testfile; ideally we would use it directly,
-        # but it doesn't support passing a custom checker.
-        encoding = self.config.getini("doctest_encoding")
-        text = self.path.read_text(encoding)
-        filename = str(self.path)
-        name = self.path.name
-        globs = {"__name__": "__main__"}
-
-        optionflags = get_optionflags(self)
-
-        runner = MarkDoctestRunner(
-            verbose=False,
-            optionflags=optionflags,
-            checker=_get_checker(),
-            continue_on_failure=_get_continue_on_failure(self.config),
-            globs=globs,  # runner-level globs
-        )
-
-        parser = PythonCodeBlockParser()
-        charno, lineno = 0, 1
-        for m in self._CODE_BLOCK_RE.finditer(text):
-            # Update lineno (lines before this example)
-            lineno += text.count("\n", charno, m.start())
-            charno = m.start()
-
-            code_class = m.group("code_class")
-            if code_class is not None:
-                code_class = code_class.split()[0]
-            if code_class in ("python", "py", "pycon"):
-                content_line_no = lineno + m.group("option_list").count("\n")
-                name = "<%s block at line %s>" % (code_class, content_line_no)
-                test = parser.get_doctest(m, name, filename, lineno)
-                if test.examples:
-                    yield DoctestItem.from_parent(self, name=test.name, runner=runner, dtest=test)
-
-            lineno += text.count("\n", charno, m.end())
-            charno = m.end()
-
-
-class ScriptBlockParser(doctest.DocTestParser):
-    """
-    A parser for script code blocks (lines not starting with '>>>').
-    """
 
-    def parse(self, string, name="<string>"):
-        """
-        parse string into examples.
-        """
-        ast_tree = ast.parse(string)
-        # directives are ignored in script block.
-        options = {}
-        if sys.version_info[:3] > (3, 9):
-            statements = [ast.unparse(element) for element in ast_tree.body]
-        elif sys.version_info[:3] > (3, 8):
-            statements = self._split_into_statements(string, ast_tree)
-        else:
-            statements = [self._unparse(element) for element in ast_tree.body]
-
-        examples = []
-        for element, stmt in zip(ast_tree.body, statements):
-            # Given ELLIPSIS option and  want="...", any output is valid
-            # output, because we do not restrict the output of script
-            # block.
-            options[doctest.ELLIPSIS] = True
-
-            # create an example for the statement
-            eg = doctest.Example(
-                stmt,
-                want="...",
-                lineno=element.lineno - 1,
-                indent=0,
-                options=options,
-            )
-            # doctest.Example.__init__ always adds a tail '\n' to want,
-            # which is not expected here, so we force it to be "..."
-            # without '\n', so it can match anything.
-            eg.want = "..."
-            examples.append(eg)
-        return examples
-
-    def _unparse(self, ast_node):
-        from pytest_markdoctest.unparse import Unparser
-        from io import StringIO
-
-        stmt = StringIO()
-        Unparser(ast_node, stmt)
-        return stmt.getvalue()
-
-    def _split_into_statements(self, source, ast_tree):
-        def get_source_stmt(element: ast.stmt):
-            ls = lines[element.lineno - 1 : element.end_lineno]
-            ls[-1] = ls[-1][: element.end_col_offset]
-            ls[0] = ls[0][element.col_offset :]
-            return "\n".join(ls)
-
-        lines = source.splitlines()
-        statements = [get_source_stmt(element) for element in ast_tree.body]
-        return statements
-
-
-class PythonCodeBlockParser:
-
-    _OPTION_RE = re.compile(
-        r"""
-        (?P<option>                 # html comment with doctest option
-                                    # such as <!--- doctest: ... --->
-            <!--+\s*                # opening comment
-            (?P<option_content>
-                doctest:\s*([^\n\'"]*?) # doctest option
-            )
-            \s*--+>                # closing comment
-        )
-        """,
-        re.DOTALL | re.MULTILINE | re.VERBOSE,
-    )
+def _match_doctest_markdown(config: Config, path: Path) -> bool:
+    from pytest_markdoctest.matching import MarkdownMatcher
+
+    matcher: Optional[MarkdownMatcher] = config.pluginmanager.get_plugin(MarkdownMatcher.name)
+    if matcher is None:
+        matcher = MarkdownMatcher.from_config(config)
+        config.pluginmanager.register(matcher, MarkdownMatcher.name)
+    return matcher.match(path)
+
 
-    doctest_parser = doctest.DocTestParser()
-    script_parser = ScriptBlockParser()
-
-    def get_doctest(self, code_block: "re.Match", name, filename, lineno):
-        """
-        If `string` starts with '>>>', treat it as an REPL block,
-        otherwise treat it as an script block.
-        """
-
-        code_content = code_block.group("code_content")
-        option_list = code_block.group("option_list")
-
-        # parse code_content into examples
-        code_content_lineno = lineno + option_list.count("\n")
-        # dummy globs in test. real globs is runner.globs.
-        globs = {}
-        if code_content.startswith(">>>"):
-            test = self.doctest_parser.get_doctest(code_content, globs, name, filename, code_content_lineno)
-        else:
-            test = self.script_parser.get_doctest(code_content, globs, name, filename, code_content_lineno)
-
-        # parse test-level options
-        test.options = {}
-        for opt in self._OPTION_RE.finditer(option_list):
-            # compose a valid doctest directive, and parse it by
-            # doctest.DocTestParser._find_options
-            directive = "a # " + opt.group("option_content")
-            opt = self.doctest_parser._find_options(directive, name, lineno)
-            test.options.update(opt)
-
-        # update example-level options
-        for eg in test.examples:
-            eg.options = {**test.options, **eg.options}
-
-        return test
-
-
-class MarkDoctestRunner(_init_runner_class()):
-    def __init__(self, *args, globs={}, **kwargs):
-        """
-        Inheritance chain:
-
-        MarkDoctestRunner -> PytestDoctestRunner
-                          -> DebugRunner -> DocTestRunner
-
-        Nearly same as PytestDoctestRunner, except that it has an
-        runner-level dict storing globals variables.
-        """
-        super().__init__(*args, **kwargs)
-        self.globs = globs  # runner-level globs
-
-    def run(self, test, compileflags=None, out=None, clear_globs=False):
-        """
-        clear_globs is default to False, because we want to keep global
-        variables across tests.
-        """
-        # tests share the runner's globs.
-        test.globs = self.globs
-        return super().run(test, compileflags, out, clear_globs)
+def _may_have_blocks(config: Config, path: Path, parent: Collector) -> bool:
+    """
+    Whether a markdown file may have python blocks, files given on the
+    command line are always collected.
+    """
+    if not config.getini("markdoctest_prefilter") or parent.session.isinitpath(path):
+        return True
+    from pytest_markdoctest.code_classes import CodeClasses
+    from pytest_markdoctest.prefilter import FencePrefilter
+    from pytest_markdoctest.scanner import is_ascii_compatible
+
+    prefilter: Optional[FencePrefilter] = config.pluginmanager.get_plugin(FencePrefilter.name)
+    if prefilter is None:
+        if not is_ascii_compatible(config.getini("doctest_encoding")):
+            return True
+        prefilter = FencePrefilter(config, CodeClasses.from_config(config).tested)
+        config.pluginmanager.register(prefilter, FencePrefilter.name)
+    return prefilter.may_have_blocks(path)
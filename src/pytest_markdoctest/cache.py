@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk caches kept under pytest's ``config.cache`` directory.
+
+The caches are registered on every run, so doctest and hashlib are only
+imported once they are used, i.e. when markdown files are collected.
+"""
+
+import importlib.util
+import json
+import marshal
+import os
+import sys
+from pathlib import Path
+from types import CodeType
+
+from pytest import Config
+
+from pytest_markdoctest import __version__
+
+from typing import Dict, Iterable, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import doctest
+
+# Bump whenever the layout of serialized doctests changes, so stale
+# entries written by an older plugin are never read back.
+_FORMAT_VERSION = 3
+
+
+def cache_dir(config: Config, name: str, create: bool = True) -> Optional[Path]:
+    """
+    Return a directory under pytest's cache dir, or None if the
+    cacheprovider plugin is disabled (``-p no:cacheprovider``). With
+    `create` false, the path is returned without creating the directory,
+    see :class:`_LazyDirectory`.
+    """
+    cache = getattr(config, "cache", None)
+    if cache is None:
+        return None
+    if not create:
+        # resolved like pytest's cacheprovider does
+        cache_root = os.path.expanduser(os.path.expandvars(config.getini("cache_dir")))
+        rootpath = getattr(config, "rootpath", None) or config.rootdir  # pytest < 6.1
+        return Path(str(rootpath), cache_root, "d", name)
+    if hasattr(cache, "mkdir"):
+        return cache.mkdir(name)
+    return Path(str(cache.makedir(name)))  # pytest < 7.0
+
+
+def _flag_names(options: dict) -> dict:
+    """
+    Map {flag: bool} to {name: bool}. Flags are stored by name because
+    the numeric value of a registered flag depends on import order.
+    """
+    import doctest
+
+    names = {flag: name for name, flag in doctest.OPTIONFLAGS_BY_NAME.items()}
+    return {names[flag]: value for flag, value in options.items() if flag in names}
+
+
+def _flag_values(options: dict) -> dict:
+    import doctest
+
+    return {doctest.register_optionflag(name): value for name, value in options.items()}
+
+
+def dump_doctests(tests: Iterable["doctest.DocTest"]) -> list:
+    """
+    Convert doctests into json-compatible data. The filename and globs
+    are not stored, they are filled in by :func:`load_doctests`.
+    """
+    data = []
+    for test in tests:
+        examples = [
+            {
+                "source": eg.source,
+                "want": eg.want,
+                "exc_msg": eg.exc_msg,
+                "lineno": eg.lineno,
+                "indent": eg.indent,
+                "options": _flag_names(eg.options),
+            }
+            for eg in test.examples
+        ]
+        data.append(
+            {
+                "name": test.name,
+                "lineno": test.lineno,
+                "docstring": test.docstring,
+                "options": _flag_names(getattr(test, "options", {})),
+                "script_block": getattr(test, "script_block", False),
+                "limits": getattr(test, "limits", {}),
+                "examples": examples,
+            }
+        )
+    return data
+
+
+def load_doctests(data: list, filename: str) -> List["doctest.DocTest"]:
+    import doctest
+
+    tests = []
+    for item in data:
+        examples = []
+        for eg_data in item["examples"]:
+            eg = doctest.Example(
+                eg_data["source"],
+                eg_data["want"],
+                exc_msg=eg_data["exc_msg"],
+                lineno=eg_data["lineno"],
+                indent=eg_data["indent"],
+                options=_flag_values(eg_data["options"]),
+            )
+            # doctest.Example.__init__ normalizes want, restore it as is,
+            # e.g. the "..." of script blocks has no trailing '\n'.
+            eg.want = eg_data["want"]
+            examples.append(eg)
+        test = doctest.DocTest(examples, {}, item["name"], filename, item["lineno"], item["docstring"])
+        test.options = _flag_values(item["options"])
+        test.script_block = item["script_block"]
+        test.limits = item["limits"]
+        tests.append(test)
+    return tests
+
+
+class _LazyDirectory:
+    """
+    The directory of a cache, created through pytest's cache on the first
+    write, so that runs without markdown files leave no trace of it.
+    """
+
+    name = ""
+
+    def __init__(self, directory: Path, config: Optional[Config] = None):
+        self.directory = directory
+        self._config = config
+
+    def _create_directory(self) -> None:
+        config, self._config = self._config, None
+        if config is not None:
+            self.directory = cache_dir(config, self.name) or self.directory
+
+
+def _prune(directory: Path, pattern: str, max_entries: int) -> None:
+    """
+    Remove the files matching pattern in directory, except the
+    ``max_entries`` most recently modified ones.
+    """
+    entries = []
+    for path in directory.glob(pattern):
+        try:
+            entries.append((path.stat().st_mtime, path))
+        except OSError:
+            continue
+    if len(entries) <= max_entries:
+        return
+    entries.sort(reverse=True)
+    for _, path in entries[max_entries:]:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+class ParseCache(_LazyDirectory):
+    """
+    Content-hash keyed cache of parsed markdown files.
+
+    Each entry is a json file holding the doctests extracted from one
+    markdown file. Entries are touched on every hit, and the least
+    recently used ones are evicted at the end of the session once there
+    are more than ``max_entries`` of them.
+    """
+
+    name = "markdoctest-parse"
+
+    def __init__(self, directory: Path, max_entries: int, config: Optional[Config] = None):
+        super().__init__(directory, config)
+        self.max_entries = max_entries
+
+    @classmethod
+    def from_config(cls, config: Config) -> Optional["ParseCache"]:
+        max_entries = int(config.getini("markdoctest_parse_cache_size"))
+        if max_entries <= 0:
+            return None
+        directory = cache_dir(config, cls.name, create=False)
+        if directory is None:
+            return None
+        return cls(directory, max_entries, config)
+
+    @staticmethod
+    def key(data: bytes, encoding: str, variant: str = "") -> str:
+        """
+        Key of a file content, `variant` identifying how it is parsed. The
+        plugin version is part of it, as the parser may change in any
+        release.
+        """
+        import hashlib
+
+        h = hashlib.sha256()
+        h.update(
+            (
+                "%s|%s|%s|%s|%s|%s|"
+                % (_FORMAT_VERSION, __version__, sys.version_info[:2], sys.implementation.name, encoding, variant)
+            ).encode()
+        )
+        h.update(data)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / (key + ".json")
+
+    def get(self, key: str, filename: str) -> Optional[List["doctest.DocTest"]]:
+        path = self._path(key)
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        try:
+            return load_doctests(data, filename)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def contains(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def set(self, key: str, tests: Iterable["doctest.DocTest"]) -> None:
+        self.set_data(key, dump_doctests(tests))
+
+    def set_data(self, key: str, data: list) -> None:
+        """
+        Same as set, given the output of :func:`dump_doctests`.
+        """
+        self._create_directory()
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp%d" % os.getpid())
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(str(tmp), str(path))
+        except OSError:
+            pass
+
+    def prune(self) -> None:
+        """
+        Evict least recently used entries beyond ``max_entries``.
+        """
+        _prune(self.directory, "*.json", self.max_entries)
+
+    def pytest_sessionfinish(self) -> None:
+        self.prune()
+
+
+class CodeStore:
+    """
+    Code objects compiled from the examples of one markdown file, keyed
+    by source, filename, compile flags and bytecode version.
+
+    The store is loaded on first use, and only the code objects used in
+    the session are written back.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._loaded: Optional[Dict[str, CodeType]] = None
+        self.used: Dict[str, CodeType] = {}
+        self.dirty = False
+
+    @staticmethod
+    def key(source: str, filename: str, mode: str, flags: int) -> str:
+        import hashlib
+
+        h = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+        h.update(("%s|%s|%d|" % (filename, mode, flags)).encode())
+        h.update(source.encode("utf-8", "surrogatepass"))
+        return h.hexdigest()
+
+    def _load(self) -> Dict[str, CodeType]:
+        if self._loaded is None:
+            self._loaded = {}
+            try:
+                with self.path.open("rb") as f:
+                    if f.read(len(importlib.util.MAGIC_NUMBER)) == importlib.util.MAGIC_NUMBER:
+                        self._loaded = marshal.load(f)
+            except (OSError, EOFError, ValueError, TypeError):
+                pass
+        return self._loaded
+
+    def compile(self, source: str, filename: str, mode: str, flags: int) -> CodeType:
+        """
+        Same as compile(source, filename, mode, flags, True), reusing the
+        code object compiled in a previous session if any.
+        """
+        key = self.key(source, filename, mode, flags)
+        code = self.used.get(key)
+        if code is None:
+            code = self._load().get(key)
+            if code is None:
+                code = compile(source, filename, mode, flags, True)
+                self.dirty = True
+            self.used[key] = code
+        return code
+
+    def save(self) -> None:
+        if not self.dirty and self._loaded is not None and len(self.used) == len(self._loaded):
+            try:
+                os.utime(self.path)
+            except OSError:
+                pass
+            return
+        tmp = self.path.with_suffix(".tmp%d" % os.getpid())
+        try:
+            with tmp.open("wb") as f:
+                f.write(importlib.util.MAGIC_NUMBER)
+                marshal.dump(self.used, f)
+            os.replace(str(tmp), str(self.path))
+        except (OSError, ValueError):
+            pass
+
+
+class CodeCache(_LazyDirectory):
+    """
+    Persistent cache of the code objects of markdown examples, with one
+    marshal file per markdown file. Least recently used files are evicted
+    at the end of the session beyond ``max_entries``.
+    """
+
+    name = "markdoctest-code"
+
+    def __init__(self, directory: Path, max_entries: int, config: Optional[Config] = None):
+        super().__init__(directory, config)
+        self.max_entries = max_entries
+        self.stores: Dict[str, CodeStore] = {}
+
+    @classmethod
+    def from_config(cls, config: Config) -> Optional["CodeCache"]:
+        max_entries = int(config.getini("markdoctest_code_cache_size"))
+        if max_entries <= 0:
+            return None
+        directory = cache_dir(config, cls.name, create=False)
+        if directory is None:
+            return None
+        return cls(directory, max_entries, config)
+
+    def store_for(self, md_path: Path) -> CodeStore:
+        import hashlib
+
+        name = hashlib.sha256(str(md_path).encode("utf-8", "surrogateescape")).hexdigest()
+        store = self.stores.get(name)
+        if store is None:
+            store = self.stores[name] = CodeStore(self.directory / (name + ".marshal"))
+        return store
+
+    def pytest_sessionfinish(self) -> None:
+        for store in self.stores.values():
+            if store.used:
+                self._create_directory()
+                store.save()
+        _prune(self.directory, "*.marshal", self.max_entries)
+
+
+class DurationRecorder:
+    """
+    Record the total duration of each markdown file in the pytest cache,
+    for the xdist scheduler to balance files across workers.
+    """
+
+    name = "markdoctest-durations"
+    key = "markdoctest/durations"
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.durations: Dict[str, float] = {}
+
+    @classmethod
+    def load(cls, config: Config) -> Dict[str, float]:
+        cache = getattr(config, "cache", None)
+        if cache is None:
+            return {}
+        return cache.get(cls.key, {})
+
+    def pytest_runtest_logreport(self, report) -> None:
+        path = report.nodeid.split("::", 1)[0]
+        if path.endswith(".md"):
+            self.durations[path] = self.durations.get(path, 0.0) + report.duration
+
+    def pytest_sessionfinish(self) -> None:
+        cache = getattr(self.config, "cache", None)
+        if cache is None or not self.durations:
+            return
+        durations = self.load(self.config)
+        durations.update(self.durations)
+        cache.set(self.key, durations)
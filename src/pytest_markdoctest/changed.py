@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Change-aware selection of markdown blocks, for --markdoctest-changed.
+
+Every block gets a key hashing its source and the sources of the blocks
+it depends on, i.e. all blocks before it unless block dependencies are
+analyzed, and the settings its examples run with, e.g. the
+doctest_optionflags ini option. The keys of blocks that passed are stored in pytest's cache,
+one entry per markdown file. In the next run, blocks whose key passed
+before are deselected; the blocks they depend on are replayed only for
+the selected blocks that need them. All blocks of a file run again when
+a module it imported changed, see :mod:`pytest_markdoctest.fingerprint`.
+"""
+
+import doctest
+import hashlib
+
+from pytest import Config, Item, TestReport
+
+from pytest_markdoctest.checkpoint import block_hash
+from pytest_markdoctest.dependency import BlockDependencies
+from pytest_markdoctest.fingerprint import ModuleIndex
+
+from typing import Dict, List, Sequence, Set, Tuple
+
+
+def block_keys(blocks: Sequence[doctest.DocTest], dependencies: BlockDependencies, signature: str = "") -> List[str]:
+    """
+    For every block, a hash of the block and the blocks it depends on,
+    which changes when any of them changes, or when `signature`, which
+    identifies the settings of the runner, does.
+    """
+    hashes = [block_hash(test).encode() for test in blocks]
+    keys = []
+    for i in range(len(blocks)):
+        h = hashlib.sha256(signature.encode())
+        for j in dependencies.ancestors(i):
+            h.update(hashes[j])
+        h.update(hashes[i])
+        keys.append(h.hexdigest())
+    return keys
+
+
+class ChangedSelector:
+    """
+    Deselect the markdown blocks that passed in a previous run with the
+    same key, and record the outcome of the others.
+    """
+
+    name = "markdoctest-changed"
+
+    def __init__(self, config: Config, modules: ModuleIndex):
+        self.config = config
+        self.modules = modules
+        # markdown file -> {block key: passed} of the collected blocks
+        self.files: Dict[str, Dict[str, bool]] = {}
+        # nodeid -> (markdown file, block key) of the selected blocks
+        self.selected: Dict[str, Tuple[str, str]] = {}
+        # (markdown file, block key) of the blocks run by this process
+        self.ran: Set[Tuple[str, str]] = set()
+
+    @staticmethod
+    def cache_key(path: str) -> str:
+        return "markdoctest/changed/" + hashlib.sha256(path.encode("utf-8", "surrogateescape")).hexdigest()
+
+    def _load(self, path: str) -> Dict[str, bool]:
+        return self.config.cache.get(self.cache_key(path), {})
+
+    def pytest_collection_modifyitems(self, config: Config, items: List[Item]) -> None:
+        from pytest_markdoctest.markdown import MarkDoctestRunner
+
+        runner_keys: Dict[int, Dict[int, str]] = {}
+        previous: Dict[str, Dict[str, bool]] = {}
+        selected, deselected = [], []
+        for item in items:
+            runner = getattr(item, "runner", None)
+            if not isinstance(runner, MarkDoctestRunner) or not runner.blocks:
+                selected.append(item)
+                continue
+            keys = runner_keys.get(id(runner))
+            if keys is None:
+                keys = runner_keys[id(runner)] = dict(
+                    zip(map(id, runner.blocks), block_keys(runner.blocks, runner.dependencies, runner.signature()))
+                )
+            key = keys[id(item.dtest)]
+            path = item.nodeid.split("::", 1)[0]
+            if path not in previous:
+                # results are outdated if modules the file imported changed
+                previous[path] = self._load(path) if self.modules.is_unchanged(path) else {}
+                self.files[path] = {}
+            passed = previous[path].get(key, False)
+            self.files[path][key] = passed
+            if passed:
+                deselected.append(item)
+            else:
+                selected.append(item)
+                self.selected[item.nodeid] = (path, key)
+
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+            items[:] = selected
+
+    def pytest_runtest_logreport(self, report: TestReport) -> None:
+        path_key = self.selected.get(report.nodeid)
+        if path_key is None:
+            return
+        path, key = path_key
+        self.ran.add(path_key)
+        if report.when == "setup":
+            self.files[path][key] = not report.failed
+        elif report.failed:
+            self.files[path][key] = False
+
+    def pytest_sessionfinish(self) -> None:
+        for path, results in self.files.items():
+            # pytest-xdist workers run a part of the blocks each, keep the
+            # results other workers may have stored for the others.
+            stored = self._load(path)
+            for key in results:
+                if (path, key) not in self.ran:
+                    results[key] = stored.get(key, results[key])
+            # only the keys of the current blocks are kept
+            self.config.cache.set(self.cache_key(path), results)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints of the globals shared by the blocks of a markdown file.
+
+After a block runs, the picklable part of the runner's globals is saved
+under pytest's cache directory, keyed by the content of the block and of
+all blocks before it. When a block is run without the blocks before it,
+e.g. when selected with -k, its runner restores the nearest checkpoint
+and only replays the blocks after it.
+
+Values that can't be pickled, e.g. open files, are left out. A checkpoint
+missing some values is only restored if no later block mentions them.
+Functions and classes defined in blocks are only picklable with
+cloudpickle, which is used when installed.
+"""
+
+import doctest
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import re
+from collections import OrderedDict
+from pathlib import Path
+from types import ModuleType
+
+from pytest import Config
+
+from pytest_markdoctest.cache import _flag_names, _prune, cache_dir
+
+from typing import Container, Dict, List, Optional, Sequence, Set, Tuple
+
+try:
+    # pickles functions and classes defined in markdown blocks, which
+    # pickle can only reference by name.
+    import cloudpickle as _pickler
+except ImportError:  # pragma: no cover
+    _pickler = pickle
+
+
+def block_hash(test: doctest.DocTest) -> str:
+    """
+    Hash of what a block executes: its examples and their options.
+    """
+    data = [_flag_names(getattr(test, "options", {}))]
+    data.extend((eg.source, _flag_names(eg.options)) for eg in test.examples)
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def chain_hashes(tests: Sequence[doctest.DocTest]) -> List[str]:
+    """
+    For every block, a hash of the block and all blocks before it, which
+    identifies the state of the globals after running them in order.
+    """
+    hashes = []
+    h = hashlib.sha256()
+    for test in tests:
+        h.update(block_hash(test).encode())
+        hashes.append(h.copy().hexdigest())
+    return hashes
+
+
+_IDENTIFIER_RE = re.compile(r"[^\W\d]\w*")
+
+
+def mentioned_names(test: doctest.DocTest) -> Set[str]:
+    """
+    Identifiers appearing in the source of a block, a superset of the
+    globals it uses.
+    """
+    names = set()
+    for eg in test.examples:
+        names.update(_IDENTIFIER_RE.findall(eg.source))
+    return names
+
+
+def snapshot(globs: dict) -> Tuple[Dict[str, Tuple[str, object]], Set[str]]:
+    """
+    Pickle the globals value by value, storing modules by name. Return
+    the pickled values and the names of the values that can't be pickled.
+    """
+    values: Dict[str, Tuple[str, object]] = {}
+    skipped = set()
+    for name, value in globs.items():
+        if name == "__builtins__":
+            continue
+        if isinstance(value, ModuleType):
+            values[name] = ("module", value.__name__)
+            continue
+        try:
+            values[name] = ("value", _pickler.dumps(value))
+        except Exception:
+            skipped.add(name)
+    return values, skipped
+
+
+def restore(values: Dict[str, Tuple[str, object]]) -> Tuple[dict, Set[str]]:
+    """
+    Rebuild globals from the values of a snapshot. Return them and the
+    names of the values that could not be restored.
+    """
+    globs = {}
+    failed = set()
+    for name, (kind, value) in values.items():
+        try:
+            if kind == "module":
+                globs[name] = importlib.import_module(value)
+            else:
+                globs[name] = pickle.loads(value)
+        except Exception:
+            failed.add(name)
+    return globs, failed
+
+
+def _restore_needed(values: Dict[str, Tuple[str, object]], skipped: Set[str], needed: Container[str]) -> Optional[dict]:
+    if any(name in needed for name in skipped):
+        return None
+    globs, failed = restore(values)
+    if any(name in needed for name in failed):
+        return None
+    return globs
+
+
+class CheckpointStore:
+    """
+    Checkpoints of globals, one pickle file per chain hash.
+    """
+
+    name = "markdoctest-checkpoints"
+
+    def __init__(self, directory: Path, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    @classmethod
+    def from_config(cls, config: Config) -> Optional["CheckpointStore"]:
+        if not config.getoption("markdoctest_checkpoint"):
+            return None
+        directory = cache_dir(config, cls.name)
+        if directory is None:
+            return None
+        return cls(directory, int(config.getini("markdoctest_checkpoint_cache_size")))
+
+    def _path(self, chain_hash: str) -> Path:
+        return self.directory / (chain_hash + ".pickle")
+
+    def __contains__(self, chain_hash: str) -> bool:
+        return self._path(chain_hash).exists()
+
+    def load(self, chain_hash: str, needed: Container[str]) -> Optional[dict]:
+        """
+        The globals saved for a chain hash, or None if there is no
+        checkpoint or some needed names can't be restored.
+        """
+        try:
+            values, skipped = pickle.loads(self._path(chain_hash).read_bytes())
+        except Exception:
+            return None
+        return _restore_needed(values, skipped, needed)
+
+    def save(self, chain_hash: str, globs: dict) -> None:
+        path = self._path(chain_hash)
+        tmp = path.with_suffix(".tmp%d" % os.getpid())
+        try:
+            tmp.write_bytes(pickle.dumps(snapshot(globs)))
+            os.replace(str(tmp), str(path))
+        except OSError:
+            pass
+
+    def pytest_sessionfinish(self) -> None:
+        _prune(self.directory, "*.pickle", self.max_entries)
+
+
+class MemoryCheckpoints:
+    """
+    Checkpoints of globals kept in memory, for a session that runs the
+    same markdown files again, e.g. with --markdoctest-watch. The least
+    recently used are dropped first.
+    """
+
+    name = CheckpointStore.name
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._snapshots: "OrderedDict[str, Tuple[Dict[str, Tuple[str, object]], Set[str]]]" = OrderedDict()
+
+    def __contains__(self, chain_hash: str) -> bool:
+        return chain_hash in self._snapshots
+
+    def load(self, chain_hash: str, needed: Container[str]) -> Optional[dict]:
+        saved = self._snapshots.get(chain_hash)
+        if saved is None:
+            return None
+        self._snapshots.move_to_end(chain_hash)
+        return _restore_needed(saved[0], saved[1], needed)
+
+    def save(self, chain_hash: str, globs: dict) -> None:
+        self._snapshots[chain_hash] = snapshot(globs)
+        while len(self._snapshots) > self.max_entries:
+            self._snapshots.popitem(last=False)
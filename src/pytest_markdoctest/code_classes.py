@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Which fenced code blocks are tested, and how.
+
+The ``markdoctest_code_classes`` ini option maps the info string of
+fences to a strategy, one entry per line::
+
+    [pytest]
+    markdoctest_code_classes =
+        python3 = auto
+        ipython = repl
+        {.python .doctest} = script
+        pycon = skip
+
+A key is either a code class, i.e. the first word of the info string, so
+that ``python title="example.py"`` has the class ``python``, or classes
+in braces, matching attribute info strings like ``{.python .doctest #id}``
+that have all of them. Entries add to, or override, the default
+``python``, ``py`` and ``pycon``, which are ``auto``.
+
+Strategies are:
+
+- ``auto``: a REPL block if it starts with ``>>>``, else a script block;
+- ``repl`` and ``script``: always a REPL, or a script block;
+- ``skip``: the block is not tested.
+
+Plugins and conftest files may add strategies with
+:func:`register_strategy`.
+"""
+
+import json
+import re
+
+import pytest
+from pytest import Config
+
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+DEFAULT_CODE_CLASSES = {"python": "auto", "py": "auto", "pycon": "auto"}
+
+BUILTIN_STRATEGIES = ("auto", "repl", "script", "skip")
+
+# name -> parser of registered strategies
+_STRATEGIES: Dict[str, object] = {}
+
+# key = strategy, the key being a code class or classes in braces
+_ENTRY_RE = re.compile(r"^(?P<key>[\w\-\.]+|\{[^{}]*\})\s*=\s*(?P<strategy>[\w\-\.]+)$")
+
+
+def register_strategy(name: str, parser) -> None:
+    """
+    Register a strategy for markdoctest_code_classes. `parser` has the
+    ``parse(string, name, lines)`` method of ``ReplBlockParser``, and
+    returns the doctest examples of the content of a block.
+    """
+    if name in BUILTIN_STRATEGIES:
+        raise ValueError("%r is a builtin strategy" % name)
+    _STRATEGIES[name] = parser
+
+
+def get_strategy(name: str):
+    """
+    The parser of a registered strategy.
+    """
+    return _STRATEGIES[name]
+
+
+def _attribute_tokens(info: str) -> List[str]:
+    info = info.strip()
+    if not info.startswith("{"):
+        return []
+    end = info.find("}")
+    tokens = info[1 : end if end >= 0 else len(info)].split()
+    return [token[1:] for token in tokens if token.startswith(".") and len(token) > 1]
+
+
+def attribute_classes(info: str) -> FrozenSet[str]:
+    """
+    Classes of an attribute info string, e.g. {"python", "doctest"} for
+    ``{.python .doctest #id key=value}``.
+    """
+    return frozenset(_attribute_tokens(info))
+
+
+class CodeClasses:
+    """
+    The strategy of every code class, and of attribute classes, resolved
+    once per session.
+    """
+
+    name = "markdoctest-code-classes"
+
+    def __init__(self, entries: Dict[str, str]):
+        self.entries = dict(entries)
+        # code class -> strategy
+        self.classes: Dict[str, str] = {}
+        # (classes, strategy) of keys in braces, the most specific first
+        self.attributes: List[Tuple[FrozenSet[str], str]] = []
+        for key, strategy in self.entries.items():
+            if key.startswith("{"):
+                self.attributes.append((attribute_classes(key), strategy))
+            else:
+                self.classes[key] = strategy
+        self.attributes.sort(key=lambda attribute: len(attribute[0]), reverse=True)
+        # code classes of the blocks that may be tested, None standing for
+        # attribute info strings, which have no code class
+        tested = {code_class for code_class, strategy in self.classes.items() if strategy != "skip"}
+        if any(strategy != "skip" for _, strategy in self.attributes):
+            tested.add(None)
+        self.tested: FrozenSet[Optional[str]] = frozenset(tested)
+
+    @classmethod
+    def parse(cls, lines: List[str]) -> "CodeClasses":
+        entries = dict(DEFAULT_CODE_CLASSES)
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            m = _ENTRY_RE.match(line)
+            if m is None:
+                raise ValueError("expected 'code class = strategy', got %r" % line)
+            key, strategy = m.group("key"), m.group("strategy")
+            if strategy not in BUILTIN_STRATEGIES and strategy not in _STRATEGIES:
+                raise ValueError("unknown strategy %r for %r" % (strategy, key))
+            if key.startswith("{"):
+                classes = attribute_classes(key)
+                if not classes:
+                    raise ValueError("no class in %r" % key)
+                key = "{%s}" % " ".join("." + c for c in sorted(classes))
+            entries[key] = strategy
+        return cls(entries)
+
+    @classmethod
+    def from_config(cls, config: Config) -> "CodeClasses":
+        """
+        The code classes of the session, resolved on first use, so that
+        strategies registered by other plugins while configuring are known.
+        """
+        code_classes: Optional[CodeClasses] = config.pluginmanager.get_plugin(cls.name)
+        if code_classes is None:
+            try:
+                code_classes = cls.parse(config.getini("markdoctest_code_classes"))
+            except ValueError as e:
+                raise pytest.UsageError("markdoctest_code_classes: %s" % e)
+            config.pluginmanager.register(code_classes, cls.name)
+        return code_classes
+
+    def strategy(self, code_class: Optional[str], info: str) -> Optional[str]:
+        """
+        The strategy of a block, or None if it is not tested.
+        """
+        if code_class is not None:
+            strategy = self.classes.get(code_class)
+        else:
+            strategy = None
+            if self.attributes:
+                classes = attribute_classes(info)
+                for required, s in self.attributes:
+                    if required <= classes:
+                        strategy = s
+                        break
+        return None if strategy == "skip" else strategy
+
+    def block_class(self, code_class: Optional[str], info: str) -> str:
+        """
+        The class naming a block, e.g. "python" in "<python block at line 3>".
+        """
+        if code_class is not None:
+            return code_class
+        tokens = _attribute_tokens(info)
+        return tokens[0] if tokens else "code"
+
+    def signature(self) -> str:
+        """
+        A string identifying the entries, for the keys of cached parses.
+        """
+        return json.dumps(self.entries, sort_keys=True)
+
+
+DEFAULT = CodeClasses(DEFAULT_CODE_CLASSES)
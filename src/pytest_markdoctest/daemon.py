@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+A daemon running markdown files in processes forked from an interpreter
+that already imported their modules, for --markdoctest-daemon.
+
+Start it with the modules to preload, then point pytest at its socket::
+
+    $ python -m pytest_markdoctest.daemon /tmp/markdoctest.sock numpy pandas ourlib &
+    $ pytest --markdoctest-daemon=/tmp/markdoctest.sock docs/
+
+pytest still collects the markdown files. When the first block of a file
+runs, pytest sends the file and its doctest options to the daemon, which
+forks a child that runs all blocks of the file in order with a
+``MarkDoctestRunner``, and sends back the failures of every block. The
+blocks of the file then report these failures. Imports of preloaded
+modules in the blocks only look them up in ``sys.modules``.
+
+The child runs in the working directory, ``sys.path`` and environment of
+pytest, but without pytest fixtures, i.e. ``getfixture`` and
+``doctest_namespace``. Strategies registered by plugins for
+markdoctest_code_classes must be registered in the daemon as well, e.g.
+by a preloaded module.
+
+The socket is only accessible to the user running the daemon, as
+messages are pickled. Requires ``os.fork`` and Unix sockets.
+"""
+
+import argparse
+import doctest
+import importlib
+import os
+import pickle
+import signal
+import socket
+import stat
+import struct
+import sys
+import traceback
+from pathlib import Path
+
+import pytest
+from _pytest.doctest import _get_checker, _init_runner_class
+from pytest import Config
+
+from pytest_markdoctest.code_classes import CodeClasses
+from pytest_markdoctest.limits import ini_limits
+
+from typing import Dict, List, Optional
+
+_HEADER = struct.Struct("!Q")
+
+
+class DaemonError(Exception):
+    """
+    The daemon is not reachable, or failed to run a markdown file.
+    """
+
+
+class RemoteTraceback(Exception):
+    """
+    The traceback of an exception raised in the daemon, as its cause.
+    """
+
+    def __init__(self, text: str):
+        super().__init__(text)
+        self.text = text
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def _send(sock: socket.socket, obj) -> None:
+    data = pickle.dumps(obj)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv(sock: socket.socket):
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return pickle.loads(_recv_exactly(sock, size))
+
+
+def _dump_exception(exc_info) -> tuple:
+    """
+    The exception of exc_info pickled, or None if it can't be, and its
+    formatted traceback.
+    """
+    text = "".join(traceback.format_exception(*exc_info))
+    try:
+        data: Optional[bytes] = pickle.dumps(exc_info[1])
+        pickle.loads(data)
+    except Exception:
+        data = None
+    return data, text
+
+
+def _load_exception(data: Optional[bytes], text: str) -> BaseException:
+    exception: Optional[BaseException] = None
+    if data is not None:
+        try:
+            exception = pickle.loads(data)
+        except Exception:
+            pass
+    if exception is None:
+        exception = DaemonError(text.rstrip().splitlines()[-1])
+    exception.__cause__ = RemoteTraceback(text)
+    return exception
+
+
+# outcomes of pytest that examples may raise
+_OUTCOME_FUNCTIONS = {"skip": pytest.skip, "xfail": pytest.xfail, "fail": pytest.fail}
+_OUTCOMES = tuple(function.Exception for function in _OUTCOME_FUNCTIONS.values())
+
+
+def run_file(request: dict) -> Dict[str, List[tuple]]:
+    """
+    Run all blocks of a markdown file in order, and return the failures
+    of every block by block name, as ("failure", example, got) or
+    ("exception", example, exception, traceback) tuples, or an
+    ("outcome", None, function, message) tuple for pytest.skip(),
+    pytest.xfail() or pytest.fail() called by an example.
+    """
+    from pytest_markdoctest.markdown import MarkDoctestRunner, parse_markdown_file
+
+    code_classes = CodeClasses(request["code_classes"])
+    tests = [
+        test for test in parse_markdown_file(Path(request["path"]), request["encoding"], False, code_classes) if test.examples
+    ]
+    runner = MarkDoctestRunner(
+        verbose=False,
+        optionflags=request["optionflags"],
+        checker=_get_checker(),
+        continue_on_failure=request["continue_on_failure"],
+        globs={"__name__": "__main__"},
+        whole_block=request["whole_block"],
+        output_limit=request["output_limit"],
+        timeout=request["timeout"],
+        maxrss=request["maxrss"],
+    )
+    results: Dict[str, List[tuple]] = {}
+    try:
+        for test in tests:
+            failures: list = []
+            try:
+                runner.run(test, out=failures)
+            except (doctest.DocTestFailure, doctest.UnexpectedException) as failure:
+                failures.append(failure)
+            except _OUTCOMES as outcome:
+                name = next(name for name, function in _OUTCOME_FUNCTIONS.items() if isinstance(outcome, function.Exception))
+                results[test.name] = [("outcome", None, name, outcome.msg)]
+                continue
+            results[test.name] = [
+                (
+                    ("failure", failure.example, failure.got)
+                    if isinstance(failure, doctest.DocTestFailure)
+                    else ("exception", failure.example) + _dump_exception(failure.exc_info)
+                )
+                for failure in failures
+            ]
+    finally:
+        runner.close()
+    return results
+
+
+def _handle(conn: socket.socket) -> None:
+    request = _recv(conn)
+    os.chdir(request["cwd"])
+    sys.path[:] = request["sys_path"]
+    os.environ.clear()
+    os.environ.update(request["env"])
+    try:
+        response = {"results": run_file(request)}
+    except Exception:
+        response = {"error": traceback.format_exc()}
+    sys.stdout.flush()
+    sys.stderr.flush()
+    _send(conn, response)
+
+
+def _terminate(signum, frame) -> None:
+    # remove the socket on SIGTERM too
+    raise SystemExit(0)
+
+
+def serve(path: str, preload: List[str]) -> None:
+    """
+    Import the preload modules, and serve requests on a Unix socket at
+    path until interrupted, forking a child per request.
+    """
+    for name in preload:
+        importlib.import_module(name)
+    importlib.import_module("pytest_markdoctest.markdown")
+
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)  # left by a daemon that was killed
+    except FileNotFoundError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    server.listen()
+    print("markdoctest daemon listening on %s" % path, flush=True)
+    # children are not waited for
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        while True:
+            conn, _ = server.accept()
+            if os.fork() == 0:
+                status = 1
+                try:
+                    server.close()
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    _handle(conn)
+                    status = 0
+                except BaseException:
+                    traceback.print_exc()
+                finally:
+                    os._exit(status)
+            conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(path)
+
+
+class DaemonClient:
+    """
+    Send the markdown files to run to the daemon listening at a socket.
+    """
+
+    name = "markdoctest-daemon"
+
+    def __init__(self, config: Config, path: str):
+        if not hasattr(socket, "AF_UNIX"):
+            raise pytest.UsageError("--markdoctest-daemon requires Unix sockets")
+        self.config = config
+        self.path = os.path.join(str(config.invocation_params.dir), path)
+
+    def runner(self, path: Path, optionflags: int, continue_on_failure: bool) -> "DaemonRunner":
+        timeout, maxrss = ini_limits(self.config)
+        request = dict(
+            path=str(path),
+            encoding=self.config.getini("doctest_encoding"),
+            code_classes=CodeClasses.from_config(self.config).entries,
+            optionflags=optionflags,
+            continue_on_failure=continue_on_failure,
+            whole_block=self.config.getini("markdoctest_whole_block"),
+            output_limit=int(self.config.getini("markdoctest_output_limit")),
+            timeout=timeout,
+            maxrss=maxrss,
+        )
+        return DaemonRunner(
+            self, request, checker=_get_checker(), optionflags=optionflags, continue_on_failure=continue_on_failure
+        )
+
+    def run_file(self, request: dict) -> Dict[str, List[tuple]]:
+        request = dict(request, cwd=os.getcwd(), sys_path=list(sys.path), env=dict(os.environ))
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                raise DaemonError("can't connect to the markdoctest daemon at %s: %s" % (self.path, e))
+            _send(sock, request)
+            try:
+                response = _recv(sock)
+            except ConnectionError:
+                raise DaemonError("the markdoctest daemon closed the connection, see its output")
+        if "error" in response:
+            raise DaemonError(response["error"])
+        return response["results"]
+
+
+class DaemonRunner(_init_runner_class()):
+    """
+    Report the failures of the blocks of a markdown file run by the
+    daemon, which runs the whole file on the first block.
+    """
+
+    def __init__(self, client: DaemonClient, request: dict, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.request = request
+        self._results: Optional[Dict[str, List[tuple]]] = None
+
+    def run(self, test, compileflags=None, out=None, clear_globs=False):
+        if self._results is None:
+            self._results = self.client.run_file(self.request)
+        failures = self._results.get(test.name, [])
+        for kind, example, *data in failures:
+            if kind == "failure":
+                self.report_failure(out, test, example, data[0])
+                continue
+            if kind == "outcome":
+                _OUTCOME_FUNCTIONS[data[0]](data[1])
+            exception = _load_exception(*data)
+            self.report_unexpected_exception(out, test, example, (type(exception), exception, None))
+        return doctest.TestResults(len(failures), len(test.examples))
+
+    def close(self) -> None:
+        pass
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m pytest_markdoctest.daemon",
+        description="Run markdown files for pytest --markdoctest-daemon=SOCKET, "
+        "in processes forked from an interpreter that imported the preload modules.",
+    )
+    parser.add_argument("socket", help="path of the Unix socket to listen on")
+    parser.add_argument("preload", nargs="*", help="modules to import before forking")
+    args = parser.parse_args(argv)
+    if not hasattr(os, "fork") or not hasattr(socket, "AF_UNIX"):
+        parser.error("requires os.fork and Unix sockets")
+    serve(args.socket, args.preload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Static analysis of the global names each block of a markdown file
+defines and uses, to find which blocks depend on which.
+
+The analysis is conservative: a block depends on every earlier block
+that may write a global name it mentions. Using a name may mutate its
+value, e.g. ``items.append(1)``, so a block mentioning a name bound by
+assignment is also considered a writer of it. Names bound only by
+import, def and class statements are not. A block binding a name in any
+way depends on every earlier block mentioning it. If that block doesn't
+bind the name, it may read it later, e.g. in a function using a module
+imported after it, so blocks depending on it depend on the binding block
+too. Blocks calling ``globals()``, ``exec`` and the like, or that can't
+be parsed, depend on all earlier blocks and all later blocks depend on
+them.
+
+Side effects outside the globals, e.g. on files, are not tracked.
+"""
+
+import ast
+import doctest
+
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+# names whose use may read or write any global
+_DYNAMIC_NAMES = frozenset(("globals", "locals", "vars", "dir", "exec", "eval", "__builtins__"))
+
+
+class _BlockNames(ast.NodeVisitor):
+    """
+    Collect the names mentioned and bound anywhere in the statements of
+    a block, and whether it uses names dynamically.
+    """
+
+    def __init__(self):
+        self.mentions: Set[str] = set()
+        self.defs: Set[str] = set()
+        # names bound by assignments, for, with, del, etc.
+        self.assigned: Set[str] = set()
+        self.dynamic = False
+
+    def _bind(self, name: str, static: bool = False) -> None:
+        self.mentions.add(name)
+        self.defs.add(name)
+        if not static:
+            self.assigned.add(name)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Load):
+            self.mentions.add(node.id)
+            if node.id in _DYNAMIC_NAMES:
+                self.dynamic = True
+        else:
+            self._bind(node.id)
+
+    def visit_Attribute(self, node) -> None:
+        if not isinstance(node.ctx, ast.Load):
+            # e.g. obj.attr = value or obj[key] = value mutates obj
+            base = node.value
+            while isinstance(base, (ast.Attribute, ast.Subscript)):
+                base = base.value
+            if isinstance(base, ast.Name):
+                self._bind(base.id)
+        self.generic_visit(node)
+
+    visit_Subscript = visit_Attribute
+
+    def visit_FunctionDef(self, node) -> None:
+        self._bind(node.name, static=True)
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_ClassDef = visit_FunctionDef
+
+    def visit_Import(self, node) -> None:
+        for alias in node.names:
+            if alias.name == "*":
+                self.dynamic = True
+            else:
+                self._bind(alias.asname or alias.name.split(".")[0], static=True)
+
+    visit_ImportFrom = visit_Import
+
+    def visit_Global(self, node) -> None:
+        for name in node.names:
+            self._bind(name)
+
+    visit_Nonlocal = visit_Global
+
+    def visit_ExceptHandler(self, node) -> None:
+        if node.name:
+            self._bind(node.name)
+        self.generic_visit(node)
+
+    def generic_visit(self, node) -> None:
+        # captures of match statements
+        for field in ("name", "rest"):
+            name = getattr(node, field, None)
+            if isinstance(name, str) and type(node).__name__.startswith("Match"):
+                self._bind(name)
+        super().generic_visit(node)
+
+
+def block_names(test: doctest.DocTest) -> Optional[_BlockNames]:
+    """
+    The names of a block, or None if it can't be analyzed.
+    """
+    names = _BlockNames()
+    for eg in test.examples:
+        try:
+            tree = ast.parse(eg.source)
+        except SyntaxError:
+            return None
+        names.visit(tree)
+    return None if names.dynamic else names
+
+
+class BlockDependencies:
+    """
+    A dependency DAG of the blocks of a markdown file, numbered in file
+    order. ``parents[i]`` are the earlier blocks block i depends on.
+    """
+
+    def __init__(self, parents: Sequence[Set[int]]):
+        self.parents = list(parents)
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    @classmethod
+    def sequential(cls, n: int) -> "BlockDependencies":
+        """
+        Every block depends on the previous one.
+        """
+        return cls([{i - 1} if i else set() for i in range(n)])
+
+    @classmethod
+    def analyze(cls, tests: Sequence[doctest.DocTest]) -> "BlockDependencies":
+        blocks = [block_names(test) for test in tests]
+        assigned: Set[str] = set()
+        defined: Set[str] = set()
+        for names in blocks:
+            if names is not None:
+                assigned |= names.assigned
+                defined |= names.defs
+
+        parents: List[Set[int]] = []
+        writers: Dict[str, List[int]] = {}
+        # blocks mentioning a name, and whether they bind it
+        mentioners: Dict[str, List[Tuple[int, bool]]] = {}
+        # blocks binding a name that an earlier block mentions without
+        # binding it, e.g. in a function body
+        late_binders: Dict[int, Set[int]] = {}
+        barrier = -1  # last block that can't be analyzed
+        for j, names in enumerate(blocks):
+            if names is None:
+                parents.append(set(range(j)))
+                barrier = j
+                continue
+            deps = {barrier} if barrier >= 0 else set()
+            for name in names.mentions:
+                deps.update(i for i in writers.get(name, ()) if i > barrier)
+            # earlier blocks reading names that this block binds later
+            readers: Set[int] = set()
+            for name in names.defs:
+                for i, binds in mentioners.get(name, ()):
+                    if i > barrier:
+                        deps.add(i)
+                        if not binds:
+                            readers.add(i)
+            parents.append(deps | cls._late_binders(deps, parents, late_binders, barrier))
+            for i in readers:
+                late_binders.setdefault(i, set()).add(j)
+            for name in names.mentions & defined:
+                if name in names.defs or name in assigned:
+                    writers.setdefault(name, []).append(j)
+                mentioners.setdefault(name, []).append((j, name in names.defs))
+        return cls(parents)
+
+    @staticmethod
+    def _late_binders(deps: Set[int], parents: List[Set[int]], late_binders: Dict[int, Set[int]], barrier: int) -> Set[int]:
+        """
+        The blocks binding names that deps or their ancestors mention,
+        after them.
+        """
+        found: Set[int] = set()
+        seen: Set[int] = set()
+        stack = [i for i in deps if i > barrier]
+        while stack:
+            i = stack.pop()
+            if i in seen:
+                continue
+            seen.add(i)
+            for k in late_binders.get(i, ()):
+                found.add(k)
+                stack.append(k)
+            stack.extend(h for h in parents[i] if h > barrier)
+        return found
+
+    def ancestors(self, index: int) -> List[int]:
+        """
+        The blocks a block depends on directly or indirectly, in order.
+        """
+        seen: Set[int] = set()
+        stack = list(self.parents[index])
+        while stack:
+            i = stack.pop()
+            if i not in seen:
+                seen.add(i)
+                stack.extend(self.parents[i] - seen)
+        return sorted(seen)
+
+    def components(self) -> List[List[int]]:
+        """
+        Groups of blocks not depending on each other, i.e. the connected
+        components of the DAG, each in order and ordered by first block.
+        """
+        root = list(range(len(self.parents)))
+
+        def find(i):
+            while root[i] != i:
+                root[i] = root[root[i]]
+                i = root[i]
+            return i
+
+        for j, deps in enumerate(self.parents):
+            for i in deps:
+                root[find(i)] = find(j)
+        groups: Dict[int, List[int]] = {}
+        for i in range(len(self.parents)):
+            groups.setdefault(find(i), []).append(i)
+        return sorted(groups.values())
+
+    def restrict(self, indices: Sequence[int]) -> "BlockDependencies":
+        """
+        The DAG of a component, with its blocks numbered from 0.
+        """
+        position = {index: k for k, index in enumerate(indices)}
+        return BlockDependencies([{position[i] for i in self.parents[index]} for index in indices])
+
+
+def group_scope(nodeid: str, group_index: int, n_groups: int) -> str:
+    """
+    Name of a group of blocks of the markdown file nodeid, used as its
+    xdist_group and scheduling scope.
+    """
+    return nodeid if n_groups == 1 else "%s::group-%d" % (nodeid, group_index)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Fingerprints of the modules the blocks of a markdown file imported, so
+that --markdoctest-changed runs a file again when its text is unchanged
+but code it imported changed.
+
+A file's modules are those that appeared in ``sys.modules`` while its
+blocks ran, and those referenced from its globals, e.g. ``import pkg``
+when ``pkg`` was already imported, followed through the modules they
+reference. Standard library modules are not tracked. Each module is
+recorded with the mtime, size and hash of its source file.
+"""
+
+import hashlib
+import os
+import sys
+import sysconfig
+from types import ModuleType
+
+from pytest import Config, Item
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# (source file, mtime in ns, size, sha256)
+Fingerprint = Tuple[str, int, int, str]
+
+
+def _dirs(*names: str) -> Tuple[str, ...]:
+    paths = sysconfig.get_paths()
+    return tuple({os.path.normcase(os.path.realpath(paths[name])) + os.sep for name in names})
+
+
+_STDLIB_DIRS = _dirs("stdlib", "platstdlib")
+# site-packages may be under the standard library directory
+_SITE_DIRS = _dirs("purelib", "platlib")
+
+
+def _source_file(module: ModuleType) -> Optional[str]:
+    """
+    The file of a module that is not part of the standard library.
+    """
+    filename = getattr(module, "__file__", None)
+    if not isinstance(filename, str):
+        return None  # builtin, frozen or namespace package
+    filename = os.path.realpath(filename)
+    normcase = os.path.normcase(filename)
+    if normcase.startswith(_STDLIB_DIRS) and not normcase.startswith(_SITE_DIRS):
+        return None
+    return filename
+
+
+def _file_hash(filename: str) -> str:
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(filename: str) -> Optional[Fingerprint]:
+    try:
+        st = os.stat(filename)
+        return (filename, st.st_mtime_ns, st.st_size, _file_hash(filename))
+    except OSError:
+        return None
+
+
+def is_unchanged(fp: Fingerprint) -> bool:
+    """
+    Whether a file still has the fingerprint, comparing hashes only if
+    its mtime or size changed.
+    """
+    filename, mtime_ns, size, digest = fp
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return False
+    if st.st_mtime_ns == mtime_ns and st.st_size == size:
+        return True
+    try:
+        return st.st_size == size and _file_hash(filename) == digest
+    except OSError:
+        return False
+
+
+def _referenced_names(values: Iterable[object]) -> Set[str]:
+    names = set()
+    for value in values:
+        if isinstance(value, ModuleType):
+            names.add(value.__name__)
+        else:
+            try:
+                name = getattr(value, "__module__", None)
+            except Exception:
+                continue
+            if isinstance(name, str):
+                names.add(name)
+    return names
+
+
+# module -> (its source file, names of the modules it references)
+ModuleRefs = Tuple[Optional[str], List[str]]
+
+
+def _module_refs(name: str, module: ModuleType) -> ModuleRefs:
+    filename = _source_file(module)
+    if filename is None:
+        return None, []
+    refs = sorted(_referenced_names(list(vars(module).values())))
+    if "." in name:
+        refs.append(name.rsplit(".", 1)[0])
+    return filename, refs
+
+
+def tracked_modules(
+    names: Iterable[str], globs_list: Iterable[dict], memo: Optional[Dict[str, Tuple[ModuleType, ModuleRefs]]] = None
+) -> Dict[str, str]:
+    """
+    Map the tracked modules among names, the modules referenced from
+    globals, their packages and the modules they reference, to their
+    source files. `memo` keeps the source file and references of each
+    module across calls, until it is replaced in sys.modules.
+    """
+    queue = list(names)
+    for globs in globs_list:
+        queue.extend(_referenced_names(list(globs.values())))
+    files: Dict[str, str] = {}
+    seen: Set[str] = set()
+    while queue:
+        name = queue.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        module = sys.modules.get(name)
+        if not isinstance(module, ModuleType):
+            continue
+        cached = memo.get(name) if memo is not None else None
+        if cached is not None and cached[0] is module:
+            filename, refs = cached[1]
+        else:
+            filename, refs = _module_refs(name, module)
+            if memo is not None:
+                memo[name] = (module, (filename, refs))
+        if filename is None:
+            continue
+        files[name] = filename
+        queue.extend(refs)
+    return files
+
+
+class ModuleIndex:
+    """
+    Record the modules used by each markdown file in pytest's cache,
+    with one entry per file.
+    """
+
+    name = "markdoctest-modules"
+
+    def __init__(self, config: Config):
+        self.config = config
+        # markdown file -> sys.modules before its first block
+        self._before: Dict[str, Set[str]] = {}
+        # markdown file -> globals of its runners
+        self._globs: Dict[str, List[dict]] = {}
+        self.modules: Dict[str, Dict[str, Fingerprint]] = {}
+        self._unchanged: Dict[Fingerprint, bool] = {}
+        # memos for the session, markdown files often import the same modules
+        self._module_refs: Dict[str, Tuple[ModuleType, ModuleRefs]] = {}
+        self._fingerprints: Dict[str, Optional[Fingerprint]] = {}
+
+    @staticmethod
+    def cache_key(path: str) -> str:
+        return "markdoctest/modules/" + hashlib.sha256(path.encode("utf-8", "surrogateescape")).hexdigest()
+
+    def load(self, path: str) -> Dict[str, Fingerprint]:
+        return {name: tuple(fp) for name, fp in self.config.cache.get(self.cache_key(path), {}).items()}
+
+    def is_unchanged(self, path: str) -> bool:
+        """
+        Whether all modules recorded for a markdown file are unchanged.
+        """
+        return all(self._is_unchanged(fp) for fp in self.load(path).values())
+
+    def _is_unchanged(self, fp: Fingerprint) -> bool:
+        # markdown files often import the same modules
+        unchanged = self._unchanged.get(fp)
+        if unchanged is None:
+            unchanged = self._unchanged[fp] = is_unchanged(fp)
+        return unchanged
+
+    @staticmethod
+    def _markdown_path(item: Item) -> Optional[str]:
+        from pytest_markdoctest.markdown import MarkDoctestRunner
+
+        if not isinstance(getattr(item, "runner", None), MarkDoctestRunner):
+            return None
+        return item.nodeid.split("::", 1)[0]
+
+    def pytest_runtest_setup(self, item: Item) -> None:
+        path = self._markdown_path(item)
+        if path is None:
+            return
+        if path not in self._before:
+            self._before[path] = set(sys.modules)
+            self._globs[path] = []
+        if all(globs is not item.runner.globs for globs in self._globs[path]):
+            self._globs[path].append(item.runner.globs)
+
+    def pytest_runtest_teardown(self, item: Item, nextitem: Optional[Item]) -> None:
+        path = self._markdown_path(item)
+        if path is None or (nextitem is not None and self._markdown_path(nextitem) == path):
+            return
+        before = self._before.pop(path, None)
+        if before is None:
+            return
+        new = [name for name in list(sys.modules) if name not in before]
+        modules = self.modules.setdefault(path, {})
+        for name, filename in tracked_modules(new, self._globs.pop(path), self._module_refs).items():
+            if filename not in self._fingerprints:
+                self._fingerprints[filename] = fingerprint(filename)
+            fp = self._fingerprints[filename]
+            if fp is not None:
+                modules[name] = fp
+
+    def pytest_sessionfinish(self) -> None:
+        for path, modules in self.modules.items():
+            # keep the unchanged modules used by blocks that did not run
+            stored = {name: fp for name, fp in self.load(path).items() if self._is_unchanged(fp)}
+            stored.update(modules)
+            self.config.cache.set(self.cache_key(path), stored)
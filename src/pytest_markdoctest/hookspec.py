@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Hooks fired while markdown blocks and their examples run, for plugins
+and conftest files to trace or time them.
+
+``file`` is the path of the markdown file, ``block`` the name of the
+block, e.g. ``<python block at line 42>``, ``lineno`` the line of the
+block's opening fence or of the example in the markdown file, starting
+from 1, and ``options`` the doctest options set on the block or the
+example, by name, e.g. ``{"ELLIPSIS": True}``.
+"""
+
+import pluggy
+
+from typing import Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import doctest
+
+hookspec = pluggy.HookspecMarker("pytest")
+
+
+@hookspec
+def pytest_markdoctest_block_start(
+    test: "doctest.DocTest",
+    file: str,
+    block: str,
+    lineno: int,
+    options: Dict[str, bool],
+) -> None:
+    """
+    Called before the examples of a block run.
+    """
+
+
+@hookspec
+def pytest_markdoctest_block_finish(
+    test: "doctest.DocTest",
+    file: str,
+    block: str,
+    lineno: int,
+    options: Dict[str, bool],
+    duration: float,
+    failed: bool,
+) -> None:
+    """
+    Called after the examples of a block ran, with the duration of the
+    block in seconds and whether an example failed.
+    """
+
+
+@hookspec
+def pytest_markdoctest_example_start(
+    test: "doctest.DocTest",
+    example: "doctest.Example",
+    file: str,
+    block: str,
+    lineno: int,
+    options: Dict[str, bool],
+) -> None:
+    """
+    Called before an example runs.
+    """
+
+
+@hookspec
+def pytest_markdoctest_example_finish(
+    test: "doctest.DocTest",
+    example: "doctest.Example",
+    file: str,
+    block: str,
+    lineno: int,
+    options: Dict[str, bool],
+    duration: float,
+    exception: Optional[BaseException],
+) -> None:
+    """
+    Called after an example ran, with its duration in seconds and the
+    exception it raised if any. The exception may be expected by the
+    example, the output of the example is checked later.
+    """
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Time and memory limits of markdown blocks.
+
+A block is limited by directives with a value, which doctest's option
+directives don't support, so they are taken out of the directive before
+doctest parses it::
+
+    <!-- doctest: +TIMEOUT=5, +MAXRSS=512M -->
+    ```python
+    >>> data = [0] * 10 ** 9
+    ```
+
+or by the ``markdoctest_timeout`` and ``markdoctest_maxrss`` ini options
+for blocks without a directive, ``0`` meaning no limit.
+
+TIMEOUT is the wall time of a block in seconds. It is enforced by
+SIGALRM in the main thread, else by a watchdog thread raising
+:class:`BlockTimeout` in the thread running the block, which waits for
+a blocking call to return. Examples after the one that timed out fail
+without running.
+
+MAXRSS is the memory a block may allocate, in bytes or with a K, M or G
+suffix. A watchdog thread raises MemoryError when the peak resident size
+of the process grew more than MAXRSS since the start of the block, which
+it can only do between bytecodes, like BlockTimeout.
+"""
+
+import contextlib
+import re
+import signal
+import sys
+import threading
+import time
+
+from typing import Dict, Iterator, Optional, Tuple
+
+# a TIMEOUT or MAXRSS directive, e.g. "+TIMEOUT=5", in an option directive
+_LIMIT_RE = re.compile(r"(?<![^\s,:])\+(?P<name>TIMEOUT|MAXRSS)=(?P<value>[^\s,]*)")
+
+_SIZE_RE = re.compile(r"^(?P<number>\d+(?:\.\d*)?)(?P<unit>[KMG]?)B?$", re.IGNORECASE)
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+# period of the watchdog thread when it checks the memory, and of
+# SIGALRM or the watchdog after a block timed out, in case the
+# exception was caught by the block
+_WATCHDOG_INTERVAL = 0.05
+_REPEAT_INTERVAL = 1.0
+
+
+class BlockTimeout(BaseException):
+    """
+    Raised in an example running when its block exceeded its TIMEOUT. A
+    BaseException, so that ``except Exception`` in examples doesn't
+    swallow it.
+    """
+
+    def __str__(self) -> str:
+        return super().__str__() or "the block exceeded its TIMEOUT"
+
+
+class BlockMemoryError(MemoryError):
+    """
+    Raised by the watchdog in an example whose block exceeded its MAXRSS.
+    """
+
+    def __str__(self) -> str:
+        return super().__str__() or "the block exceeded its MAXRSS"
+
+
+def parse_duration(value: str) -> float:
+    seconds = float(value)
+    if seconds < 0 or seconds != seconds:
+        raise ValueError(value)
+    return seconds
+
+
+def parse_size(value: str) -> int:
+    """
+    A size in bytes, from a number of bytes or e.g. "512M" or "1.5G".
+    """
+    m = _SIZE_RE.match(value.strip())
+    if m is None:
+        raise ValueError(value)
+    return int(float(m.group("number")) * _UNITS[m.group("unit").upper()])
+
+
+_PARSERS = {"TIMEOUT": parse_duration, "MAXRSS": parse_size}
+
+
+def ini_limits(config) -> Tuple[float, int]:
+    """
+    The TIMEOUT and MAXRSS of blocks without directives, from the
+    markdoctest_timeout and markdoctest_maxrss ini options.
+    """
+    import pytest
+
+    limits = []
+    for name, parse in (("markdoctest_timeout", parse_duration), ("markdoctest_maxrss", parse_size)):
+        value = config.getini(name)
+        try:
+            limits.append(parse(value))
+        except ValueError:
+            raise pytest.UsageError("%s: invalid value %r" % (name, value)) from None
+    timeout, maxrss = limits
+    return timeout, int(maxrss)
+
+
+def split_limits(content: str, name: str, lineno: int) -> Tuple[str, Dict[str, float]]:
+    """
+    Take the TIMEOUT and MAXRSS directives out of the content of an option
+    directive, e.g. "doctest: +SKIP, +TIMEOUT=5". Return the rest of the
+    content and the limits, raising ValueError like doctest for invalid
+    values.
+    """
+    limits: Dict[str, float] = {}
+    for m in _LIMIT_RE.finditer(content):
+        try:
+            limits[m.group("name")] = _PARSERS[m.group("name")](m.group("value"))
+        except ValueError:
+            message = "line %r of the doctest for %s has an invalid option: %r" % (lineno + 1, name, m.group(0))
+            raise ValueError(message) from None
+    return _LIMIT_RE.sub("", content), limits
+
+
+def _peak_rss() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, but bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _set_async_exc(thread_id: int, exception: Optional[type]) -> None:
+    import ctypes
+
+    # None is passed as NULL, which clears the pending exception
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(thread_id), ctypes.py_object(exception) if exception is not None else None
+    )
+
+
+class _Cleared(BaseException):
+    pass
+
+
+def _clear_pending() -> None:
+    """
+    Cancel the exception raised in the current thread by the watchdog, if
+    it is still pending.
+    """
+    thread_id = threading.get_ident()
+    if sys.version_info[:2] != (3, 11):
+        _set_async_exc(thread_id, None)
+        return
+    # clearing it leaves the eval breaker of CPython 3.11 armed, and the
+    # interpreter loops handling it at the next function call. Replace it
+    # instead with an exception, raised as the call returns.
+    try:
+        _set_async_exc(thread_id, _Cleared)
+    except _Cleared:
+        pass
+
+
+class BlockLimits:
+    """
+    Enforce the limits of a block while it runs, in a with statement.
+    The runner runs every example in ``example()``.
+    """
+
+    def __init__(self, timeout: float, maxrss: int):
+        self.timeout = timeout
+        self.maxrss = maxrss
+        self.timed_out = False
+        self.out_of_memory = False
+        # whether an example is running, so that exceptions are only raised
+        # in the code of examples, not in the runner. The watchdog checks it
+        # and raises with the lock held.
+        self._running = False
+        self._lock = threading.Lock()
+        # whether the watchdog raised an exception in the running example
+        self._raised = False
+        self._thread_id = threading.get_ident()
+        self._saved_alarm = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def __enter__(self) -> "BlockLimits":
+        watch_timeout = self.timeout > 0 and not self._start_alarm()
+        self._peak = _peak_rss() if self.maxrss > 0 else None
+        if watch_timeout or self._peak is not None:
+            self._watchdog = threading.Thread(
+                target=self._watch, args=(watch_timeout, self._peak is not None), name="markdoctest-watchdog", daemon=True
+            )
+            self._watchdog.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+        if self._saved_alarm is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self._saved_alarm)
+
+    @contextlib.contextmanager
+    def example(self) -> Iterator[None]:
+        """
+        Run an example, failing it without running it if the block timed
+        out already.
+        """
+        if self.timed_out:
+            raise BlockTimeout("the block exceeded its TIMEOUT=%gs" % self.timeout)
+        with self._lock:
+            self._running = True
+        try:
+            yield
+        finally:
+            self._stop_running()
+
+    def _stop_running(self) -> None:
+        try:
+            with self._lock:
+                self._running = False
+                if self._raised:
+                    # the watchdog may have raised as the example finished,
+                    # it can't raise again once the lock is released
+                    self._raised = False
+                    _clear_pending()
+        except (BlockTimeout, BlockMemoryError):
+            pass  # raised here before it was cleared
+
+    def _start_alarm(self) -> bool:
+        if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+            return False
+        previous = signal.getsignal(signal.SIGALRM)
+        if previous not in (signal.SIG_DFL, signal.SIG_IGN, None) or signal.getitimer(signal.ITIMER_REAL)[0]:
+            return False  # used by another plugin, e.g. pytest-timeout
+        self._saved_alarm = previous
+        signal.signal(signal.SIGALRM, self._alarm)
+        signal.setitimer(signal.ITIMER_REAL, self.timeout, _REPEAT_INTERVAL)
+        return True
+
+    def _alarm(self, signum, frame) -> None:
+        self.timed_out = True
+        if self._running:
+            raise BlockTimeout("the block exceeded its TIMEOUT=%gs" % self.timeout)
+
+    def _watch(self, watch_timeout: bool, watch_memory: bool) -> None:
+        start = time.monotonic()
+        while True:
+            if watch_memory:
+                interval = _WATCHDOG_INTERVAL
+            elif self.timed_out:
+                interval = _REPEAT_INTERVAL
+            else:
+                interval = max(start + self.timeout - time.monotonic(), 0)
+            if self._stop.wait(interval):
+                return
+            if watch_timeout and time.monotonic() - start >= self.timeout:
+                self.timed_out = True
+                with self._lock:
+                    if self._running:
+                        _set_async_exc(self._thread_id, BlockTimeout)
+                        self._raised = True
+            if watch_memory and not self.out_of_memory:
+                peak = _peak_rss()
+                if peak is not None and peak - self._peak > self.maxrss:
+                    self.out_of_memory = True
+                    with self._lock:
+                        if self._running:
+                            _set_async_exc(self._thread_id, BlockMemoryError)
+                            self._raised = True
@@ -0,0 +1,908 @@
+# -*- coding: utf-8 -*-
+"""
+Collection, parsing and running of markdown files.
+
+This module is imported on the first markdown file collected, rather
+than with the plugin, so that pytest runs without markdown files do not
+pay for doctest, the parsers and their regexes.
+"""
+
+import re
+from pathlib import Path
+import contextlib
+import json
+import mmap
+import doctest
+import sys
+import ast
+import time
+from inspect import CO_COROUTINE
+from types import CodeType, FunctionType
+import pytest
+
+from _pytest.doctest import (
+    DoctestItem,
+    get_optionflags,
+    _get_checker,
+    _get_continue_on_failure,
+    _init_runner_class,
+)
+
+from typing import Dict
+from typing import Optional
+from typing import Set
+from typing import Iterable
+from typing import List
+from typing import TYPE_CHECKING
+
+from pytest import Config
+
+if TYPE_CHECKING:
+    import asyncio
+
+from pytest_markdoctest.cache import CodeCache, CodeStore, ParseCache, _flag_names
+from pytest_markdoctest.changed import ChangedSelector
+from pytest_markdoctest.checkpoint import CheckpointStore, chain_hashes, mentioned_names
+from pytest_markdoctest.code_classes import DEFAULT, CodeClasses, get_strategy
+from pytest_markdoctest.daemon import DaemonClient
+from pytest_markdoctest.dependency import BlockDependencies, group_scope
+from pytest_markdoctest.limits import BlockLimits, ini_limits, split_limits
+from pytest_markdoctest.output import BoundedOutput, TruncatedOutput
+from pytest_markdoctest.parallel import CollectPool
+from pytest_markdoctest.profiling import Profiler, example_lineno
+from pytest_markdoctest.scanner import (
+    CodeBlock,
+    LineIndex,
+    is_ascii_compatible,
+    scan_code_blocks,
+    scan_code_blocks_bytes,
+)
+
+
+class DoctestMarkdown(pytest.Module):
+    obj = None
+
+    # regular expression for markdown code blocks like
+    # ```python
+    # some python code
+    # ```
+    # Collection uses scanner.scan_code_blocks, which finds the same
+    # blocks in linear time. This regex is kept as its reference.
+    _CODE_BLOCK_RE = re.compile(
+        r"""
+        (?P<option_list>            # html comment with doctest option
+                                    # such as <!--- doctest: ... --->
+            (
+                ^                       # Necessarily at the beginning of a new line
+                [ \t]*                  # Possibly leading spaces
+                <!--([^\n]*?)-->             # html comment
+                [ \t]*                  # trailing spaces
+                \n                      # a newline
+            )*                      # Zero or more html comments
+        )
+        ^                           # Necessarily at the beginning of a new line
+        (?P<code_all>
+            (?P<code_start>
+                [ \t]*              # Possibly leading spaces
+                \`{3,}              # 3 code marks (backticks) or more
+            )
+            [ \t]*                  # Possibly some spaces or tab
+            (?P<code_class>[\w\-\.]+)?    # or a code class like html, ruby, perl
+            (?:[^\n]*)?             # possibly some text before newline
+            \n                      # newline
+            (?P<code_content>.*?)   # enclosed content
+            # \n+
+            (?<!`)
+            (?P=code_start)         # balanced closing block marks
+            (?!`)
+        )
+        $                # and a new line or end of string
+        """,
+        re.DOTALL | re.MULTILINE | re.VERBOSE,
+    )
+
+    def collect(self) -> Iterable[DoctestItem]:
+
+        # Inspired by doctest.testfile; ideally we would use it directly,
+        # but it doesn't support passing a custom checker.
+        encoding = self.config.getini("doctest_encoding")
+        optionflags = get_optionflags(self)
+
+        code_cache: Optional[CodeCache] = self.config.pluginmanager.get_plugin(CodeCache.name)
+        use_xdist = self.config.pluginmanager.hasplugin("xdist")
+
+        tests = [test for test in self._get_doctests(encoding) if test.examples]
+        timeout, maxrss = ini_limits(self.config)
+        daemon: Optional[DaemonClient] = self.config.pluginmanager.get_plugin(DaemonClient.name)
+        if daemon is not None:
+            # the daemon runs all blocks of the file, in order, on the first one
+            runner = daemon.runner(self.path, optionflags, _get_continue_on_failure(self.config))
+            self._runners = [runner]
+            for test in tests:
+                yield DoctestItem.from_parent(self, name=test.name, runner=runner, dtest=test)
+            return
+
+        if self.config.getini("markdoctest_block_dependencies"):
+            dependencies = BlockDependencies.analyze(tests)
+            groups = dependencies.components()
+        else:
+            dependencies = None
+            groups = [list(range(len(tests)))]
+
+        # each group of blocks has its own runner and globals
+        items = {}
+        self._runners: List[MarkDoctestRunner] = []
+        for group_index, group in enumerate(groups):
+            runner = MarkDoctestRunner(
+                verbose=False,
+                optionflags=optionflags,
+                checker=_get_checker(),
+                continue_on_failure=_get_continue_on_failure(self.config),
+                globs={"__name__": "__main__"},  # runner-level globs
+                code_store=code_cache.store_for(self.path) if code_cache is not None else None,
+                whole_block=self.config.getini("markdoctest_whole_block"),
+                checkpoints=self.config.pluginmanager.get_plugin(CheckpointStore.name),
+                resume=self.config.pluginmanager.has_plugin(ChangedSelector.name),
+                profiler=self.config.pluginmanager.get_plugin(Profiler.name),
+                hook=self.ihook if _has_markdoctest_hookimpls(self.ihook) else None,
+                output_limit=int(self.config.getini("markdoctest_output_limit")),
+                timeout=timeout,
+                maxrss=maxrss,
+            )
+            runner.set_blocks([tests[i] for i in group], dependencies.restrict(group) if dependencies is not None else None)
+            self._runners.append(runner)
+
+            # for pytest-xdist --dist loadgroup, keep the items of this group,
+            # which share runner.globs, on the same worker.
+            xdist_group = pytest.mark.xdist_group(group_scope(self.nodeid, group_index, len(groups))) if use_xdist else None
+            for i in group:
+                item = DoctestItem.from_parent(self, name=tests[i].name, runner=runner, dtest=tests[i])
+                if xdist_group is not None:
+                    item.add_marker(xdist_group)
+                items[i] = item
+
+        for i in range(len(tests)):
+            yield items[i]
+
+    def teardown(self) -> None:
+        # close the event loops of blocks using top-level await
+        for runner in getattr(self, "_runners", ()):
+            runner.close()
+
+    def _get_doctests(self, encoding: str) -> List[doctest.DocTest]:
+        """
+        Parse the markdown file, or load its doctests from the parse cache
+        if the file content is unchanged since it was last parsed.
+        """
+        filename = str(self.path)
+        parse_cache: Optional[ParseCache] = self.config.pluginmanager.get_plugin(ParseCache.name)
+        collect_pool: Optional[CollectPool] = self.config.pluginmanager.get_plugin(CollectPool.name)
+        use_mmap = _use_mmap(self.config, encoding)
+        code_classes = CodeClasses.from_config(self.config)
+        if collect_pool is not None:
+            tests = collect_pool.get(self.path)
+            if tests is not None:
+                return tests
+        if parse_cache is None:
+            return parse_markdown_file(self.path, encoding, use_mmap, code_classes)
+
+        with _open_buffer(self.path, use_mmap) as data:
+            key = parse_cache.key(data, encoding, code_classes.signature())
+            tests = parse_cache.get(key, filename)
+            if tests is None:
+                tests = _parse_buffer(data, encoding, filename, use_mmap, code_classes)
+                parse_cache.set(key, tests)
+            return tests
+
+
+def _has_markdoctest_hookimpls(hook) -> bool:
+    return any(
+        getattr(hook, name).get_hookimpls()
+        for name in (
+            "pytest_markdoctest_block_start",
+            "pytest_markdoctest_block_finish",
+            "pytest_markdoctest_example_start",
+            "pytest_markdoctest_example_finish",
+        )
+    )
+
+
+def _use_mmap(config: Config, encoding: str) -> bool:
+    return config.getini("markdoctest_mmap") and is_ascii_compatible(encoding)
+
+
+@contextlib.contextmanager
+def _open_buffer(path: Path, use_mmap: bool):
+    """
+    The content of a file, as bytes or as a read-only mmap.
+    """
+    if not use_mmap:
+        yield path.read_bytes()
+        return
+    with path.open("rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            yield b""
+            return
+        with buf:
+            yield buf
+
+
+def _decode(data: bytes, encoding: str) -> str:
+    """
+    Decode like Path.read_text, i.e. with universal newlines.
+    """
+    return data.decode(encoding).replace("\r\n", "\n").replace("\r", "\n")
+
+
+def parse_markdown_file(
+    path: Path, encoding: str, use_mmap: bool = False, code_classes: CodeClasses = DEFAULT
+) -> List[doctest.DocTest]:
+    """
+    Extract a doctest from every python code block of a markdown file.
+    """
+    if not use_mmap:
+        return parse_markdown(path.read_text(encoding), str(path), code_classes)
+    with _open_buffer(path, use_mmap) as data:
+        return _parse_buffer(data, encoding, str(path), use_mmap, code_classes)
+
+
+def _parse_buffer(data, encoding: str, filename: str, use_mmap: bool, code_classes: CodeClasses) -> List[doctest.DocTest]:
+    if use_mmap:
+        return parse_markdown_bytes(data, encoding, filename, code_classes)
+    return parse_markdown(_decode(data, encoding), filename, code_classes)
+
+
+def parse_markdown(text: str, filename: str, code_classes: CodeClasses = DEFAULT) -> List[doctest.DocTest]:
+    """
+    Extract a doctest from every python code block of a markdown text.
+    """
+    return _parse_code_blocks(scan_code_blocks(text), filename, code_classes)
+
+
+def parse_markdown_bytes(buf, encoding: str, filename: str, code_classes: CodeClasses = DEFAULT) -> List[doctest.DocTest]:
+    """
+    Same as parse_markdown, but for an encoded text, e.g. a mmap of the
+    file. Only python code blocks are decoded, so memory usage depends on
+    the size of python code rather than of the whole file.
+    """
+    if buf.find(b"\r") >= 0:
+        # universal newlines, fall back to decoding everything
+        return parse_markdown(_decode(bytes(buf), encoding), filename, code_classes)
+    blocks = scan_code_blocks_bytes(buf, encoding, code_classes.tested)
+    return _parse_code_blocks(blocks, filename, code_classes)
+
+
+def _parse_code_blocks(code_blocks: Iterable[CodeBlock], filename: str, code_classes: CodeClasses) -> List[doctest.DocTest]:
+    tests = []
+    parser = PythonCodeBlockParser()
+    for m in code_blocks:
+        code_class = m.group("code_class")
+        strategy = code_classes.strategy(code_class, m.info)
+        if strategy is not None:
+            name = "<%s block at line %s>" % (code_classes.block_class(code_class, m.info), m.fence_lineno)
+            tests.append(parser.get_doctest(m, name, filename, m.lineno, strategy))
+    return tests
+
+
+class ReplBlockParser(doctest.DocTestParser):
+    """
+    A parser for REPL code blocks (lines starting with '>>>').
+    """
+
+    def parse(self, string, name="<string>", lines: Optional[LineIndex] = None):
+        """
+        Same as doctest.DocTestParser.parse, except that line numbers of
+        examples are looked up in `lines`, the LineIndex of the block,
+        rather than counted again.
+        """
+        if "\t" in string:
+            string = string.expandtabs()
+            lines = None  # offsets moved
+        # If all lines begin with the same indentation, then strip it.
+        min_indent = self._min_indent(string)
+        if min_indent > 0:
+            string = "\n".join([line[min_indent:] for line in string.split("\n")])
+            lines = None
+        if lines is None:
+            lines = LineIndex.from_text(string)
+
+        output = []
+        charno = 0
+        # Find all doctest examples in the string:
+        for m in self._EXAMPLE_RE.finditer(string):
+            # Add the pre-example text to `output`.
+            output.append(string[charno : m.start()])
+            lineno = lines.lineno(m.start())
+            # Extract info from the regexp match.
+            source, options, want, exc_msg = self._parse_example(m, name, lineno)
+            # Create an Example, and add it to the list.
+            if not self._IS_BLANK_OR_COMMENT(source):
+                output.append(
+                    doctest.Example(
+                        source,
+                        want,
+                        exc_msg,
+                        lineno=lineno,
+                        indent=min_indent + len(m.group("indent")),
+                        options=options,
+                    )
+                )
+            # Update charno.
+            charno = m.end()
+        # Add any remaining post-example text to `output`.
+        output.append(string[charno:])
+        return output
+
+
+class ScriptBlockParser(doctest.DocTestParser):
+    """
+    A parser for script code blocks (lines not starting with '>>>').
+    """
+
+    def parse(self, string, name="<string>", lines: Optional[LineIndex] = None):
+        """
+        parse string into examples.
+        """
+        ast_tree = ast.parse(string)
+        # directives are ignored in script block.
+        options = {}
+        if sys.version_info[:3] > (3, 9):
+            statements = [ast.unparse(element) for element in ast_tree.body]
+        elif sys.version_info[:3] > (3, 8):
+            statements = self._split_into_statements(string, ast_tree, lines)
+        else:
+            statements = [self._unparse(element) for element in ast_tree.body]
+
+        examples = []
+        for element, stmt in zip(ast_tree.body, statements):
+            # Given ELLIPSIS option and  want="...", any output is valid
+            # output, because we do not restrict the output of script
+            # block.
+            options[doctest.ELLIPSIS] = True
+
+            # create an example for the statement
+            eg = doctest.Example(
+                stmt,
+                want="...",
+                lineno=element.lineno - 1,
+                indent=0,
+                options=options,
+            )
+            # doctest.Example.__init__ always adds a tail '\n' to want,
+            # which is not expected here, so we force it to be "..."
+            # without '\n', so it can match anything.
+            eg.want = "..."
+            examples.append(eg)
+        return examples
+
+    def _unparse(self, ast_node):
+        from pytest_markdoctest.unparse import Unparser
+        from io import StringIO
+
+        stmt = StringIO()
+        Unparser(ast_node, stmt)
+        return stmt.getvalue()
+
+    def _split_into_statements(self, source, ast_tree, lines: Optional[LineIndex] = None):
+        def get_source_stmt(element: ast.stmt):
+            start = lines.line_start(element.lineno - 1) + element.col_offset
+            end = lines.line_start(element.end_lineno - 1) + element.end_col_offset
+            return source[start:end]
+
+        if lines is None:
+            lines = LineIndex.from_text(source)
+        statements = [get_source_stmt(element) for element in ast_tree.body]
+        return statements
+
+
+class PythonCodeBlockParser:
+
+    _OPTION_RE = re.compile(
+        r"""
+        (?P<option>                 # html comment with doctest option
+                                    # such as <!--- doctest: ... --->
+            <!--+\s*                # opening comment
+            (?P<option_content>
+                doctest:\s*([^\n\'"]*?) # doctest option
+            )
+            \s*--+>                # closing comment
+        )
+        """,
+        re.DOTALL | re.MULTILINE | re.VERBOSE,
+    )
+
+    doctest_parser = ReplBlockParser()
+    script_parser = ScriptBlockParser()
+
+    def get_doctest(self, code_block: CodeBlock, name, filename, lineno, strategy: str = "auto"):
+        """
+        Parse a block with the parser of its strategy, see code_classes.
+        With "auto", if `string` starts with '>>>', treat it as an REPL
+        block, otherwise treat it as an script block.
+        """
+
+        code_content = code_block.group("code_content")
+        option_list = code_block.group("option_list")
+
+        # parse code_content into examples
+        code_content_lineno = code_block.fence_lineno
+        if strategy == "auto":
+            strategy = "repl" if code_content.startswith(">>>") else "script"
+        if strategy == "repl":
+            parser = self.doctest_parser
+        elif strategy == "script":
+            parser = self.script_parser
+        else:
+            parser = get_strategy(strategy)
+        examples = parser.parse(code_content, name, code_block.lines)
+        examples = [x for x in examples if isinstance(x, doctest.Example)]
+        # dummy globs in test. real globs is runner.globs.
+        globs = {}
+        test = doctest.DocTest(examples, globs, name, filename, code_content_lineno, code_content)
+        test.script_block = parser is self.script_parser
+
+        # parse test-level options
+        test.options = {}
+        test.limits = {}
+        for opt in self._OPTION_RE.finditer(option_list):
+            opt_lineno = lineno - 1 + code_block.option_lines.lineno(opt.start())
+            # TIMEOUT and MAXRSS have a value, which doctest doesn't support
+            content, limits = split_limits(opt.group("option_content"), name, opt_lineno)
+            test.limits.update(limits)
+            # compose a valid doctest directive, and parse it by
+            # doctest.DocTestParser._find_options
+            directive = "a # " + content
+            opt = self.doctest_parser._find_options(directive, name, opt_lineno)
+            test.options.update(opt)
+
+        # update example-level options
+        for eg in test.examples:
+            eg.options = {**test.options, **eg.options}
+
+        return test
+
+
+# Run a script block as a single example, rather than statement by
+# statement. Enabled by <!-- doctest: +WHOLE_BLOCK --> or the
+# markdoctest_whole_block ini option.
+WHOLE_BLOCK = doctest.register_optionflag("WHOLE_BLOCK")
+
+
+class MarkDoctestRunner(_init_runner_class()):
+    def __init__(
+        self,
+        *args,
+        globs={},
+        code_store: Optional[CodeStore] = None,
+        whole_block: bool = False,
+        checkpoints: Optional[CheckpointStore] = None,
+        resume: bool = False,
+        profiler: Optional[Profiler] = None,
+        hook=None,
+        output_limit: int = 0,
+        timeout: float = 0.0,
+        maxrss: int = 0,
+        **kwargs,
+    ):
+        """
+        Inheritance chain:
+
+        MarkDoctestRunner -> PytestDoctestRunner
+                          -> DebugRunner -> DocTestRunner
+
+        Nearly same as PytestDoctestRunner, except that it has an
+        runner-level dict storing globals variables.
+        """
+        super().__init__(*args, **kwargs)
+        self._checker = AnyOutputChecker(self._checker)
+        self.globs = globs  # runner-level globs
+        # cache of compiled examples, if enabled
+        self.code_store = code_store
+        # default for script blocks without a WHOLE_BLOCK directive
+        self.whole_block = whole_block
+        # checkpoints of globs after each block, if enabled
+        self.checkpoints = checkpoints
+        # whether a block run without the blocks it depends on replays them
+        self.resume = resume or checkpoints is not None
+        # records the time of each example, if enabled
+        self.profiler = profiler
+        # pytest hooks relay, to fire the pytest_markdoctest_* hooks, or
+        # None if they have no implementations
+        self.hook = hook
+        # max characters of the output of an example kept, 0 for no limit
+        self.output_limit = output_limit
+        if output_limit:
+            self._fakeout = BoundedOutput(output_limit, ignored_flags=WHOLE_BLOCK)
+        # TIMEOUT and MAXRSS of blocks without directives, 0 for no limit
+        self.timeout = timeout
+        self.maxrss = maxrss
+        self._limits: Optional[BlockLimits] = None
+        self.blocks: List[doctest.DocTest] = []
+        self._block_index: Dict[int, int] = {}
+        self._chain_hashes: List[str] = []
+        self._mentioned_names: List[Set[str]] = []
+        self.dependencies = BlockDependencies([])
+        # blocks whose effects are in globs
+        self._done: Set[int] = set()
+        # event loop of examples using top-level await, shared by all blocks
+        # of the runner like globs, created on first use
+        self._loop: Optional["asyncio.AbstractEventLoop"] = None
+        # current event loop before the block made self._loop current
+        self._saved_loop = _MISSING
+        self._test: Optional[doctest.DocTest] = None
+        self._example: Optional[doctest.Example] = None
+
+    def set_blocks(self, blocks: List[doctest.DocTest], dependencies: Optional[BlockDependencies] = None) -> None:
+        """
+        Set the blocks sharing globs, in order, so that a block run without
+        the blocks it depends on can replay them or resume from a checkpoint.
+        By default, each block depends on all blocks before it.
+        """
+        self.blocks = blocks
+        self.dependencies = dependencies or BlockDependencies.sequential(len(blocks))
+        self._block_index = {id(test): i for i, test in enumerate(blocks)}
+        if self.checkpoints is not None:
+            self._chain_hashes = chain_hashes(blocks)
+            self._mentioned_names = [mentioned_names(test) for test in blocks]
+
+    def signature(self) -> str:
+        """
+        A string identifying the settings examples run with, which may
+        change their outcome, for the keys of --markdoctest-changed.
+        """
+        flags = sorted(name for name, flag in doctest.OPTIONFLAGS_BY_NAME.items() if self.optionflags & flag)
+        return json.dumps([flags, self.whole_block, self.output_limit, self.timeout, self.maxrss])
+
+    def run(self, test, compileflags=None, out=None, clear_globs=False):
+        """
+        clear_globs is default to False, because we want to keep global
+        variables across tests.
+        """
+        index = self._block_index.get(id(test)) if self.resume else None
+        if index is None:
+            return self._run(test, compileflags, out, clear_globs)
+        self._resume(index, compileflags)
+        return self._run_block(index, compileflags, out, clear_globs)
+
+    def _run_block(self, index, compileflags, out, clear_globs):
+        """
+        Run a block, and save a checkpoint of globs if it passes after all
+        blocks before it.
+        """
+        self._done.add(index)
+        result = self._run(self.blocks[index], compileflags, out, clear_globs)
+        if self.checkpoints is None:
+            return result
+        chain_hash = self._chain_hashes[index]
+        in_order = len(self._done) == index + 1 and max(self._done) == index
+        if not result.failed and in_order and chain_hash not in self.checkpoints:
+            self.checkpoints.save(chain_hash, self.globs)
+        return result
+
+    def _resume(self, index: int, compileflags) -> None:
+        """
+        Run the blocks that block index depends on and that did not run
+        yet, restoring the nearest checkpoint that saves some of them.
+        """
+        todo = [i for i in self.dependencies.ancestors(index) if i not in self._done]
+        if not todo or self.checkpoints is None:
+            self._replay(todo, compileflags)
+            return
+        # a checkpoint holds the effects of all blocks up to it, which must
+        # include the blocks already run.
+        lowest = max(max(self._done, default=-1), todo[0])
+        # names that the blocks after a checkpoint may use
+        needed: Set[str] = set()
+        for names in self._mentioned_names[index:]:
+            needed |= names
+        for i in range(index - 1, lowest - 1, -1):
+            globs = self.checkpoints.load(self._chain_hashes[i], needed)
+            needed |= self._mentioned_names[i]
+            if globs is not None:
+                self.globs.clear()
+                self.globs.update(globs)
+                self._done = set(range(i + 1))
+                todo = [j for j in todo if j > i]
+                break
+        self._replay(todo, compileflags)
+
+    def _replay(self, indices: List[int], compileflags) -> None:
+        for i in indices:
+            try:
+                self._run_block(i, compileflags, [], False)
+            except Exception:
+                pass  # failures are reported by the item of that block
+
+    def _run(self, test, compileflags, out, clear_globs):
+        # tests share the runner's globs.
+        test.globs = self.globs
+        if self._is_whole_block(test):
+            test = _whole_block_test(test)
+
+        saved_test, self._test = self._test, test
+        if self._loop is not None:
+            # examples without await, e.g. asyncio.ensure_future(...), find
+            # the loop of the runner as the current event loop
+            self._use_event_loop()
+        limits = getattr(test, "limits", {})
+        timeout = limits.get("TIMEOUT", self.timeout)
+        maxrss = limits.get("MAXRSS", self.maxrss)
+        saved_limits = self._limits
+        try:
+            if not timeout and not maxrss:
+                self._limits = None
+                return self._run_test(test, compileflags, out, clear_globs)
+            with BlockLimits(timeout, maxrss) as self._limits:
+                return self._run_test(test, compileflags, out, clear_globs)
+        finally:
+            self._test = saved_test
+            self._limits = saved_limits
+            self._restore_event_loop()
+
+    def _run_test(self, test, compileflags, out, clear_globs):
+        if self.hook is None:
+            return super().run(test, compileflags, out, clear_globs)
+        return self._run_traced(test, compileflags, out, clear_globs)
+
+    def _run_traced(self, test, compileflags, out, clear_globs):
+        info = dict(
+            test=test,
+            file=test.filename,
+            block=test.name,
+            lineno=test.lineno,
+            options=_flag_names(getattr(test, "options", {})),
+        )
+        self.hook.pytest_markdoctest_block_start(**info)
+        failed = True
+        start = time.perf_counter()
+        try:
+            result = super().run(test, compileflags, out, clear_globs)
+            failed = bool(result.failed)
+            return result
+        finally:
+            self.hook.pytest_markdoctest_block_finish(duration=time.perf_counter() - start, failed=failed, **info)
+
+    def _DocTestRunner__run(self, test, compileflags, out):
+        # DocTestRunner.run calls its private __run, which runs each example
+        # with
+        #     exec(compile(example.source, filename, "single", ...), globs)
+        # looking up compile and exec in the globals of the doctest module.
+        # Run a copy of it with its own globals instead, in which they are
+        # the hooks of this runner, so that examples go through
+        # compile_example and exec_example while the doctest module, seen by
+        # other runners and threads, is left untouched.
+        run = doctest.DocTestRunner._DocTestRunner__run
+        globs = dict(run.__globals__, compile=self._compile_hook, exec=self._exec_hook)
+        run = FunctionType(run.__code__, globs, run.__name__, run.__defaults__, run.__closure__)
+        return run(self, test, compileflags, out)
+
+    def _compile_hook(self, source, filename, mode, flags=0, dont_inherit=False):
+        # filename is '<doctest %s[%d]>' % (test.name, examplenum)
+        examplenum = int(filename[len("<doctest %s[" % self._test.name) : -2])
+        self._example = self._test.examples[examplenum]
+        if self.output_limit:
+            # self.optionflags has the options of the example while it runs
+            self._fakeout.expect(self._example.want, self.optionflags)
+        return self.compile_example(self._example, filename, flags)
+
+    def _exec_hook(self, code, globs):
+        self.exec_example(self._example, code, globs)
+
+    def compile_example(self, example: doctest.Example, filename: str, compileflags: int) -> CodeType:
+        """
+        Compile an example, reusing the code cache if enabled.
+        """
+        mode = "exec" if getattr(example, "whole_block", False) else "single"
+        compileflags |= _ALLOW_TOP_LEVEL_AWAIT
+        if self.code_store is not None:
+            return self.code_store.compile(example.source, filename, mode, compileflags)
+        return compile(example.source, filename, mode, compileflags, True)
+
+    def exec_example(self, example: doctest.Example, code: CodeType, globs: dict) -> None:
+        """
+        Run the compiled example in globs.
+        """
+        if self.hook is None:
+            return self._exec(example, code, globs)
+        test = self._test
+        info = dict(
+            test=test,
+            example=example,
+            file=test.filename,
+            block=test.name,
+            lineno=example_lineno(test, example),
+            options=_flag_names(example.options),
+        )
+        self.hook.pytest_markdoctest_example_start(**info)
+        exception = None
+        start = time.perf_counter()
+        try:
+            self._exec(example, code, globs)
+        except BaseException as e:
+            exception = e
+            raise
+        finally:
+            self.hook.pytest_markdoctest_example_finish(duration=time.perf_counter() - start, exception=exception, **info)
+
+    def _exec(self, example: doctest.Example, code: CodeType, globs: dict) -> None:
+        if self.profiler is not None:
+            with self.profiler.measure(self._test, example, code):
+                self._call(code, globs)
+        else:
+            self._call(code, globs)
+
+    def _call(self, code: CodeType, globs: dict) -> None:
+        if self._limits is not None:
+            with self._limits.example():
+                self._call_code(code, globs)
+        else:
+            self._call_code(code, globs)
+
+    def _call_code(self, code: CodeType, globs: dict) -> None:
+        if code.co_flags & CO_COROUTINE:
+            # top-level await, the code returns a coroutine
+            self._use_event_loop()
+            self.event_loop().run_until_complete(eval(code, globs))
+        else:
+            exec(code, globs)
+
+    def _use_event_loop(self) -> None:
+        """
+        Make the event loop of the runner the current event loop until the
+        block finishes.
+        """
+        import asyncio
+
+        if self._saved_loop is _MISSING:
+            self._saved_loop = _current_event_loop()
+        asyncio.set_event_loop(self.event_loop())
+
+    def _restore_event_loop(self) -> None:
+        """
+        Restore the event loop that was current before the block, if it
+        used the loop of the runner.
+        """
+        loop, self._saved_loop = self._saved_loop, _MISSING
+        if loop is not _MISSING:
+            import asyncio
+
+            asyncio.set_event_loop(loop)
+
+    def event_loop(self) -> "asyncio.AbstractEventLoop":
+        """
+        The event loop running examples with top-level await.
+        """
+        import asyncio
+
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop
+
+    def close(self) -> None:
+        """
+        Cancel the remaining tasks and close the event loop, like
+        asyncio.run does.
+        """
+        loop, self._loop = self._loop, None
+        if loop is None or loop.is_closed():
+            return
+        import asyncio
+
+        try:
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            if hasattr(loop, "shutdown_default_executor"):  # python >= 3.9
+                loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            loop.close()
+
+    def _is_whole_block(self, test: doctest.DocTest) -> bool:
+        if test.docstring is None or not getattr(test, "script_block", not test.docstring.startswith(">>>")):
+            return False  # not a script block
+        return getattr(test, "options", {}).get(WHOLE_BLOCK, self.whole_block)
+
+    def report_unexpected_exception(self, out, test, example, exc_info):
+        if getattr(example, "whole_block", False):
+            example = _failing_statement(example, test, exc_info)
+        return super().report_unexpected_exception(out, test, example, exc_info)
+
+
+class AnyOutputChecker:
+    """
+    Wrap an output checker, to accept the output of script block examples
+    without comparing it. Their want is a bare "..." with ELLIPSIS, which
+    matches anything, but checkers would still normalize and match the
+    whole output against it.
+    """
+
+    def __init__(self, checker: doctest.OutputChecker):
+        self.checker = checker
+
+    def check_output(self, want: str, got: str, optionflags: int) -> bool:
+        if want == "..." and optionflags & doctest.ELLIPSIS:
+            return True
+        if isinstance(got, TruncatedOutput):
+            return False  # exceeded markdoctest_output_limit without matching want
+        return self.checker.check_output(want, got, optionflags)
+
+    def __getattr__(self, name):
+        return getattr(self.checker, name)
+
+
+def _whole_block_test(test: doctest.DocTest) -> doctest.DocTest:
+    """
+    A copy of a script block test, with a single example running the
+    whole block.
+    """
+    test_options = getattr(test, "options", {})
+    options = {**test_options, doctest.ELLIPSIS: True}
+    eg = doctest.Example(test.docstring, want="...", lineno=0, indent=0, options=options)
+    eg.want = "..."  # match anything, see ScriptBlockParser.parse
+    eg.whole_block = True
+    whole = doctest.DocTest([eg], {}, test.name, test.filename, test.lineno, test.docstring)
+    whole.globs = test.globs  # DocTest.__init__ copies globs
+    whole.options = test_options
+    whole.limits = getattr(test, "limits", {})
+    return whole
+
+
+def _failing_statement(example: doctest.Example, test: doctest.DocTest, exc_info) -> doctest.Example:
+    """
+    Map an exception raised by a whole block example back to the top-level
+    statement that raised it, so that failures point at its line.
+    """
+    filename = "<doctest %s[%d]>" % (test.name, test.examples.index(example))
+    lineno = None
+    tb = exc_info[2]
+    while tb is not None:
+        if tb.tb_frame.f_code.co_filename == filename:
+            lineno = tb.tb_lineno
+            break
+        tb = tb.tb_next
+    if lineno is None:
+        return example
+
+    stmt = None
+    for node in ast.parse(example.source).body:
+        if node.lineno > lineno:
+            break
+        stmt = node
+    if stmt is None:
+        return example
+    lines = example.source.splitlines()
+    end_lineno = getattr(stmt, "end_lineno", stmt.lineno)  # python >= 3.8
+    source = "\n".join(lines[stmt.lineno - 1 : end_lineno])
+    eg = doctest.Example(source, example.want, lineno=example.lineno + stmt.lineno - 1, options=example.options)
+    eg.want = example.want
+    return eg
+
+
+_MISSING = object()
+
+
+def _current_event_loop() -> Optional["asyncio.AbstractEventLoop"]:
+    """
+    The current event loop, as returned by asyncio.get_event_loop outside
+    of coroutines, or None if there is none (e.g. in a thread other than
+    the main one, or after asyncio.set_event_loop(None)).
+    """
+    import asyncio
+    import warnings
+
+    with warnings.catch_warnings():
+        # python >= 3.12 warns when the policy creates the loop
+        warnings.simplefilter("ignore", DeprecationWarning)
+        try:
+            return asyncio.get_event_loop_policy().get_event_loop()
+        except RuntimeError:
+            return None
+
+
+# compile flag of top-level await, python >= 3.8
+_ALLOW_TOP_LEVEL_AWAIT = getattr(ast, "PyCF_ALLOW_TOP_LEVEL_AWAIT", 0)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Match markdown paths against the --doctest-markdown patterns.
+
+``_pytest.pathlib.fnmatch_ex`` translates a pattern and builds a
+PurePath for every call, i.e. for every pattern and every markdown file
+of the session. :class:`MarkdownMatcher` compiles the patterns once,
+with the same semantics:
+
+- a pattern without a path separator matches the file name, so literal
+  names are looked up in a set, the others are joined into one regex,
+  and decisions are memoized by file name;
+- a pattern with a path separator matches the whole path, prefixed with
+  ``*/`` when the path is absolute and the pattern is not. These are
+  joined into one regex as well.
+"""
+
+import fnmatch
+import os
+import re
+import sys
+from pathlib import Path
+
+from pytest import Config
+
+from typing import Dict, List, Optional, Pattern
+
+# fnmatch special characters
+_GLOB_CHARS = re.compile(r"[*?[]")
+
+
+def _combine(patterns: List[str]) -> Optional[Pattern]:
+    if not patterns:
+        return None
+    return re.compile("|".join("(?:%s)" % fnmatch.translate(os.path.normcase(p)) for p in patterns))
+
+
+class MarkdownMatcher:
+    """
+    Compiled --doctest-markdown patterns, default: test*.md.
+    """
+
+    name = "markdoctest-matcher"
+
+    def __init__(self, patterns: List[str]):
+        if sys.platform.startswith("win"):
+            # like fnmatch_ex, posix separators work on windows
+            patterns = [p.replace("/", os.sep) if os.sep not in p and "/" in p else p for p in patterns]
+        names = [p for p in patterns if os.sep not in p]
+        paths = [p for p in patterns if os.sep in p]
+        self._literal_names = frozenset(os.path.normcase(p) for p in names if not _GLOB_CHARS.search(p))
+        self._name_re = _combine([p for p in names if _GLOB_CHARS.search(p)])
+        self._path_re = _combine(paths)
+        self._absolute_path_re = _combine([p if os.path.isabs(p) else "*" + os.sep + p for p in paths])
+        # file name -> whether it matches a file name pattern
+        self._names: Dict[str, bool] = {}
+
+    @classmethod
+    def from_config(cls, config: Config) -> "MarkdownMatcher":
+        return cls(config.getoption("doctestmarkdown") or ["test*.md"])
+
+    def _match_name(self, name: str) -> bool:
+        matched = self._names.get(name)
+        if matched is None:
+            normcase = os.path.normcase(name)
+            matched = normcase in self._literal_names or (self._name_re is not None and bool(self._name_re.match(normcase)))
+            self._names[name] = matched
+        return matched
+
+    def match(self, path: Path) -> bool:
+        if self._match_name(path.name):
+            return True
+        if self._path_re is None:
+            return False
+        pattern = self._absolute_path_re if path.is_absolute() else self._path_re
+        return bool(pattern.match(os.path.normcase(str(path))))
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded capture of the output of examples, for markdoctest_output_limit.
+
+doctest keeps everything an example prints in a StringIO, to compare it
+with the expected output once the example finished. ``BoundedOutput``
+replaces it, keeping only the head and the tail of the output once it
+exceeds the limit, and compares the output with the expected one as it
+is written, exactly or with ELLIPSIS, so that memory stays bounded by
+the limit and the expected output whatever an example prints.
+
+Examples with other option flags affecting the comparison, e.g.
+NORMALIZE_WHITESPACE or NUMBER, or expecting a ``<BLANKLINE>``, keep
+their whole output, which is compared by the configured checker.
+"""
+
+import doctest
+import io
+from collections import deque
+
+from typing import Deque, List, Optional
+
+ELLIPSIS_MARKER = doctest.ELLIPSIS_MARKER
+
+# option flags that StreamMatcher compares outputs like the checker with
+_STREAMING_FLAGS = doctest.ELLIPSIS | doctest.DONT_ACCEPT_BLANKLINE | doctest.REPORTING_FLAGS
+
+
+def can_stream(want: str, optionflags: int, ignored_flags: int = 0) -> bool:
+    """
+    Whether an output can be compared with want as it is written, i.e.
+    exactly or with ELLIPSIS. `ignored_flags` don't affect comparisons.
+    """
+    if want == ELLIPSIS_MARKER and optionflags & doctest.ELLIPSIS:
+        return True  # matches anything, e.g. script blocks
+    if optionflags & ~(_STREAMING_FLAGS | ignored_flags):
+        return False
+    return bool(optionflags & doctest.DONT_ACCEPT_BLANKLINE) or doctest.BLANKLINE_MARKER not in want
+
+
+class TruncatedOutput(str):
+    """
+    The head and tail of an output that exceeded the limit and did not
+    match the expected output, which never matches.
+    """
+
+
+class StreamMatcher:
+    """
+    Match an output written in chunks with an expected output, exactly,
+    or like doctest's ELLIPSIS matching, keeping at most the length of
+    the longest piece of it.
+    """
+
+    def __init__(self, want: str, ellipsis: bool):
+        self.want = want
+        self.pieces = want.split(ELLIPSIS_MARKER) if ellipsis else [want]
+        self.ok = True
+        self.size = 0
+        # matched length of the first piece
+        self._pos = 0
+        # index of the piece to find next, and the end of the last found
+        self._index = 1
+        self._end = len(self.pieces[0])
+        # written text where the next piece is not found yet
+        self._window = ""
+        self._window_start = len(self.pieces[0])
+        # the last characters written, to match the last piece
+        self._last = ""
+
+    def feed(self, s: str) -> None:
+        if not self.ok or not s:
+            return
+        self.size += len(s)
+        self._update_last(s)
+        first = self.pieces[0]
+        if self._pos < len(first) or len(self.pieces) == 1:
+            n = min(len(s), len(first) - self._pos)
+            if s[:n] != first[self._pos : self._pos + n] or (len(self.pieces) == 1 and n < len(s)):
+                self.ok = False
+                return
+            self._pos += n
+            s = s[n:]
+        if not s or self._index >= len(self.pieces) - 1:
+            return
+        # find the middle pieces in order, like doctest does
+        self._window += s
+        while self._index < len(self.pieces) - 1:
+            piece = self.pieces[self._index]
+            i = self._window.find(piece)
+            if i < 0:
+                # keep what may be the start of the piece
+                drop = max(len(self._window) - len(piece) + 1, 0)
+                self._window = self._window[drop:]
+                self._window_start += drop
+                return
+            self._end = self._window_start + i + len(piece)
+            self._window = self._window[i + len(piece) :]
+            self._window_start = self._end
+            self._index += 1
+        self._window = ""
+
+    def _update_last(self, s: str) -> None:
+        n = len(self.pieces[-1])
+        self._last = (self._last + s)[-n:] if n else ""
+
+    def matched(self) -> bool:
+        """
+        Whether everything written matches the expected output.
+        """
+        if not self.ok:
+            return False
+        if len(self.pieces) == 1:
+            return self._pos == len(self.want)
+        index, end = self._index, self._end
+        # empty pieces, as in "......", match where the search is
+        while index < len(self.pieces) - 1 and not self.pieces[index]:
+            index, end = index + 1, max(end, self._window_start)
+        if self._pos < len(self.pieces[0]) or index < len(self.pieces) - 1:
+            return False
+        last = self.pieces[-1]
+        return end <= self.size - len(last) and self._last == last
+
+
+class BoundedOutput(io.TextIOBase):
+    """
+    The stdout of examples, replacing doctest's, that keeps at most
+    `limit` characters: the head and the tail of the output.
+    """
+
+    def __init__(self, limit: int, ignored_flags: int = 0):
+        super().__init__()
+        self.limit = limit
+        # option flags that don't affect comparisons, see can_stream
+        self.ignored_flags = ignored_flags
+        self._head_limit = limit // 2
+        self._tail_limit = limit - self._head_limit
+        self._matcher: Optional[StreamMatcher] = None
+        # the whole output, of an example that can't be compared as it
+        # is written
+        self._whole: Optional[List[str]] = None
+        self._head: List[str] = []
+        self._tail: Deque[str] = deque()
+        self.truncate(0)
+
+    def writable(self) -> bool:
+        return True
+
+    def expect(self, want: str, optionflags: int) -> None:
+        """
+        Match the output of the next example with its expected output, or
+        keep its whole output if it can't be matched as it is written.
+        """
+        if can_stream(want, optionflags, self.ignored_flags):
+            self._matcher = StreamMatcher(want, bool(optionflags & doctest.ELLIPSIS))
+        else:
+            self._whole = []
+
+    def write(self, s: str) -> int:
+        if not isinstance(s, str):
+            raise TypeError("write() argument must be str, not %s" % type(s).__name__)
+        n = len(s)
+        self._size += n
+        self._last_char = s[-1:] or self._last_char
+        if self._whole is not None:
+            self._whole.append(s)
+            return n
+        if self._matcher is not None:
+            self._matcher.feed(s)
+        room = self._head_limit - self._head_size
+        if room > 0:
+            self._head.append(s[:room])
+            self._head_size += len(self._head[-1])
+            s = s[room:]
+        if s:
+            s = s[-self._tail_limit :] if self._tail_limit else ""
+            self._tail.append(s)
+            self._tail_size += len(s)
+            while self._tail and self._tail_size - len(self._tail[0]) >= self._tail_limit:
+                self._tail_size -= len(self._tail.popleft())
+        return n
+
+    def getvalue(self) -> str:
+        """
+        The output like doctest's getvalue, i.e. with a trailing newline.
+        The expected output if the output exceeded the limit but matched
+        it, else a TruncatedOutput.
+        """
+        newline = "\n" if self._size and self._last_char != "\n" else ""
+        if self._whole is not None:
+            return "".join(self._whole) + newline
+        if self._size <= self.limit:
+            return "".join(self._head) + "".join(self._tail) + newline
+        if self._matcher is not None:
+            self._matcher.feed(newline)
+            if self._matcher.matched():
+                return self._matcher.want
+        head = "".join(self._head)
+        tail = "".join(self._tail)[-self._tail_limit :] if self._tail_limit else ""
+        omitted = self._size - self._head_size - len(tail)
+        return TruncatedOutput(
+            "%s%s... %d characters not shown, the output exceeded markdoctest_output_limit ...\n%s%s"
+            % (head, "" if head.endswith("\n") else "\n", omitted, tail, newline)
+        )
+
+    def truncate(self, size: Optional[int] = None) -> int:
+        # doctest truncates after each example
+        self._head.clear()
+        self._tail.clear()
+        self._head_size = self._tail_size = self._size = 0
+        self._last_char = ""
+        self._matcher = None
+        self._whole = None
+        return 0
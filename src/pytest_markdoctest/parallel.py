@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Parse markdown files in a process pool ahead of their collection.
+"""
+
+import doctest
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+from pytest import Config, Session
+from _pytest.pathlib import absolutepath, fnmatch_ex
+
+from pytest_markdoctest.cache import ParseCache, dump_doctests, load_doctests
+from pytest_markdoctest.code_classes import CodeClasses
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def _parse_worker(
+    path: str, encoding: str, use_mmap: bool, code_classes: CodeClasses, cache_directory: Optional[str]
+) -> Tuple[Optional[str], Optional[list]]:
+    """
+    Read and parse a markdown file. With the parse cache, also return its
+    parse cache key, and no doctests if they are already in the cache.
+    """
+    from pytest_markdoctest.markdown import _open_buffer, _parse_buffer, parse_markdown_file
+
+    if cache_directory is None:
+        return None, dump_doctests(parse_markdown_file(Path(path), encoding, use_mmap, code_classes))
+    parse_cache = ParseCache(Path(cache_directory), 0)
+    with _open_buffer(Path(path), use_mmap) as data:
+        key = parse_cache.key(data, encoding, code_classes.signature())
+        if parse_cache.contains(key):
+            return key, None
+        return key, dump_doctests(_parse_buffer(data, encoding, path, use_mmap, code_classes))
+
+
+def iter_markdown_files(session: Session) -> Iterator[Path]:
+    """
+    Markdown files under the command line arguments that are likely to
+    be collected, i.e. explicitly given, or matching --doctest-markdown
+    and neither ignored (--ignore, --ignore-glob, collect_ignore,
+    norecursedirs, ...) nor skipped by the fence prefilter. Directories
+    are walked like pytest does.
+    """
+    from pytest_markdoctest import _match_doctest_markdown, _may_have_blocks
+
+    config = session.config
+    invocation_dir = config.invocation_params.dir
+    for arg in config.args:
+        path = absolutepath(invocation_dir / arg.split("::")[0])
+        if path.is_file():
+            if path.suffix == ".md":
+                yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(str(path)):
+            dirnames[:] = [d for d in sorted(dirnames) if d != "__pycache__" and not _ignored(session, Path(dirpath, d))]
+            for filename in sorted(filenames):
+                file_path = Path(dirpath, filename)
+                if file_path.suffix != ".md" or not _match_doctest_markdown(config, file_path):
+                    continue
+                if not _ignored(session, file_path) and _may_have_blocks(config, file_path, session):
+                    yield file_path
+
+
+def _ignored(session: Session, path: Path) -> bool:
+    # same checks as Session._recurse and Session._collectfile
+    ihook = session.gethookproxy(path.parent)
+    if ihook.pytest_ignore_collect(collection_path=path, config=session.config):
+        return True
+    return path.is_dir() and any(fnmatch_ex(pat, path) for pat in session.config.getini("norecursedirs"))
+
+
+class CollectPool:
+    """
+    Submit every markdown file to a process pool when the collection
+    starts, so that ``DoctestMarkdown.collect`` only has to wait for the
+    parsed doctests instead of parsing the file itself. Files are read,
+    and hashed for the parse cache, in the pool too.
+    """
+
+    name = "markdoctest-collect-pool"
+
+    def __init__(self, config: Config, workers: int):
+        self.config = config
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        # resolved path -> future of (parse cache key, dumped doctests)
+        self.futures: Dict[Path, "Future[Tuple[Optional[str], Optional[list]]]"] = {}
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collection(self, session: Session) -> None:
+        from pytest_markdoctest.markdown import _use_mmap
+
+        config = self.config
+        encoding = config.getini("doctest_encoding")
+        use_mmap = _use_mmap(config, encoding)
+        code_classes = CodeClasses.from_config(config)
+        parse_cache: Optional[ParseCache] = config.pluginmanager.get_plugin(ParseCache.name)
+        cache_directory = str(parse_cache.directory) if parse_cache is not None else None
+
+        self.executor = ProcessPoolExecutor(self.workers)
+        for path in iter_markdown_files(session):
+            resolved = path.resolve()
+            if resolved not in self.futures:
+                self.futures[resolved] = self.executor.submit(
+                    _parse_worker, str(path), encoding, use_mmap, code_classes, cache_directory
+                )
+
+    def get(self, path: Path) -> Optional[List[doctest.DocTest]]:
+        """
+        The doctests of a pre-parsed file, or None if it was not submitted.
+        Exceptions raised while parsing are raised here.
+        """
+        future = self.futures.pop(path.resolve(), None)
+        if future is None:
+            return None
+        key, data = future.result()
+        parse_cache: Optional[ParseCache] = self.config.pluginmanager.get_plugin(ParseCache.name)
+        if data is None:  # found in the parse cache by the worker
+            return parse_cache.get(key, str(path)) if parse_cache is not None else None
+        if key is not None and parse_cache is not None:
+            parse_cache.set_data(key, data)
+        return load_doctests(data, str(path))
+
+    def shutdown(self) -> None:
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def pytest_collection_finish(self) -> None:
+        self.shutdown()
+
+    def pytest_unconfigure(self) -> None:
+        self.shutdown()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+A cheap check run before a markdown file becomes a collector: files
+without a line that may open a python fence, e.g. ```` ```python ````,
+are not collected at all.
+
+The check is a single bytes regex search through a mmap of the file,
+with no decoding nor parsing, and may have false positives but no false
+negatives. Its results are
+kept in pytest's cache, keyed by path and checked against the mtime and
+size of the file, so that unchanged files are not read again.
+"""
+
+import mmap
+import re
+import zlib
+from pathlib import Path
+
+from pytest import Config
+
+from typing import Dict, Iterable, List, Optional, Pattern
+
+
+def fence_re(code_classes: Iterable[Optional[str]]) -> Pattern:
+    """
+    Bytes regex of a line that may open a fence of one of code_classes,
+    as the scanner reads its code class, None standing for any attribute
+    info string, e.g. {.python}. Lines may end with '\\r'.
+    """
+    code_classes = set(code_classes)
+    alternatives = [re.escape(c) + r"(?![\w\-\.])" for c in sorted(code_classes - {None}, key=len, reverse=True)]
+    if None in code_classes:
+        alternatives.append(r"\{")
+    classes = "|".join(alternatives) or "(?!)"
+    pattern = r"(?:^|(?<=\r))[ \t]*```+[ \t]*(?:%s)" % classes
+    return re.compile(pattern.encode(), re.MULTILINE)
+
+
+class FencePrefilter:
+    """
+    Whether markdown files may have python blocks, by path.
+    """
+
+    name = "markdoctest-prefilter"
+    key = "markdoctest/prefilter"
+
+    def __init__(self, config: Config, code_classes: Iterable[Optional[str]]):
+        self.config = config
+        self.fence_re = fence_re(code_classes)
+        # path -> [mtime in ns, size, whether it may have python blocks]
+        self.entries: Dict[str, List] = {}
+        self.dirty = False
+        cache = getattr(config, "cache", None)
+        if cache is not None:
+            self.entries = cache.get(self._cache_key(), {})
+
+    def _cache_key(self) -> str:
+        # results depend on the code classes
+        return "%s/%08x" % (self.key, zlib.crc32(self.fence_re.pattern))
+
+    def may_have_blocks(self, path: Path) -> bool:
+        filename = str(path)
+        try:
+            st = path.stat()
+        except OSError:
+            return True  # let collection report the error
+        entry = self.entries.get(filename)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+        try:
+            found = self._search(path)
+        except (OSError, ValueError):
+            return True
+        self.entries[filename] = [st.st_mtime_ns, st.st_size, found]
+        self.dirty = True
+        return found
+
+    def _search(self, path: Path) -> bool:
+        with path.open("rb") as f:
+            if not f.seek(0, 2):
+                return False  # empty files can't be mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                return self.fence_re.search(buf) is not None
+
+    def pytest_sessionfinish(self) -> None:
+        cache = getattr(self.config, "cache", None)
+        if cache is None or not self.dirty:
+            return
+        # merge with the entries of files other processes checked
+        entries = cache.get(self._cache_key(), {})
+        entries.update(self.entries)
+        cache.set(self._cache_key(), entries)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Per-example profiling of markdown doctests, for --markdoctest-profile.
+
+``MarkDoctestRunner.exec_example`` runs every example inside
+:meth:`Profiler.measure`, which records its wall and CPU time. In
+"memory" mode, the memory it allocated is traced with tracemalloc, and
+in "cprofile" mode the example runs under cProfile, with one profile per
+markdown file so that blocks of different files at the same line are not
+merged.
+
+Examples are reported by markdown file and line, in a terminal summary
+sorted by wall time, and optionally in a json or pstats file. With
+pytest-xdist, workers send their records and stats to the controller,
+which reports them.
+"""
+
+import contextlib
+import cProfile
+import doctest
+import itertools
+import json
+import marshal
+import pstats
+import time
+import tracemalloc
+from pathlib import Path
+from types import CodeType
+
+import pytest
+from pytest import Config
+from _pytest.pathlib import bestrelpath
+
+from typing import Dict, Iterator, List, Optional
+
+# number of examples shown in the terminal summary
+SUMMARY_SIZE = 20
+
+
+def example_lineno(test: doctest.DocTest, example: doctest.Example) -> int:
+    """
+    Line number of an example in its markdown file, starting from 1.
+    """
+    return (test.lineno or 0) + example.lineno + 1
+
+
+class Profiler:
+    """
+    Record the wall time, CPU time and memory of every markdown example.
+    """
+
+    name = "markdoctest-profiler"
+
+    def __init__(self, config: Config, mode: str, output: Optional[str] = None):
+        self.config = config
+        self.mode = mode
+        self.output = output
+        self.records: List[dict] = []
+        # markdown file -> its cProfile profile
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        # markdown file -> {code filename: line of the example}
+        self.code_lines: Dict[str, Dict[str, int]] = {}
+        # marshalled cProfile stats of pytest-xdist workers
+        self.worker_stats: List[bytes] = []
+
+    @contextlib.contextmanager
+    def measure(self, test: doctest.DocTest, example: doctest.Example, code: CodeType):
+        lineno = example_lineno(test, example)
+        record = {
+            "file": bestrelpath(self.config.invocation_params.dir, Path(test.filename)),
+            "line": lineno,
+            "block": test.name,
+            "source": example.source.strip().split("\n", 1)[0],
+        }
+        trace = self.mode == "memory"
+        if trace:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            if hasattr(tracemalloc, "reset_peak"):  # python >= 3.9
+                tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        profile = None
+        if self.mode == "cprofile":
+            profile = self.profiles.get(test.filename)
+            if profile is None:
+                profile = self.profiles[test.filename] = cProfile.Profile()
+            self.code_lines.setdefault(test.filename, {})[code.co_filename] = lineno
+            profile.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record["wall"] = time.perf_counter() - wall
+            record["cpu"] = time.process_time() - cpu
+            if profile is not None:
+                profile.disable()
+            if trace:
+                current, peak = tracemalloc.get_traced_memory()
+                record["memory"] = current - memory_before
+                if hasattr(tracemalloc, "reset_peak"):
+                    record["peak_memory"] = peak - memory_before
+                if started_tracing:
+                    tracemalloc.stop()
+            self.records.append(record)
+
+    def stats(self) -> Optional[pstats.Stats]:
+        """
+        The cProfile stats of all markdown files, with the functions of
+        examples located at their markdown file and line.
+        """
+        combined = None
+        for stats in itertools.chain(self._file_stats(), map(_load_stats, self.worker_stats)):
+            if combined is None:
+                combined = stats
+            else:
+                combined.add(stats)
+        return combined
+
+    def _file_stats(self) -> Iterator[pstats.Stats]:
+        for filename, profile in self.profiles.items():
+            stats = pstats.Stats(profile)
+            code_lines = self.code_lines.get(filename, {})
+
+            def locate(func):
+                code_filename, lineno, name = func
+                if code_filename in code_lines:
+                    return filename, code_lines[code_filename] + lineno - 1, name
+                return func
+
+            stats.stats = {
+                locate(func): (cc, nc, tt, ct, {locate(caller): value for caller, value in callers.items()})
+                for func, (cc, nc, tt, ct, callers) in stats.stats.items()
+            }
+            yield stats
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error) -> None:  # pytest-xdist controller
+        output = getattr(node, "workeroutput", {}).get("markdoctest_profile")
+        if output is None:
+            return
+        self.records.extend(output["records"])
+        if output["stats"] is not None:
+            self.worker_stats.append(output["stats"])
+
+    def pytest_terminal_summary(self, terminalreporter) -> None:
+        if not self.records:
+            return
+        tr = terminalreporter
+        records = sorted(self.records, key=lambda r: r["wall"], reverse=True)
+        tr.write_sep("=", "slowest %d of %d markdown examples" % (min(SUMMARY_SIZE, len(records)), len(records)))
+        memory = self.mode == "memory"
+        header = ["%10s" % "wall", "%10s" % "cpu"] + (["%12s" % "memory"] if memory else []) + ["location"]
+        tr.write_line(" ".join(header))
+        for r in records[:SUMMARY_SIZE]:
+            row = ["%9.4fs" % r["wall"], "%9.4fs" % r["cpu"]] + (["%12d" % r["memory"]] if memory else [])
+            row.append("%s:%d: %s" % (r["file"], r["line"], r["source"]))
+            tr.write_line(" ".join(row))
+        if self.output is not None:
+            tr.write_line("markdoctest profile written to %s" % self.output)
+
+    def pytest_sessionfinish(self) -> None:
+        workeroutput = getattr(self.config, "workeroutput", None)
+        if workeroutput is not None:  # pytest-xdist worker, reported by the controller
+            stats = self.stats()
+            workeroutput["markdoctest_profile"] = {
+                "records": self.records,
+                "stats": marshal.dumps(stats.stats) if stats is not None else None,
+            }
+            return
+        if self.output is None or not self.records:
+            return
+        if self.output.endswith(".pstats"):
+            stats = self.stats()
+            if stats is not None:
+                stats.dump_stats(self.output)
+            return
+        records = sorted(self.records, key=lambda r: r["wall"], reverse=True)
+        with open(self.output, "w", encoding="utf-8") as f:
+            json.dump({"mode": self.mode, "examples": records}, f, indent=2)
+
+
+def _load_stats(data: bytes) -> pstats.Stats:
+    stats = pstats.Stats()
+    stats.stats = marshal.loads(data)
+    stats.get_top_level_stats()
+    return stats
@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+A line-oriented scanner for fenced markdown code blocks.
+
+It finds exactly the blocks ``DoctestMarkdown._CODE_BLOCK_RE`` matches,
+but without backtracking: lines that may open or close a fence, or carry
+an html comment, are located by a cheap anchored regex, and the closing
+fence of every opening fence is resolved by a single backward pass.
+"""
+
+import re
+from array import array
+from bisect import bisect_left
+
+from typing import Callable, Container, Dict, Iterable, List, Optional, Tuple
+
+# Lines that may be an html comment, an opening fence or a closing fence.
+_CANDIDATE_RE = re.compile(r"^[ \t]*(?:<!--|```)|```$", re.MULTILINE)
+_CANDIDATE_BYTES_RE = re.compile(_CANDIDATE_RE.pattern.encode(), re.MULTILINE)
+
+_NEWLINE_RE = re.compile("\n")
+
+# What _CODE_BLOCK_RE matches between the opening backticks and the newline.
+_INFO_RE = re.compile(r"[ \t]*(?P<code_class>[\w\-\.]+)?")
+
+
+class LineIndex:
+    """
+    Map character offsets of a text to line numbers, by bisecting the
+    offsets of its newlines. The index is built once per file, and
+    relative views of it are shared with the parsers of each block.
+    """
+
+    __slots__ = ("newlines", "base", "base_lineno")
+
+    def __init__(self, newlines: "array[int]", base: int = 0, base_lineno: int = 0):
+        self.newlines = newlines
+        # offsets and line numbers are relative to this offset and its line
+        self.base = base
+        self.base_lineno = base_lineno
+
+    @classmethod
+    def from_text(cls, text: str) -> "LineIndex":
+        return cls(array("q", [m.start() for m in _NEWLINE_RE.finditer(text)]))
+
+    def lineno(self, offset: int) -> int:
+        """
+        Number of the line containing offset, starting from 0.
+        """
+        return bisect_left(self.newlines, self.base + offset) - self.base_lineno
+
+    def line_start(self, lineno: int) -> int:
+        """
+        Offset of the first character of a line, numbered from 0.
+        """
+        if lineno == 0:
+            return 0
+        return self.newlines[self.base_lineno + lineno - 1] + 1 - self.base
+
+    def relative(self, offset: int) -> "LineIndex":
+        """
+        A view of the index for the text starting at offset, which must
+        be the start of a line.
+        """
+        return LineIndex(self.newlines, self.base + offset, self.lineno(offset) + self.base_lineno)
+
+
+class CodeBlock:
+    """
+    A fenced code block, providing the same groups as a match of
+    ``DoctestMarkdown._CODE_BLOCK_RE``.
+    """
+
+    __slots__ = (
+        "option_list",
+        "code_all",
+        "code_start",
+        "code_class",
+        "code_content",
+        "info",
+        "lineno",
+        "fence_lineno",
+        "option_lines",
+        "lines",
+        "_span",
+    )
+
+    def __init__(
+        self,
+        option_list,
+        code_all,
+        code_start,
+        code_class,
+        code_content,
+        info,
+        lineno,
+        fence_lineno,
+        option_lines,
+        lines,
+        span,
+    ):
+        self.option_list = option_list
+        self.code_all = code_all
+        self.code_start = code_start
+        self.code_class = code_class
+        self.code_content = code_content
+        # the text following code_start on the opening line
+        self.info = info
+        # line numbers of start() and of the opening fence, starting from 1
+        self.lineno = lineno
+        self.fence_lineno = fence_lineno
+        # LineIndex relative to the start of option_list and code_content
+        self.option_lines = option_lines
+        self.lines = lines
+        self._span = span
+
+    def group(self, name: str) -> Optional[str]:
+        return getattr(self, name)
+
+    def groupdict(self) -> Dict[str, Optional[str]]:
+        return {name: getattr(self, name) for name in ("option_list", "code_all", "code_start", "code_class", "code_content")}
+
+    def start(self) -> int:
+        return self._span[0]
+
+    def end(self) -> int:
+        return self._span[1]
+
+    def span(self) -> Tuple[int, int]:
+        return self._span
+
+    def __repr__(self):
+        return "<CodeBlock span=%r lineno=%d code_class=%r>" % (self._span, self.lineno, self.code_class)
+
+
+class _Line:
+    __slots__ = ("lineno", "start", "end", "is_comment", "opening", "closing")
+
+    def __init__(self, lineno, start, end):
+        self.lineno = lineno
+        self.start = start
+        self.end = end
+        self.is_comment = False
+        # (indent, number of backticks, info) of an opening fence
+        self.opening = None
+        # (closing _Line, number of backticks) resolved for an opening fence
+        self.closing = None
+
+
+def _classify(line: _Line, s: str, has_newline: bool) -> Optional[Tuple[str, int, bool]]:
+    """
+    Fill in the comment and opening fence attributes of a line, given
+    its text `s`. If it may be a closing fence, return the whitespace
+    before its trailing backticks, the number of backticks, and whether
+    all the whitespace may be the indent of the fence it closes.
+    """
+    stripped = s.lstrip(" \t")
+    if has_newline:
+        if stripped.startswith("<!--"):
+            rstripped = stripped.rstrip(" \t")
+            line.is_comment = len(rstripped) >= 7 and rstripped.endswith("-->")
+        n = len(stripped) - len(stripped.lstrip("`"))
+        if n >= 3:
+            line.opening = (s[: len(s) - len(stripped)], n, stripped[n:])
+
+    # A closing fence is code_start at the end of a line, not preceded by
+    # another backtick. It may close any code_start whose indent is a
+    # suffix of the whitespace before the trailing backticks.
+    r = len(s) - len(s.rstrip("`"))
+    if r < 3:
+        return None
+    pre = s[:-r]
+    ws = len(pre) - len(pre.rstrip(" \t"))
+    whole = not (ws and ws < len(pre) and pre[-ws - 1] == "`")
+    return pre[len(pre) - ws :], r, whole
+
+
+class _IndentTrie:
+    """
+    The indents of opening fences, by their characters from the end, to
+    find those that are suffixes of the whitespace before a closing fence
+    in time bounded by its length, however many indents there are.
+    """
+
+    def __init__(self, indents: Iterable[str]):
+        self.root: dict = {}
+        for indent in indents:
+            node = self.root
+            for c in reversed(indent):
+                node = node.setdefault(c, {})
+            node[None] = indent
+
+    def suffixes(self, ws: str, whole: bool) -> List[str]:
+        """
+        The indents that are suffixes of ws, ws itself only if whole.
+        """
+        found = []
+        node = self.root
+        for j in range(len(ws) + 1):
+            indent = node.get(None)
+            if indent is not None and (j < len(ws) or whole):
+                found.append(indent)
+            if j == len(ws):
+                break
+            node = node.get(ws[-j - 1])
+            if node is None:
+                break
+        return found
+
+
+def _find_fences(buf, candidate_re, locate: Callable[[int], Tuple[int, int]], decode: Callable[[int, int], str]):
+    """
+    Yield (first line, opening fence line, closing fence line, code_start,
+    code_class, info) for every block of `buf`, a str or a bytes-like
+    object. `locate` maps an offset to its line number, starting from 0,
+    and the offset of the line start. `decode` returns buf[start:end] as
+    str.
+
+    The buffer is scanned once to collect candidate lines, which are then
+    walked backward once to resolve closing fences and forward once to
+    emit non-overlapping blocks, so the cost is linear in the buffer size.
+    """
+    newline = "\n" if isinstance(candidate_re.pattern, str) else b"\n"
+    lines: List[_Line] = []
+    closings: List[Optional[Tuple[str, int, bool]]] = []
+    for m in candidate_re.finditer(buf):
+        lineno, start = locate(m.start())
+        if lines and lines[-1].start == start:
+            continue
+        end = buf.find(newline, start)
+        has_newline = end >= 0
+        line = _Line(lineno + 1, start, end if has_newline else len(buf))
+        lines.append(line)
+        closings.append(_classify(line, decode(line.start, line.end), has_newline))
+
+    # Resolve, for every opening fence, the nearest closing fence after it.
+    # Like the regex, prefer the longest code_start that can be closed.
+    # Closing fences are keyed by the indents of opening fences only.
+    indents = _IndentTrie({line.opening[0] for line in lines if line.opening is not None})
+    nearest: Dict[Tuple[str, int], _Line] = {}
+    for line, closing_fence in zip(reversed(lines), reversed(closings)):
+        if line.opening is not None:
+            indent, n, _ = line.opening
+            for k in range(n, 2, -1):
+                closing = nearest.get((indent, k))
+                if closing is not None:
+                    line.closing = (closing, k)
+                    break
+        if closing_fence is not None:
+            ws, r, whole = closing_fence
+            for indent in indents.suffixes(ws, whole):
+                nearest[(indent, r)] = line
+
+    next_lineno = 1  # matches never overlap
+    for i, line in enumerate(lines):
+        if line.lineno < next_lineno or line.closing is None:
+            continue
+        # html comments directly above the opening fence
+        first = i
+        while first > 0:
+            prev = lines[first - 1]
+            if not prev.is_comment or prev.lineno != lines[first].lineno - 1 or prev.lineno < next_lineno:
+                break
+            first -= 1
+
+        indent, n, info = line.opening
+        closing, k = line.closing
+        code_start = indent + "`" * k
+        if k == n:
+            code_class = _INFO_RE.match(info).group("code_class")
+        else:
+            # the extra backticks are part of the info string
+            info = "`" * (n - k) + info
+            code_class = None
+        yield lines[first], line, closing, code_start, code_class, info
+        next_lineno = closing.lineno + 1
+
+
+def scan_code_blocks(text: str, index: Optional[LineIndex] = None) -> List[CodeBlock]:
+    """
+    Return the fenced code blocks of a markdown text, in order.
+    """
+    if index is None:
+        index = LineIndex.from_text(text)
+
+    def locate(offset):
+        lineno = index.lineno(offset)
+        return lineno, index.line_start(lineno)
+
+    def decode(start, end):
+        return text[start:end]
+
+    blocks = []
+    for first, line, closing, code_start, code_class, info in _find_fences(text, _CANDIDATE_RE, locate, decode):
+        start = first.start
+        blocks.append(
+            CodeBlock(
+                option_list=text[start : line.start],
+                code_all=text[line.start : closing.end],
+                code_start=code_start,
+                code_class=code_class,
+                code_content=text[line.end + 1 : closing.end - len(code_start)],
+                info=info,
+                lineno=first.lineno,
+                fence_lineno=line.lineno,
+                option_lines=index.relative(start),
+                lines=index.relative(line.end + 1),
+                span=(start, closing.end),
+            )
+        )
+    return blocks
+
+
+class _LineCounter:
+    """
+    Line numbers of increasing offsets of a bytes-like buffer, counted in
+    bounded chunks so that no index of the whole buffer is kept.
+    """
+
+    chunk_size = 1 << 20
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.offset = 0
+        self.lineno = 0
+
+    def locate(self, offset: int) -> Tuple[int, int]:
+        while self.offset < offset:
+            end = min(offset, self.offset + self.chunk_size)
+            self.lineno += self.buf[self.offset : end].count(b"\n")
+            self.offset = end
+        return self.lineno, self.buf.rfind(b"\n", 0, offset) + 1
+
+
+def is_ascii_compatible(encoding: str) -> bool:
+    """
+    Whether markdown syntax is encoded as ascii, so that it can be
+    scanned without decoding, e.g. utf-8 or latin-1 but not utf-16.
+    """
+    syntax = "\n `<!-->"
+    try:
+        return syntax.encode(encoding) == syntax.encode("ascii")
+    except (LookupError, UnicodeError):
+        return False
+
+
+def scan_code_blocks_bytes(buf, encoding: str, code_classes: Container[str]) -> List[CodeBlock]:
+    """
+    Return the fenced code blocks of an encoded markdown text whose code
+    class is in `code_classes`. `buf` may be a mmap, only the lines that
+    may be fences or comments and the selected blocks are decoded.
+
+    The encoding must be ascii compatible, and lines must be separated by
+    '\\n' only. Offsets of the returned blocks are byte offsets.
+    """
+    counter = _LineCounter(buf)
+
+    def decode(start, end):
+        return buf[start:end].decode(encoding)
+
+    blocks = []
+    for first, line, closing, code_start, code_class, info in _find_fences(buf, _CANDIDATE_BYTES_RE, counter.locate, decode):
+        if code_class not in code_classes:
+            continue
+        start = first.start
+        option_list = decode(start, line.start)
+        code_content = decode(line.end + 1, closing.end - len(code_start))
+        blocks.append(
+            CodeBlock(
+                option_list=option_list,
+                code_all=decode(line.start, closing.end),
+                code_start=code_start,
+                code_class=code_class,
+                code_content=code_content,
+                info=info,
+                lineno=first.lineno,
+                fence_lineno=line.lineno,
+                option_lines=LineIndex.from_text(option_list),
+                lines=LineIndex.from_text(code_content),
+                span=(start, closing.end),
+            )
+        )
+    return blocks
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+pytest-xdist scheduling of markdown doctests.
+
+Items of a markdown file share the globals of their runner, so they must
+run in order on the same worker. With markdoctest_block_dependencies,
+only the items of each group of dependent blocks are kept together.
+This module requires pytest-xdist, it is only imported when
+--markdoctest-dist is given.
+"""
+
+from collections import OrderedDict
+
+from pytest import Config
+from xdist.scheduler import LoadScopeScheduling
+
+from pytest_markdoctest.cache import DurationRecorder
+from pytest_markdoctest.dependency import BlockDependencies, group_scope
+
+from typing import Dict, Optional
+
+
+def markdown_scope(nodeid: str) -> Optional[str]:
+    """
+    The markdown file of a nodeid, or None if it is not a markdown item.
+    """
+    path = nodeid.split("::", 1)[0]
+    return path if path.endswith(".md") else None
+
+
+def sort_by_duration(workqueue: "OrderedDict[str, dict]", durations: Dict[str, float]) -> "OrderedDict[str, dict]":
+    """
+    Order scopes by decreasing expected duration, i.e. longest processing
+    time first. Markdown files without history are expected to take the
+    mean duration of known files, other scopes are expected to be short.
+    """
+    known = [durations[scope] for scope in workqueue if scope in durations]
+    default = sum(known) / len(known) if known else 0.0
+
+    def expected(scope):
+        if scope in durations:
+            return durations[scope]
+        return default if markdown_scope(scope) is not None else 0.0
+
+    # sorted is stable, so scopes with the same duration keep their order.
+    return OrderedDict(sorted(workqueue.items(), key=lambda item: -expected(item[0])))
+
+
+class MarkdownScheduling(LoadScopeScheduling):
+    """
+    Send all items of a markdown file to the same worker, and distribute
+    other tests one by one like ``--dist load``. Markdown files are handed
+    out longest first, according to their duration in previous runs.
+    """
+
+    def __init__(self, config: Config, log=None):
+        super().__init__(config, log)
+        self.durations = DurationRecorder.load(config)
+        self._sorted = False
+        self.split_groups = config.getini("markdoctest_block_dependencies")
+        # markdown file -> {block name: scope of its group}
+        self._group_scopes: Dict[str, Dict[str, str]] = {}
+
+    def _split_scope(self, nodeid: str) -> str:
+        scope = markdown_scope(nodeid)
+        if scope is None:
+            return nodeid
+        if not self.split_groups:
+            return scope
+        group_scopes = self._group_scopes.get(scope)
+        if group_scopes is None:
+            group_scopes = self._group_scopes[scope] = self._load_group_scopes(scope)
+        return group_scopes.get(nodeid.split("::", 1)[-1], scope)
+
+    def _load_group_scopes(self, scope: str) -> Dict[str, str]:
+        """
+        Parse a markdown file to find its independent groups of blocks,
+        like DoctestMarkdown.collect does on the workers.
+        """
+        from pytest_markdoctest.code_classes import CodeClasses
+        from pytest_markdoctest.markdown import _use_mmap, parse_markdown_file
+
+        encoding = self.config.getini("doctest_encoding")
+        path = self.config.rootpath / scope
+        code_classes = CodeClasses.from_config(self.config)
+        try:
+            tests = parse_markdown_file(path, encoding, _use_mmap(self.config, encoding), code_classes)
+            tests = [test for test in tests if test.examples]
+        except (OSError, ValueError):
+            return {}
+        groups = BlockDependencies.analyze(tests).components()
+        return {tests[i].name: group_scope(scope, k, len(groups)) for k, group in enumerate(groups) for i in group}
+
+    def _assign_work_unit(self, node) -> None:
+        if not self._sorted:
+            # the work queue is complete once the first unit is assigned
+            self.workqueue = sort_by_duration(self.workqueue, self.durations)
+            self._sorted = True
+        super()._assign_work_unit(node)
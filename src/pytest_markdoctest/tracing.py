@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Export the blocks and examples of markdown files as spans to a JSONL
+file, for --markdoctest-trace.
+
+Spans follow the OpenTelemetry model: every span has the trace id of the
+session, its own span id and the span id of its parent, i.e. example
+spans are children of their block span. Times are in nanoseconds since
+the epoch.
+"""
+
+import json
+import os
+import secrets
+import time
+
+import pytest
+from pytest import Config
+
+from typing import Dict, List, Optional
+
+
+class TraceExporter:
+    """
+    Write a JSON line per block and per example.
+    """
+
+    name = "markdoctest-trace"
+
+    def __init__(self, config: Config, path: str):
+        self.config = config
+        workerinput = getattr(config, "workerinput", None)
+        if workerinput is None:
+            self.trace_id = secrets.token_hex(16)
+            mode = "w"
+        else:
+            # pytest-xdist workers append to the file of the controller
+            self.trace_id = workerinput.setdefault("markdoctest_trace_id", secrets.token_hex(16))
+            mode = "a"
+        self.file = open(os.path.join(str(config.invocation_params.dir), path), mode, encoding="utf-8")
+        # open spans, the innermost last
+        self._stack: List[dict] = []
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_configure_node(self, node) -> None:  # pytest-xdist controller
+        node.workerinput["markdoctest_trace_id"] = self.trace_id
+
+    def _start(self, kind: str, name: str, file: str, block: str, lineno: int, options: Dict[str, bool]) -> None:
+        self._stack.append(
+            {
+                "trace_id": self.trace_id,
+                "span_id": secrets.token_hex(8),
+                "parent_id": self._stack[-1]["span_id"] if self._stack else None,
+                "name": name,
+                "kind": kind,
+                "start_time": time.time_ns(),
+                "attributes": {
+                    "markdoctest.file": file,
+                    "markdoctest.block": block,
+                    "markdoctest.lineno": lineno,
+                    "markdoctest.options": sorted(name for name, value in options.items() if value),
+                },
+            }
+        )
+
+    def _finish(self, duration: float, status: str, error: Optional[str] = None) -> None:
+        span = self._stack.pop()
+        span["end_time"] = span["start_time"] + int(duration * 1e9)
+        span["duration"] = duration
+        span["status"] = status
+        if error is not None:
+            span["attributes"]["markdoctest.exception"] = error
+        # one write per line, so that lines of xdist workers don't mix
+        self.file.write(json.dumps(span) + "\n")
+        self.file.flush()
+
+    def pytest_markdoctest_block_start(self, file, block, lineno, options) -> None:
+        self._start("block", block, file, block, lineno, options)
+
+    def pytest_markdoctest_block_finish(self, duration, failed) -> None:
+        self._finish(duration, "error" if failed else "ok")
+
+    def pytest_markdoctest_example_start(self, example, file, block, lineno, options) -> None:
+        self._start("example", example.source.strip().split("\n", 1)[0], file, block, lineno, options)
+
+    def pytest_markdoctest_example_finish(self, duration, exception) -> None:
+        error = None if exception is None else "%s: %s" % (type(exception).__name__, exception)
+        self._finish(duration, "ok", error)
+
+    def pytest_unconfigure(self) -> None:
+        self.file.close()
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Rerun edited markdown files, for --markdoctest-watch.
+
+After the tests ran, the session stays alive and watches the markdown
+files it collected, with inotify on Linux, else by polling their mtime.
+A changed file is collected again, and its blocks run from the first one
+that changed. The globals of the blocks before it are restored from the
+checkpoints kept in memory since they last ran, so that an edit near the
+end of a long file only runs the last blocks, in an interpreter that
+already imported their modules.
+"""
+
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+from pathlib import Path
+
+import pytest
+from pytest import Config, Session, TestReport
+
+from typing import Dict, Iterable, List, Optional, Set
+
+# inotify(7) events of a file written, or replaced by a rename as editors
+# saving to a temporary file do.
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+# struct inotify_event {int wd; uint32_t mask, cookie, len; char name[];}
+_EVENT = struct.Struct("iIII")
+
+# time without events after a change, before running the changed files,
+# as editors may write a file in several steps
+_SETTLE = 0.05
+
+
+class InotifyWatcher:
+    """
+    Changes of files, from inotify watches on their directories, which
+    also see files replaced by a rename.
+    """
+
+    def __init__(self, paths: Iterable[Path]):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        init1, add_watch = libc.inotify_init1, libc.inotify_add_watch  # AttributeError if not Linux
+        # IN_CLOEXEC and IN_NONBLOCK are O_CLOEXEC and O_NONBLOCK
+        self.fd = init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.paths = set(paths)
+        # watch descriptor -> watched directory
+        self._directories: Dict[int, Path] = {}
+        for directory in {path.parent for path in self.paths}:
+            wd = add_watch(self.fd, os.fsencode(str(directory)), _IN_MASK)
+            if wd < 0:
+                self.close()
+                raise OSError(ctypes.get_errno(), "inotify_add_watch %s" % directory)
+            self._directories[wd] = directory
+
+    def wait(self, timeout: Optional[float]) -> Set[Path]:
+        """
+        The watched files changed within timeout seconds, waiting forever
+        if timeout is None.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        changed: Set[Path] = set()
+        while ready:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, _, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                directory = self._directories.get(wd)
+                if directory is not None and name:
+                    path = directory / os.fsdecode(name)
+                    if path in self.paths:
+                        changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Changes of files, from their mtime and size, checked every interval.
+    """
+
+    def __init__(self, paths: Iterable[Path], interval: float):
+        self.interval = interval
+        self._stats = {path: _stat(path) for path in paths}
+
+    def wait(self, timeout: Optional[float]) -> Set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path, old in self._stats.items():
+                new = _stat(path)
+                if new != old:
+                    self._stats[path] = new
+                    changed.add(path)
+            if changed:
+                return changed
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+                if delay <= 0:
+                    return changed
+            time.sleep(delay)
+
+    def close(self) -> None:
+        pass
+
+
+def _stat(path: Path):
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def make_watcher(paths: Iterable[Path], interval: float):
+    """
+    An inotify watcher where inotify is available, else a polling one.
+    """
+    paths = list(paths)
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(paths, interval)
+
+
+def _block_key(test) -> tuple:
+    # the content of a block, with the outputs it expects, and its options
+    return test.docstring, sorted(getattr(test, "options", {}).items())
+
+
+class MarkdownWatcher:
+    """
+    After the session ran its tests, rerun the blocks of the markdown
+    files edited since, from the first block that changed.
+    """
+
+    name = "markdoctest-watch"
+
+    def __init__(self, config: Config):
+        if config.getoption("numprocesses", None):
+            raise pytest.UsageError("--markdoctest-watch can't be used with pytest-xdist -n")
+        self.config = config
+        self.interval = float(config.getini("markdoctest_watch_interval"))
+        # path -> collector of a markdown file, and its items, collected last
+        self.files: Dict[Path, pytest.Module] = {}
+        self.items: Dict[Path, List[pytest.Item]] = {}
+        # path -> _block_key of the items of a file when they last ran
+        self.blocks: Dict[Path, List[tuple]] = {}
+        # reports of the blocks being rerun
+        self._reports: Optional[List[TestReport]] = None
+
+    def pytest_collection_finish(self, session: Session) -> None:
+        from pytest_markdoctest.markdown import DoctestMarkdown
+
+        for item in session.items:
+            if isinstance(item.parent, DoctestMarkdown):
+                self.files.setdefault(item.parent.path, item.parent)
+                self.items.setdefault(item.parent.path, []).append(item)
+        for path, items in self.items.items():
+            self.blocks[path] = [_block_key(item.dtest) for item in items]
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtestloop(self, session: Session):
+        outcome = yield
+        if outcome.excinfo is None and self.files and not self.config.option.collectonly:
+            self.watch(session)
+
+    def pytest_runtest_logreport(self, report: TestReport) -> None:
+        if self._reports is not None:
+            self._reports.append(report)
+
+    def watch(self, session: Session) -> None:
+        """
+        Rerun changed files until interrupted.
+        """
+        watcher = make_watcher(self.files, self.interval)
+        self._write_sep("=", "watching %d markdown files, press Ctrl-C to stop" % len(self.files))
+        try:
+            while True:
+                changed = watcher.wait(None)
+                while True:
+                    more = watcher.wait(_SETTLE)
+                    if not more:
+                        break
+                    changed |= more
+                for path in sorted(changed):
+                    self.rerun(session, path)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
+    def rerun(self, session: Session, path: Path) -> None:
+        """
+        Collect a markdown file again, and run its blocks from the first
+        one that changed since they last ran.
+        """
+        from pytest_markdoctest.markdown import DoctestMarkdown
+
+        start = time.perf_counter()
+        old = self.files[path]
+        node = DoctestMarkdown.from_parent(old.parent, path=path)
+        try:
+            items = list(node.collect())
+        except Exception as e:  # e.g. a syntax error in a script block
+            self._write_sep("-", "%s changed" % node.nodeid, red=True)
+            self._write_line("".join(traceback.format_exception_only(type(e), e)).rstrip())
+            return
+        blocks = [_block_key(item.dtest) for item in items]
+        old_blocks = self.blocks[path]
+        first = len(blocks)
+        for i, block in enumerate(blocks):
+            if i >= len(old_blocks) or block != old_blocks[i]:
+                first = i
+                break
+        self.files[path], self.items[path], self.blocks[path] = node, items, blocks
+        if first == len(blocks):
+            self._write_sep("-", "%s changed, no block changed" % node.nodeid)
+            return
+
+        self._write_sep("-", "%s changed, running from %s" % (node.nodeid, items[first].name))
+        todo = items[first:]
+        self._reports = reports = []
+        try:
+            for i, item in enumerate(todo):
+                nextitem = todo[i + 1] if i + 1 < len(todo) else None
+                item.ihook.pytest_runtest_protocol(item=item, nextitem=nextitem)
+        finally:
+            self._reports = None
+        failed = [report for report in reports if report.failed]
+        for report in failed:
+            self._write_sep("_", report.head_line or report.nodeid, red=True)
+            self._write_line(report.longreprtext)
+        passed = sum(1 for report in reports if report.passed and report.when == "call")
+        skipped = sum(1 for report in reports if report.skipped)
+        summary = "%d passed, %d failed" % (passed, len(failed))
+        if skipped:
+            summary += ", %d skipped" % skipped
+        summary += " in %.2fs" % (time.perf_counter() - start)
+        self._write_sep("-", summary, red=bool(failed), green=not failed)
+
+    def _write_sep(self, sep: str, title: str, **markup: bool) -> None:
+        terminalreporter = self.config.pluginmanager.get_plugin("terminalreporter")
+        if terminalreporter is not None:
+            terminalreporter.write_sep(sep, title, **markup)
+
+    def _write_line(self, line: str) -> None:
+        terminalreporter = self.config.pluginmanager.get_plugin("terminalreporter")
+        if terminalreporter is not None:
+            terminalreporter.write_line(line)
@@ -0,0 +1,120 @@
+import sys
+from inspect import cleandoc
+
+import pytest
+from pytest import Pytester
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 8), reason="top-level await requires python >= 3.8")
+
+MD = cleandoc(
+    """
+    # Async
+
+    ```python
+    >>> import asyncio
+    >>> await asyncio.sleep(0)
+    >>> loop = asyncio.get_event_loop()
+    >>> queue = asyncio.Queue()
+    ```
+
+    A task started in a block keeps running in the next ones.
+    ```python
+    async def produce(n):
+        for i in range(n):
+            await queue.put(i)
+
+    task = asyncio.ensure_future(produce(3))
+    ```
+
+    ```python
+    >>> [await queue.get() for _ in range(3)]
+    [0, 1, 2]
+    >>> async def running_loop():
+    ...     return asyncio.get_running_loop()
+    >>> await running_loop() is loop
+    True
+    >>> async def forever():
+    ...     await asyncio.sleep(3600)
+    >>> pending = asyncio.ensure_future(forever())
+    >>> import builtins
+    >>> builtins.markdoctest_loop = loop
+    ```
+    """
+)
+
+
+def test_top_level_await(pytester: Pytester):
+    pytester.makefile(".md", test_async=MD)
+    pytester.makepyfile(
+        test_z_closed="""
+        import builtins
+
+        def test_loop_closed():
+            loop = builtins.__dict__.pop("markdoctest_loop")
+            assert loop.is_closed()
+        """
+    )
+    result = pytester.runpytest_subprocess("-p", "no:xdist")
+    result.assert_outcomes(passed=4)
+
+
+def test_top_level_await_whole_block(pytester: Pytester):
+    pytester.makefile(".md", test_async=MD)
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_whole_block = true
+        """
+    )
+    result = pytester.runpytest_subprocess("-p", "no:xdist", "test_async.md")
+    result.assert_outcomes(passed=3)
+
+
+def test_await_error(pytester: Pytester):
+    md = "```python\n>>> import asyncio\n>>> await asyncio.sleep('x')\n```\n"
+    pytester.makefile(".md", test_error=md)
+    result = pytester.runpytest()
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines(["*await asyncio.sleep('x')*", "*TypeError*"])
+
+
+@pytest.mark.parametrize("block", ["import asyncio", "import asyncio\nawait asyncio.sleep(0)"], ids=["import", "await"])
+def test_current_event_loop_restored(pytester: Pytester, block: str):
+    pytester.makefile(".md", test_a="```python\n%s\n```\n" % block)
+    pytester.makepyfile(
+        test_z="""
+        import asyncio
+
+        def test_event_loop():
+            loop = asyncio.get_event_loop()
+            assert not loop.is_closed()
+            loop.run_until_complete(asyncio.sleep(0))
+        """
+    )
+    result = pytester.runpytest_subprocess("-p", "no:xdist", "-W", "ignore::DeprecationWarning")
+    result.assert_outcomes(passed=2)
+
+
+def test_own_event_loop_restored(pytester: Pytester):
+    pytester.makepyfile(
+        test_a="""
+        import asyncio
+        import builtins
+
+        def test_set_event_loop():
+            builtins.markdoctest_own_loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(builtins.markdoctest_own_loop)
+        """,
+        test_z="""
+        import asyncio
+        import builtins
+
+        def test_event_loop():
+            loop = builtins.__dict__.pop("markdoctest_own_loop")
+            assert asyncio.get_event_loop() is loop
+            loop.close()
+        """,
+    )
+    pytester.makefile(".md", test_b="```python\nimport asyncio\nawait asyncio.sleep(0)\n```\n")
+    result = pytester.runpytest_subprocess("-p", "no:xdist")
+    result.assert_outcomes(passed=3)
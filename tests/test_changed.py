@@ -0,0 +1,164 @@
+from inspect import cleandoc
+
+from pytest import MonkeyPatch, Pytester
+
+import pytest_markdoctest.changed
+import pytest_markdoctest.fingerprint
+from pytest_markdoctest.fingerprint import tracked_modules
+
+BLOCKS = [
+    cleandoc(
+        """
+        ```python
+        with open("log", "a") as f:
+            f.write("a")
+        a = 1
+        ```
+        """
+    ),
+    cleandoc(
+        """
+        ```python
+        >>> b = a + 1
+        >>> b
+        2
+        ```
+        """
+    ),
+    cleandoc(
+        """
+        ```python
+        >>> c = 3
+        >>> c
+        3
+        ```
+        """
+    ),
+]
+
+
+def test_changed_blocks(pytester: Pytester):
+    pytester.makefile(".md", test_changed="\n\n".join(BLOCKS))
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(passed=3)
+
+    # nothing changed
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(deselected=3)
+
+    # the second block changed, the first one is replayed for it and the
+    # third one depends on it.
+    changed = BLOCKS[1].replace("2", "3").replace("+ 1", "+ 2")
+    pytester.makefile(".md", test_changed="\n\n".join([BLOCKS[0], changed, BLOCKS[2]]))
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(passed=2, deselected=1)
+    assert pytester.path.joinpath("log").read_text() == "aa"
+
+
+def test_changed_settings(pytester: Pytester):
+    pytester.makefile(".md", test_settings="\n\n".join(BLOCKS))
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(passed=3)
+
+    # blocks run again with other option flags or limits
+    for ini in ("doctest_optionflags = NORMALIZE_WHITESPACE", "markdoctest_timeout = 10"):
+        pytester.makeini("[pytest]\n" + ini)
+        result = pytester.runpytest("--markdoctest-changed")
+        result.assert_outcomes(passed=3)
+        result = pytester.runpytest("--markdoctest-changed")
+        result.assert_outcomes(deselected=3)
+
+
+def test_failed_blocks_run_again(pytester: Pytester):
+    pytester.makefile(".md", test_failed="\n\n".join([BLOCKS[0], BLOCKS[1].replace("2\n", "4\n")]))
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(passed=1, failed=1)
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(failed=1, deselected=1)
+
+
+def test_changed_independent_block(pytester: Pytester):
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_block_dependencies = true
+        """
+    )
+    pytester.makefile(".md", test_independent="\n\n".join(BLOCKS))
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(passed=3)
+
+    # the third block does not depend on the others
+    pytester.makefile(".md", test_independent="\n\n".join(BLOCKS[:2] + [BLOCKS[2].replace("3", "4")]))
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(passed=1, deselected=2)
+    assert pytester.path.joinpath("log").read_text() == "a"
+
+
+def test_changed_module(pytester: Pytester):
+    pytester.syspathinsert()
+    pytester.makepyfile(mymod="def f():\n    return 1\n", otherpkg="import mymod\n")
+    pytester.makeconftest("import otherpkg\n")
+    pytester.makefile(
+        ".md",
+        test_module=cleandoc(
+            """
+            ```python
+            >>> from mymod import f
+            >>> f()
+            1
+            ```
+
+            ```python
+            >>> import otherpkg
+            ```
+            """
+        ),
+    )
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(passed=2)
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(deselected=2)
+
+    # mymod is used by the file, though it was imported by the conftest
+    pytester.makepyfile(mymod="def f():\n    # changed\n    return 1\n")
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(passed=2)
+    result = pytester.runpytest("--markdoctest-changed")
+    result.assert_outcomes(deselected=2)
+
+
+def test_tracked_modules():
+    # the standard library is not tracked, modules are followed through
+    # the globals and the modules they reference.
+    assert tracked_modules(["os", "json"], []) == {}
+    files = tracked_modules([], [{"ChangedSelector": pytest_markdoctest.changed.ChangedSelector}])
+    assert {"pytest_markdoctest", "pytest_markdoctest.changed", "pytest_markdoctest.fingerprint"} <= set(files)
+
+
+def test_tracked_modules_memo(monkeypatch: MonkeyPatch):
+    globs = [{"ChangedSelector": pytest_markdoctest.changed.ChangedSelector}]
+    memo: dict = {}
+    files = tracked_modules([], globs, memo)
+    assert set(files) <= set(memo)
+
+    def fail(name, module):
+        raise AssertionError("%s walked again" % name)
+
+    # modules are walked once per session
+    monkeypatch.setattr(pytest_markdoctest.fingerprint, "_module_refs", fail)
+    assert tracked_modules([], globs, memo) == files
+
+
+def test_modules_hashed_once(pytester: Pytester, monkeypatch: MonkeyPatch):
+    pytester.syspathinsert()
+    pytester.makepyfile(mymod="X = 1\n")
+    for name in ("test_a", "test_b", "test_c"):
+        pytester.makefile(".md", **{name: "```python\n>>> import mymod\n>>> mymod.X\n1\n```\n"})
+    hashed = []
+    file_hash = pytest_markdoctest.fingerprint._file_hash
+    monkeypatch.setattr(pytest_markdoctest.fingerprint, "_file_hash", lambda f: hashed.append(f) or file_hash(f))
+    result = pytester.runpytest("-p", "no:xdist", "--markdoctest-changed")
+    result.assert_outcomes(passed=3)
+    assert len(hashed) == len(set(hashed))
+    assert any(f.endswith("mymod.py") for f in hashed)
@@ -0,0 +1,86 @@
+import os
+import threading
+from inspect import cleandoc
+
+from pytest import Pytester
+
+from pytest_markdoctest import parse_markdown
+from pytest_markdoctest.checkpoint import CheckpointStore, chain_hashes, restore, snapshot
+
+MD = cleandoc(
+    """
+    ```python
+    import os
+    with open("log", "a") as f:
+        f.write("1")
+    ```
+
+    ```python
+    def square(x):
+        return x * x
+    a = square(3)
+    with open("log", "a") as f:
+        f.write("2")
+    ```
+
+    ```python
+    >>> os.path.basename("x/y")
+    'y'
+    >>> a
+    9
+    ```
+    """
+)
+
+
+def test_snapshot_restore():
+    globs = {"__name__": "__main__", "os": os, "a": [1, 2], "lock": threading.Lock()}
+    values, skipped = snapshot(globs)
+    assert skipped == {"lock"}
+    restored, failed = restore(values)
+    assert failed == set()
+    assert restored == {"__name__": "__main__", "os": os, "a": [1, 2]}
+
+
+def test_partial_checkpoint(tmp_path):
+    store = CheckpointStore(tmp_path, 8)
+    store.save("h", {"a": 1, "lock": threading.Lock()})
+    assert "h" in store
+    assert store.load("h", {"a"}) == {"a": 1}
+    # a later block may use the value that was not saved
+    assert store.load("h", {"a", "lock"}) is None
+    assert store.load("missing", set()) is None
+
+
+def test_chain_hashes():
+    a, b, c = parse_markdown(MD, "a.md")
+    hashes = chain_hashes([a, b, c])
+    assert len(set(hashes)) == 3
+    # a block's hash depends on the blocks before it
+    assert chain_hashes([b, c])[1] != hashes[2]
+    assert chain_hashes(parse_markdown(MD, "b.md")) == hashes
+
+
+def test_resume_from_checkpoint(pytester: Pytester):
+    pytester.makefile(".md", MD)
+    result = pytester.runpytest("--markdoctest-checkpoint")
+    result.assert_outcomes(passed=3)
+    assert pytester.path.joinpath("log").read_text() == "12"
+    assert len(list(pytester.path.joinpath(".pytest_cache", "d", "markdoctest-checkpoints").glob("*.pickle"))) == 3
+
+    # the last block resumes from the checkpoint after the second one
+    result = pytester.runpytest("--markdoctest-checkpoint", "test_resume_from_checkpoint.md::<python block at line 15>")
+    result.assert_outcomes(passed=1)
+    assert pytester.path.joinpath("log").read_text() == "12"
+
+
+def test_replay_without_checkpoint(pytester: Pytester):
+    pytester.makefile(".md", MD)
+    result = pytester.runpytest("--markdoctest-checkpoint", "test_replay_without_checkpoint.md::<python block at line 15>")
+    result.assert_outcomes(passed=1)
+    assert pytester.path.joinpath("log").read_text() == "12"
+
+    # the replayed blocks saved their checkpoints
+    result = pytester.runpytest("--markdoctest-checkpoint", "test_replay_without_checkpoint.md::<python block at line 15>")
+    result.assert_outcomes(passed=1)
+    assert pytester.path.joinpath("log").read_text() == "12"
@@ -0,0 +1,88 @@
+from inspect import cleandoc
+
+import pytest_markdoctest.cache
+from pytest import MonkeyPatch, Pytester
+
+
+def test_code_cache(pytester: Pytester, monkeypatch: MonkeyPatch):
+    md = cleandoc(
+        """
+        ```python
+        def f(x):
+            return 1 / x
+        ```
+
+        ```python
+        >>> f(2)
+        0.5
+        >>> f(0)
+        ```
+        """
+    )
+    pytester.makefile(".md", md)
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_code_cache_size = 8
+        """
+    )
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1, failed=1)
+    assert len(list(pytester.path.joinpath(".pytest_cache", "d", "markdoctest-code").glob("*.marshal"))) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("compiled again")
+
+    # the second run executes the cached code objects.
+    monkeypatch.setattr(pytest_markdoctest.cache, "compile", fail, raising=False)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1, failed=1)
+    result.stdout.fnmatch_lines(
+        [
+            "*f(0)*",
+            "*line 2, in f*",
+            "ZeroDivisionError: division by zero",
+        ]
+    )
+
+
+def test_nested_doctest(pytester: Pytester):
+    # a doctest run by an example is not compiled as the example
+    md = cleandoc(
+        '''
+        ```python
+        def f():
+            """
+            >>> 1 + 1
+            2
+            >>> print("nested")
+            nested
+            """
+        ```
+
+        ```python
+        >>> import doctest
+        >>> doctest.run_docstring_examples(f, {})
+        ```
+        '''
+    )
+    pytester.makefile(".md", md)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=2)
+
+
+def test_doctest_module_untouched(pytester: Pytester):
+    # examples are compiled and run without patching the doctest module,
+    # seen by other threads and plugins.
+    md = cleandoc(
+        """
+        ```python
+        >>> import doctest
+        >>> hasattr(doctest, "compile"), hasattr(doctest, "exec")
+        (False, False)
+        ```
+        """
+    )
+    pytester.makefile(".md", md)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1)
@@ -0,0 +1,128 @@
+from inspect import cleandoc
+
+import pytest
+from pytest import Pytester
+from pytest_markdoctest.code_classes import DEFAULT, CodeClasses, attribute_classes
+
+MD = cleandoc(
+    """
+    ```python title="setup.py"
+    x = 1
+    ```
+
+    ```python3
+    >>> x + 1
+    2
+    ```
+
+    ```ipython
+    In the shell:
+    >>> x + 2
+    3
+    ```
+
+    ```{.python .doctest #example}
+    >>> x + 3
+    4
+    ```
+
+    ```{.python}
+    >>> x + 4
+    0
+    ```
+
+    ```pycon
+    >>> x + 5
+    0
+    ```
+    """
+)
+
+INI = cleandoc(
+    """
+    [pytest]
+    markdoctest_code_classes =
+        python3 = auto
+        ipython = repl
+        {.python .doctest} = auto
+        pycon = skip
+    """
+)
+
+
+def test_attribute_classes():
+    assert attribute_classes(" {.python .doctest #id key=value}") == {"python", "doctest"}
+    assert attribute_classes("python {.doctest}") == frozenset()
+
+
+def test_strategy():
+    code_classes = CodeClasses.parse(["python3 = repl", "{.doctest .python} = script", "py = skip"])
+    assert code_classes.strategy("python", "python") == "auto"
+    assert code_classes.strategy("python3", "python3") == "repl"
+    assert code_classes.strategy("py", "py") is None
+    assert code_classes.strategy("js", "js") is None
+    assert code_classes.strategy(None, "{.python .doctest #x}") == "script"
+    assert code_classes.strategy(None, "{.python}") is None
+    assert code_classes.block_class(None, "{.python .doctest #x}") == "python"
+    assert code_classes.tested == {"python", "python3", "pycon", None}
+    assert DEFAULT.tested == {"python", "py", "pycon"}
+
+
+@pytest.mark.parametrize("line", ["python3", "python3 = unknown", "{#id} = auto"])
+def test_invalid_entries(line):
+    with pytest.raises(ValueError):
+        CodeClasses.parse([line])
+
+
+def test_code_classes(pytester: Pytester):
+    pytester.makefile(".md", test_classes=MD)
+    pytester.makefile(".ini", tox=INI)
+    result = pytester.runpytest("-v")
+    result.assert_outcomes(passed=4)
+    result.stdout.fnmatch_lines(
+        [
+            "*<python block at line 1>*PASSED*",
+            "*<python3 block at line 5>*PASSED*",
+            "*<ipython block at line 10>*PASSED*",
+            "*<python block at line 16>*PASSED*",
+        ]
+    )
+
+
+def test_registered_strategy(pytester: Pytester):
+    pytester.makeconftest(
+        """
+        from pytest_markdoctest.code_classes import register_strategy
+        from pytest_markdoctest.markdown import ReplBlockParser
+
+        class ShellParser(ReplBlockParser):
+            # "$ python -c CODE" lines run CODE
+            def parse(self, string, name="<string>", lines=None):
+                string = string.replace("$ python -c ", ">>> ")
+                return super().parse(string, name)
+
+        register_strategy("shell", ShellParser())
+        """
+    )
+    pytester.makefile(".md", test_shell="```console\n$ python -c print(1 + 1)\n2\n```\n")
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_code_classes = console = shell
+        """
+    )
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1)
+
+
+def test_invalid_ini(pytester: Pytester):
+    pytester.makefile(".md", test_a="```python\n>>> 1\n1\n```\n")
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_code_classes = python = unknown
+        """
+    )
+    result = pytester.runpytest()
+    result.assert_outcomes(errors=1)
+    result.stdout.fnmatch_lines(["*markdoctest_code_classes: unknown strategy 'unknown' for 'python'*"])
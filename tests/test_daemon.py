@@ -0,0 +1,81 @@
+import os
+import socket
+import subprocess
+import sys
+from inspect import cleandoc
+
+import pytest
+from pytest import Pytester
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "fork") or not hasattr(socket, "AF_UNIX"), reason="the daemon requires os.fork and Unix sockets"
+)
+
+MD = cleandoc(
+    """
+    ```python
+    >>> import os, preloaded
+    >>> preloaded.PID == os.getppid()
+    True
+    >>> x = 1
+    ```
+
+    ```python
+    >>> x + 1
+    3
+    ```
+
+    ```python
+    >>> x / 0
+    ```
+
+    ```python
+    >>> import pytest
+    >>> pytest.skip("not now")
+    ```
+    """
+)
+
+PRELOADED = cleandoc(
+    """
+    import os
+
+    PID = os.getpid()
+    with open("imports.txt", "a") as f:
+        f.write("import\\n")
+    """
+)
+
+
+@pytest.fixture
+def daemon(pytester: Pytester):
+    pytester.makepyfile(preloaded=PRELOADED)
+    popen = subprocess.Popen(
+        [sys.executable, "-m", "pytest_markdoctest.daemon", "md.sock", "preloaded"],
+        cwd=str(pytester.path),
+        stdout=subprocess.PIPE,
+    )
+    try:
+        assert b"listening" in popen.stdout.readline()
+        yield "md.sock"
+    finally:
+        popen.terminate()
+        popen.wait(30)
+        popen.stdout.close()
+
+
+def test_daemon(pytester: Pytester, daemon: str):
+    pytester.makefile(".md", test_daemon=MD)
+    for _ in range(2):
+        result = pytester.runpytest("-p", "no:xdist", "--markdoctest-daemon=" + daemon)
+        result.assert_outcomes(passed=1, failed=2, skipped=1)
+        result.stdout.fnmatch_lines(["*Expected:", "*3", "*Got:", "*2", "*ZeroDivisionError: division by zero"])
+    # the module was imported once, by the daemon
+    assert (pytester.path / "imports.txt").read_text() == "import\n"
+
+
+def test_daemon_not_running(pytester: Pytester):
+    pytester.makefile(".md", test_daemon="```python\n>>> 1\n1\n```\n")
+    result = pytester.runpytest("--markdoctest-daemon=missing.sock")
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines(["*DaemonError: can't connect to the markdoctest daemon at *missing.sock*"])
@@ -0,0 +1,166 @@
+from inspect import cleandoc
+
+from pytest import Pytester
+
+from pytest_markdoctest import parse_markdown
+from pytest_markdoctest.dependency import BlockDependencies
+
+
+def dependencies(*blocks):
+    md = "\n\n".join("```python\n%s\n```" % block for block in blocks)
+    return BlockDependencies.analyze(parse_markdown(md, "a.md"))
+
+
+def test_def_use():
+    deps = dependencies(
+        "import os",
+        "a = 1",
+        "b = 2",
+        "def f():\n    return a",
+        ">>> f()\n1",
+        ">>> os.sep == '/'\nTrue",
+    )
+    assert deps.parents == [set(), set(), set(), {1}, {3}, {0}]
+    assert deps.ancestors(4) == [1, 3]
+    assert deps.components() == [[0, 5], [1, 3, 4], [2]]
+    assert deps.restrict([1, 3, 4]).parents == [set(), {0}, {1}]
+
+
+def test_mutation():
+    deps = dependencies(
+        "items = []",
+        "items.append(1)",
+        ">>> items\n[1]",
+        "class C:\n    pass",
+        "C.x = 1",
+        ">>> C.x\n1",
+    )
+    # using a name bound by assignment may mutate it
+    assert deps.ancestors(2) == [0, 1]
+    assert deps.ancestors(5) == [3, 4]
+
+
+def test_late_binding():
+    deps = dependencies(
+        "def area(r):\n    return math.pi * r * r",
+        "import math",
+        ">>> area(1)\n3.141592653589793",
+        "x = 1",
+        ">>> x\n1",
+    )
+    # area reads math when called, so the block importing it comes along
+    assert deps.parents == [set(), {0}, {0, 1}, set(), {3}]
+    assert deps.ancestors(2) == [0, 1]
+    assert deps.components() == [[0, 1, 2], [3, 4]]
+
+
+def test_dynamic_block():
+    deps = dependencies(
+        "a = 1",
+        "b = 2",
+        "globals()['c'] = a",
+        ">>> b\n2",
+    )
+    assert deps.parents == [set(), set(), {0, 1}, {2}]
+    assert deps.components() == [[0, 1, 2, 3]]
+
+
+def test_separate_namespaces(pytester: Pytester):
+    path = pytester.makefile(
+        ".md",
+        cleandoc(
+            """
+            ```python
+            a = 1
+            ```
+
+            ```python
+            b = 2
+            ```
+
+            ```python
+            >>> a
+            1
+            ```
+            """
+        ),
+    )
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_block_dependencies = true
+        """
+    )
+    items = pytester.getitems(path)
+    assert items[0].runner is items[2].runner
+    assert items[1].runner is not items[0].runner
+    assert items[1].runner.globs is not items[0].runner.globs
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=3)
+
+
+def test_replay_ancestors(pytester: Pytester):
+    pytester.makefile(
+        ".md",
+        cleandoc(
+            """
+            ```python
+            with open("log", "a") as log:
+                log.write("a")
+            a = 1
+            ```
+
+            ```python
+            with open("log", "a") as log:
+                log.write("b")
+            ```
+
+            ```python
+            >>> a
+            1
+            ```
+            """
+        ),
+    )
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_block_dependencies = true
+        """
+    )
+    result = pytester.runpytest("--markdoctest-checkpoint", "test_replay_ancestors.md::<python block at line 12>")
+    result.assert_outcomes(passed=1)
+    assert pytester.path.joinpath("log").read_text() == "a"
+
+
+def test_late_binding_groups(pytester: Pytester):
+    pytester.makefile(
+        ".md",
+        cleandoc(
+            """
+            ```python
+            def area(r):
+                return math.pi * r * r
+            ```
+
+            ```python
+            import math
+            ```
+
+            ```python
+            >>> area(1)
+            3.141592653589793
+            ```
+            """
+        ),
+    )
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_block_dependencies = true
+        """
+    )
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=3)
+    result = pytester.runpytest("--markdoctest-checkpoint", "test_late_binding_groups.md::<python block at line 10>")
+    result.assert_outcomes(passed=1)
@@ -0,0 +1,145 @@
+import sys
+import threading
+from inspect import cleandoc
+
+import pytest
+from pytest import Pytester
+from pytest_markdoctest.limits import BlockLimits, BlockTimeout, parse_size, split_limits
+
+
+def test_parse_size():
+    assert parse_size("1024") == 1024
+    assert parse_size("512M") == 512 << 20
+    assert parse_size("1.5g") == 3 << 29
+    assert parse_size("64KB") == 64 << 10
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_split_limits():
+    content, limits = split_limits("doctest: +SKIP, +TIMEOUT=2.5, +MAXRSS=1M", "test.md", 0)
+    assert content.split(",")[0] == "doctest: +SKIP"
+    assert limits == {"TIMEOUT": 2.5, "MAXRSS": 1 << 20}
+    with pytest.raises(ValueError, match="line 3 of the doctest for test.md has an invalid option: '\\+TIMEOUT=soon'"):
+        split_limits("doctest: +TIMEOUT=soon", "test.md", 2)
+
+
+def test_watchdog_only_raises_in_examples():
+    # outside the main thread, a watchdog thread raises BlockTimeout, which
+    # must not reach the runner when an example finishes as it times out.
+    errors = []
+
+    def run():
+        try:
+            for _ in range(100):
+                with BlockLimits(0.002, 0) as limits:
+                    try:
+                        while True:
+                            with limits.example():
+                                sum(range(100))
+                    except BlockTimeout:
+                        pass
+                    for _ in range(10000):
+                        pass
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    assert errors == []
+
+
+MD = cleandoc(
+    """
+    ```python
+    >>> x = 1
+    ```
+
+    <!-- doctest: +TIMEOUT=0.5 -->
+    ```python
+    >>> x += 1
+    >>> while True:
+    ...     pass
+    >>> x += 1
+    ```
+
+    ```python
+    >>> import time
+    >>> time.sleep(0.01)
+    >>> x
+    2
+    ```
+    """
+)
+
+
+@pytest.mark.parametrize("subprocess", [False, True])
+def test_timeout(pytester: Pytester, subprocess: bool):
+    pytester.makefile(".md", test_timeout=MD)
+    if subprocess:
+        result = pytester.runpytest_subprocess()
+    else:
+        result = pytester.runpytest()
+    result.assert_outcomes(passed=2, failed=1)
+    result.stdout.fnmatch_lines(
+        [
+            "008 >>> while True:",
+            "*BlockTimeout: the block exceeded its TIMEOUT=0.5s",
+            "*test_timeout.md:8: UnexpectedException",
+        ]
+    )
+
+
+def test_timeout_ini(pytester: Pytester):
+    pytester.makefile(".md", test_timeout=MD)
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_timeout = 0.001
+        """
+    )
+    result = pytester.runpytest("--doctest-continue-on-failure")
+    # the block with a directive is not limited by the ini option
+    result.assert_outcomes(passed=1, failed=2)
+    result.stdout.fnmatch_lines(["*BlockTimeout: the block exceeded its TIMEOUT=0.001s"])
+
+
+def test_invalid_limits(pytester: Pytester):
+    pytester.makefile(".md", test_limits="<!-- doctest: +MAXRSS=big -->\n```python\n>>> 1\n1\n```\n")
+    result = pytester.runpytest()
+    result.stdout.fnmatch_lines(["*ValueError: line 1 of the doctest for <python block at line 2> has an invalid option: *"])
+
+    pytester.makefile(".md", test_limits="```python\n>>> 1\n1\n```\n")
+    pytester.makeini("[pytest]\nmarkdoctest_maxrss = big\n")
+    result = pytester.runpytest()
+    result.stdout.fnmatch_lines(["*UsageError: markdoctest_maxrss: invalid value 'big'"])
+
+
+MAXRSS_MD = cleandoc(
+    """
+    <!-- doctest: +MAXRSS=64M -->
+    ```python
+    >>> import time
+    >>> small = bytearray(1 << 20)
+    >>> huge = bytearray(1 << 28); time.sleep(1)
+    >>> huge = None
+    ```
+
+    ```python
+    >>> huge = bytearray(1 << 27)
+    >>> len(huge)
+    134217728
+    ```
+    """
+)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="MAXRSS is not enforced on Windows")
+def test_maxrss(pytester: Pytester):
+    pytester.makefile(".md", test_maxrss=MAXRSS_MD)
+    result = pytester.runpytest_subprocess()
+    result.assert_outcomes(passed=1, failed=1)
+    result.stdout.fnmatch_lines(
+        ["005 >>> huge = bytearray(1 << 28); time.sleep(1)", "*BlockMemoryError: the block exceeded its MAXRSS*"]
+    )
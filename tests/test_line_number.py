@@ -1,5 +1,9 @@
+import ast
+import doctest
 from inspect import cleandoc
 from pytest import Pytester
+from pytest_markdoctest import ReplBlockParser, ScriptBlockParser
+from pytest_markdoctest.scanner import LineIndex, scan_code_blocks
 
 
 def test_line_number_in_error_msg(pytester: Pytester):
@@ -104,3 +108,43 @@ def test_line_number_in_error_msg(pytester: Pytester):
         ],
         consecutive=True,
     )
+
+
+def test_line_index():
+    text = "a\nbc\n\nd"
+    index = LineIndex.from_text(text)
+    assert [index.lineno(i) for i in range(len(text) + 1)] == [0, 0, 1, 1, 1, 2, 3, 3]
+    assert [index.line_start(i) for i in range(4)] == [0, 2, 5, 6]
+    view = index.relative(5)
+    assert view.lineno(0) == 0 and view.lineno(1) == 1
+    assert view.line_start(1) == 1
+
+
+def test_repl_example_lineno_same_as_doctest():
+    text = cleandoc(
+        """
+        some text
+        ```python
+        >>> x = 1
+        >>> for i in range(2):
+        ...     print(i)
+        0
+        1
+        >>> x
+        1
+        ```
+        """
+    )
+    (block,) = scan_code_blocks(text)
+    content = block.code_content
+    examples = ReplBlockParser().get_examples(content)
+    assert [eg.lineno for eg in examples] == [eg.lineno for eg in doctest.DocTestParser().get_examples(content)]
+    examples = [x for x in ReplBlockParser().parse(content, lines=block.lines) if isinstance(x, doctest.Example)]
+    assert [eg.lineno for eg in examples] == [0, 1, 5]
+
+
+def test_split_into_statements():
+    source = "import math\nif True:\n    x = 1\ny = 2; z = 3\n"
+    tree = ast.parse(source)
+    statements = ScriptBlockParser()._split_into_statements(source, tree)
+    assert statements == ["import math", "if True:\n    x = 1", "y = 2", "z = 3"]
@@ -159,3 +159,19 @@ def test_general(pytester: Pytester):
     )
     result = pytester.runpytest()
     result.assert_outcomes(passed=3)
+
+
+def test_lazy_import(pytester: Pytester):
+    pytester.makepyfile(
+        test_modules="""
+        import sys
+
+        def test_modules():
+            assert "pytest_markdoctest" in sys.modules
+            assert "pytest_markdoctest.markdown" not in sys.modules
+        """
+    )
+    result = pytester.runpytest_subprocess("-p", "no:xdist")
+    result.assert_outcomes(passed=1)
+    # names moved out of the plugin module are still importable from it
+    assert pytest_markdoctest.MarkDoctestRunner.__module__ == "pytest_markdoctest.markdown"
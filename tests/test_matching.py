@@ -0,0 +1,59 @@
+import os
+from pathlib import Path, PurePath
+
+import pytest
+from _pytest.pathlib import fnmatch_ex
+from pytest import Pytester
+from pytest_markdoctest.matching import MarkdownMatcher
+
+PATTERNS = [
+    "test*.md",
+    "README.md",
+    "*_doc.md",
+    "docs/*.md",
+    "docs/**/guide/*.md",
+    "tutorial?.md",
+    "[ab]*.md",
+    os.path.abspath("abs") + "/*.md",
+]
+
+PATHS = [
+    "test_foo.md",
+    "README.md",
+    "readme.md",
+    "api_doc.md",
+    "docs/index.md",
+    "docs/sub/guide/start.md",
+    "other/docs/index.md",
+    "tutorial1.md",
+    "tutorial10.md",
+    "a.md",
+    "c.md",
+    "abs/x.md",
+]
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_same_as_fnmatch_ex(pattern: str):
+    matcher = MarkdownMatcher([pattern])
+    for path in PATHS:
+        for p in (PurePath(path), PurePath(os.path.abspath(path)), PurePath("/root", path)):
+            assert matcher.match(p) == fnmatch_ex(pattern, p), (pattern, p)
+
+
+def test_combined_patterns():
+    matcher = MarkdownMatcher(PATTERNS)
+    for path in PATHS:
+        p = Path(os.path.abspath(path))
+        assert matcher.match(p) == any(fnmatch_ex(pattern, p) for pattern in PATTERNS), p
+
+
+def test_collect_patterns(pytester: Pytester):
+    md = "```python\n>>> 1\n1\n```\n"
+    pytester.makefile(".md", test_a=md, guide=md, notes=md)
+    result = pytester.runpytest("--collect-only", "-q", "--doctest-markdown=test*.md", "--doctest-markdown=guide.md")
+    result.stdout.fnmatch_lines(["guide.md::*", "test_a.md::*"])
+    result.stdout.no_fnmatch_line("notes.md::*")
+    # files given explicitly are always collected
+    result = pytester.runpytest("--collect-only", "-q", "notes.md")
+    result.stdout.fnmatch_lines(["notes.md::*"])
@@ -0,0 +1,119 @@
+import doctest
+import random
+from inspect import cleandoc
+
+import pytest
+from pytest import Pytester
+from pytest_markdoctest.output import BoundedOutput, StreamMatcher, TruncatedOutput
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_stream_matcher(seed: int):
+    # same result as doctest, whatever the chunks the output is written in
+    rng = random.Random(seed)
+    for _ in range(2000):
+        got = "".join(rng.choice("ab\n") for _ in range(rng.randint(0, 10)))
+        want = "".join(rng.choice(["a", "b", "\n", "..."]) for _ in range(rng.randint(0, 6)))
+        ellipsis = rng.random() < 0.8
+        matcher = StreamMatcher(want, ellipsis)
+        i = 0
+        while i < len(got):
+            n = rng.randint(1, 4)
+            matcher.feed(got[i : i + n])
+            i += n
+        assert matcher.matched() == (got == want or ellipsis and doctest._ellipsis_match(want, got)), (want, got)
+
+
+def test_bounded_output():
+    out = BoundedOutput(10)
+    out.write("abc")
+    assert out.getvalue() == "abc\n"
+    out.truncate(0)
+
+    out.expect("0\n1\n...\n9999\n", doctest.ELLIPSIS)
+    for i in range(10000):
+        print(i, file=out)
+    assert out.getvalue() == "0\n1\n...\n9999\n"
+    out.truncate(0)
+
+    out.expect("0\n", 0)
+    for i in range(10000):
+        print(i, file=out)
+    assert sum(map(len, out._head)) + sum(map(len, out._tail)) <= 2 * 10
+    value = out.getvalue()
+    assert isinstance(value, TruncatedOutput)
+    assert value.startswith("0\n1\n2\n... 48880 characters not shown")
+    assert value.endswith("markdoctest_output_limit ...\n9999\n")
+
+
+MD = cleandoc(
+    """
+    ```python
+    >>> for i in range(1000):
+    ...     print(i)
+    0
+    1
+    ...
+    999
+    ```
+
+    ```python
+    for i in range(100000):
+        print("training step", i)
+    ```
+
+    ```python
+    >>> for i in range(1000):
+    ...     print(i)
+    0
+    1
+    2
+    ```
+    """
+)
+
+
+def test_output_limit(pytester: Pytester):
+    pytester.makefile(".md", test_output=MD)
+    pytester.makeini(
+        """
+        [pytest]
+        doctest_optionflags = ELLIPSIS
+        markdoctest_output_limit = 64
+        """
+    )
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=2, failed=1)
+    result.stdout.fnmatch_lines(
+        ["*+3", "*+... * characters not shown, the output exceeded markdoctest_output_limit ...", "*+999"]
+    )
+
+
+def test_output_limit_other_flags(pytester: Pytester):
+    # outputs compared with other flags are kept whole
+    md = cleandoc(
+        """
+        ```python
+        >>> print(" ".join(map(str, range(100))))
+        0 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19
+        20 21 22 23 24 25 26 27 28 29 30 31 32 33 34 35 36 37 38 39
+        40 41 42 43 44 45 46 47 48 49 50 51 52 53 54 55 56 57 58 59
+        60 61 62 63 64 65 66 67 68 69 70 71 72 73 74 75 76 77 78 79
+        80 81 82 83 84 85 86 87 88 89 90 91 92 93 94 95 96 97 98 99
+        >>> print("a" * 40 + "\\n\\n" + "b" * 40)
+        aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa
+        <BLANKLINE>
+        bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb
+        ```
+        """
+    )
+    pytester.makefile(".md", test_output=md)
+    pytester.makeini(
+        """
+        [pytest]
+        doctest_optionflags = NORMALIZE_WHITESPACE
+        markdoctest_output_limit = 32
+        """
+    )
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1)
@@ -0,0 +1,89 @@
+from inspect import cleandoc
+from pathlib import Path
+
+from pytest import MonkeyPatch, Pytester
+
+from pytest_markdoctest.cache import ParseCache
+from pytest_markdoctest.parallel import CollectPool
+
+
+def test_collect_workers(pytester: Pytester, monkeypatch: MonkeyPatch):
+    # files whose doctests came from the pool, not parsed by their collector
+    pooled = []
+    get = CollectPool.get
+
+    def spy(self, path):
+        tests = get(self, path)
+        if tests is not None:
+            pooled.append(path.name)
+        return tests
+
+    monkeypatch.setattr(CollectPool, "get", spy)
+    md = cleandoc(
+        """
+        ```python
+        import math
+        ```
+
+        ```python
+        >>> math.sqrt(4)
+        2.0
+        ```
+        """
+    )
+    pytester.makefile(".md", test_a=md, test_b=md, not_collected=md)
+    pytester.mkdir("docs").joinpath("test_c.md").write_text(md)
+    pytester.mkdir("node_modules").joinpath("test_d.md").write_text(md)
+    pytester.makefile(".md", test_syntax_error="```python\nx = (\n```")
+
+    result = pytester.runpytest("--markdoctest-collect-workers=2", "--continue-on-collection-errors")
+    result.assert_outcomes(passed=6, errors=1)
+    result.stdout.fnmatch_lines(["ERROR test_syntax_error.md*"])
+    assert sorted(pooled) == ["test_a.md", "test_b.md", "test_c.md"]
+
+    # pre-parsed files are stored in the parse cache.
+    pooled.clear()
+    result = pytester.runpytest("--markdoctest-collect-workers=2", "-p", "no:cacheprovider", "docs")
+    result.assert_outcomes(passed=2)
+    assert pooled == ["test_c.md"]
+    pooled.clear()
+    parsed = []
+    parse_cache_get = ParseCache.get
+
+    def spy_cache(self, key, filename):
+        tests = parse_cache_get(self, key, filename)
+        if tests is not None:
+            parsed.append(Path(filename).name)
+        return tests
+
+    monkeypatch.setattr(ParseCache, "get", spy_cache)
+    result = pytester.runpytest("--markdoctest-collect-workers=2", "test_a.md", "not_collected.md")
+    result.assert_outcomes(passed=4)
+    # both files have the content of test_a.md, found in the parse cache by
+    # the workers
+    assert sorted(pooled) == sorted(parsed) == ["not_collected.md", "test_a.md"]
+
+
+def test_collect_workers_ignored(pytester: Pytester, monkeypatch: MonkeyPatch):
+    submitted = []
+    shutdown = CollectPool.shutdown
+
+    def spy(self):
+        submitted.extend(path.name for path in self.futures)
+        shutdown(self)
+
+    monkeypatch.setattr(CollectPool, "get", lambda self, path: None)
+    monkeypatch.setattr(CollectPool, "shutdown", spy)
+    md = "```python\n>>> 1\n1\n```\n"
+    pytester.makefile(".md", test_a=md, test_no_fence="# no python here\n")
+    pytester.mkdir("ignored").joinpath("test_b.md").write_text(md)
+    pytester.mkdir("by_glob").joinpath("test_c.md").write_text(md)
+    pytester.mkdir("conftest_ignored").joinpath("test_d.md").write_text(md)
+    pytester.makeconftest("collect_ignore = ['conftest_ignored']")
+    pytester.mkdir("docs").joinpath("test_e.md").write_text(md)
+    (pytester.path / "link").symlink_to(pytester.path / "docs", target_is_directory=True)
+
+    result = pytester.runpytest("--markdoctest-collect-workers=2", "--ignore=ignored", "--ignore-glob=*_glob")
+    result.assert_outcomes(passed=3)
+    # link/test_e.md is docs/test_e.md, submitted once
+    assert sorted(submitted) == ["test_a.md", "test_e.md"]
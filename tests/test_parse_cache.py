@@ -0,0 +1,108 @@
+import doctest
+import os
+from inspect import cleandoc
+
+import pytest_markdoctest.cache
+import pytest_markdoctest.markdown
+from pytest import MonkeyPatch, Pytester
+from pytest_markdoctest.cache import ParseCache, dump_doctests, load_doctests
+
+MD = cleandoc(
+    """
+    <!-- doctest: +NUMBER -->
+    ```python
+    >>> 2**0.5
+    1.414
+    ```
+
+    ```python
+    import math
+    x = math.pi
+    ```
+
+    ```python
+    >>> round(x, 2)  # doctest: +ELLIPSIS
+    3.1...
+    ```
+    """
+)
+
+
+def test_dump_load_roundtrip():
+    tests = pytest_markdoctest.parse_markdown(MD + "\n", "foo.md")
+    loaded = load_doctests(dump_doctests(tests), "foo.md")
+    assert len(loaded) == len(tests) == 3
+    for test, other in zip(tests, loaded):
+        assert (test.name, test.filename, test.lineno, test.docstring) == (
+            other.name,
+            other.filename,
+            other.lineno,
+            other.docstring,
+        )
+        assert test.options == other.options
+        assert test.examples == other.examples
+    # script block examples keep their bare "..." want.
+    assert loaded[1].examples[0].want == "..."
+    assert loaded[0].options == {doctest.OPTIONFLAGS_BY_NAME["NUMBER"]: True}
+    assert loaded[2].examples[0].options[doctest.ELLIPSIS] is True
+
+
+def test_unchanged_file_skips_parsing(pytester: Pytester, monkeypatch: MonkeyPatch):
+    pytester.makefile(".md", MD)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=3)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("parsed again")
+
+    monkeypatch.setattr(pytest_markdoctest.markdown, "parse_markdown", fail)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=3)
+
+    # a modified file is parsed again.
+    pytester.makefile(".md", MD + "\n\nsome text")
+    result = pytester.runpytest()
+    result.assert_outcomes(errors=1)
+
+
+def test_parse_cache_disabled(pytester: Pytester):
+    pytester.makefile(".md", MD)
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_parse_cache_size = 0
+        """
+    )
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=3)
+    assert not (pytester.path / ".pytest_cache" / "d" / ParseCache.name).exists()
+
+
+def test_parse_cache_dir_created_lazily(pytester: Pytester):
+    cache_dir = pytester.path / ".pytest_cache" / "d" / ParseCache.name
+    pytester.makepyfile("def test_a(): pass")
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1)
+    assert not cache_dir.exists()
+
+    pytester.makefile(".md", MD)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=4)
+    assert len(list(cache_dir.glob("*.json"))) == 1
+
+
+def test_key_has_plugin_version(monkeypatch: MonkeyPatch):
+    key = ParseCache.key(b"data", "utf-8")
+    monkeypatch.setattr(pytest_markdoctest.cache, "__version__", "0.0.0.dev0")
+    assert ParseCache.key(b"data", "utf-8") != key
+
+
+def test_prune(tmp_path):
+    cache = ParseCache(tmp_path, max_entries=2)
+    for i in range(4):
+        key = cache.key(b"%d" % i, "utf-8")
+        cache.set(key, [])
+        os.utime(cache._path(key), (i, i))
+    cache.prune()
+    kept = sorted(p.name for p in tmp_path.glob("*.json"))
+    assert kept == sorted(cache.key(b"%d" % i, "utf-8") + ".json" for i in (2, 3))
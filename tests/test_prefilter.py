@@ -0,0 +1,49 @@
+import pytest
+from pytest import Pytester
+from pytest_markdoctest.prefilter import fence_re
+from pytest_markdoctest.code_classes import DEFAULT
+
+
+@pytest.mark.parametrize(
+    "text, found",
+    [
+        (b"```python\n", True),
+        (b"text\n  ```` py\n", True),
+        (b"```pycon title='x'\n", True),
+        (b"text\r```python\r", True),
+        (b"```python3\n", False),
+        (b"```js\n", False),
+        (b"text ```python\n", False),
+        (b"# python\n\n```\npython\n```\n", False),
+    ],
+)
+def test_fence_re(text: bytes, found: bool):
+    assert (fence_re(DEFAULT.tested).search(text) is not None) == found
+
+
+def collected_files(pytester: Pytester, *args: str):
+    reprec = pytester.inline_run("--collect-only", *args)
+    return sorted(r.nodeid for r in reprec.getreports("pytest_collectreport") if r.nodeid.endswith(".md"))
+
+
+def test_files_without_python_blocks_are_not_collected(pytester: Pytester):
+    pytester.makefile(".md", test_a="```python\n>>> 1\n1\n```\n", test_b="# Notes\n\n```sh\n$ ls\n```\n", test_c="")
+    assert collected_files(pytester) == ["test_a.md"]
+    # explicitly given files are collected
+    assert collected_files(pytester, "test_b.md") == ["test_b.md"]
+
+    # the cached result is dropped when the file changes
+    pytester.makefile(".md", test_b="# Notes\n\n```py\n>>> 2\n2\n```\n")
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=2)
+
+
+def test_prefilter_disabled(pytester: Pytester):
+    pytester.makefile(".md", test_b="# Notes\n")
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_prefilter = false
+        """
+    )
+    assert collected_files(pytester) == ["test_b.md"]
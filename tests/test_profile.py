@@ -0,0 +1,77 @@
+import json
+import pstats
+from inspect import cleandoc
+
+from pytest import Pytester
+
+MD = cleandoc(
+    """
+    # Profile
+
+    ```python
+    >>> import time
+    >>> time.sleep(0.05)
+    >>> x = [0] * 100000
+    ```
+
+    ```python
+    def f():
+        return sum(range(1000))
+
+    f()
+    ```
+    """
+)
+
+
+def test_profile_summary(pytester: Pytester):
+    pytester.makefile(".md", test_profile=MD)
+    result = pytester.runpytest("--markdoctest-profile")
+    result.assert_outcomes(passed=2)
+    result.stdout.fnmatch_lines(
+        [
+            "*slowest 5 of 5 markdown examples*",
+            "*s *s test_profile.md:5: time.sleep(0.05)",
+        ]
+    )
+
+
+def test_profile_memory_json(pytester: Pytester):
+    pytester.makefile(".md", test_profile=MD)
+    result = pytester.runpytest("--markdoctest-profile=memory", "--markdoctest-profile-output=profile.json")
+    result.assert_outcomes(passed=2)
+    with open(str(pytester.path / "profile.json")) as f:
+        data = json.load(f)
+    assert data["mode"] == "memory"
+    examples = {(r["file"], r["line"]): r for r in data["examples"]}
+    assert set(examples) == {("test_profile.md", line) for line in (4, 5, 6, 10, 13)}
+    assert examples["test_profile.md", 5]["wall"] >= 0.05
+    assert examples["test_profile.md", 6]["memory"] >= 800000
+
+
+def test_profile_pstats(pytester: Pytester):
+    pytester.makefile(".md", test_profile=MD)
+    result = pytester.runpytest("--markdoctest-profile=cprofile", "--markdoctest-profile-output=profile.pstats")
+    result.assert_outcomes(passed=2)
+    stats = pstats.Stats(str(pytester.path / "profile.pstats"))
+    path = str(pytester.path / "test_profile.md")
+    # functions of examples are located in the markdown file
+    assert (path, 10, "f") in stats.stats
+    assert (path, 13, "<module>") in stats.stats
+
+
+def test_pstats_requires_cprofile(pytester: Pytester):
+    pytester.makefile(".md", test_profile=MD)
+    result = pytester.runpytest("--markdoctest-profile", "--markdoctest-profile-output=profile.pstats")
+    result.stderr.fnmatch_lines(["*requires --markdoctest-profile=cprofile*"])
+
+
+def test_profile_xdist(pytester: Pytester):
+    # examples of both files run on workers, and are reported by the controller
+    pytester.makefile(".md", test_profile=MD, test_other="```python\n>>> 1 + 1\n2\n```\n")
+    result = pytester.runpytest("-n", "2", "--markdoctest-profile=cprofile", "--markdoctest-profile-output=profile.pstats")
+    result.assert_outcomes(passed=3)
+    result.stdout.fnmatch_lines(["*slowest 6 of 6 markdown examples*", "*s *s test_profile.md:5: time.sleep(0.05)"])
+    stats = pstats.Stats(str(pytester.path / "profile.pstats"))
+    assert (str(pytester.path / "test_profile.md"), 10, "f") in stats.stats
+    assert (str(pytester.path / "test_other.md"), 2, "<module>") in stats.stats
@@ -0,0 +1,156 @@
+import random
+import time
+from inspect import cleandoc
+
+import pytest_markdoctest
+from pytest import Pytester
+from pytest_markdoctest.scanner import scan_code_blocks, scan_code_blocks_bytes
+
+CODE_BLOCK_RE = pytest_markdoctest.DoctestMarkdown._CODE_BLOCK_RE
+
+# line fragments chosen to hit the corner cases of _CODE_BLOCK_RE:
+# indented and unbalanced fences, backtick runs, inline closing fences,
+# comments with and without trailing spaces, unterminated comments.
+FRAGMENTS = [
+    "```",
+    "````",
+    "`````",
+    "```python",
+    "````python",
+    "``` py foo",
+    "```{.python}",
+    "  ```",
+    "  ```python",
+    "\t```",
+    "x ```",
+    "x  ```",
+    "`  ```",
+    "x````",
+    "<!-- doctest: +SKIP -->",
+    "  <!-- c -->  ",
+    "<!--->",
+    "<!---->",
+    "<!-- open",
+    ">>> 1 + 1",
+    "2",
+    "import math",
+    "text",
+    "",
+    " ",
+]
+
+
+def regex_blocks(text):
+    lineno, charno = 1, 0
+    for m in CODE_BLOCK_RE.finditer(text):
+        lineno += text.count("\n", charno, m.start())
+        charno = m.start()
+        yield m.span(), lineno, m.groupdict()
+
+
+def scanner_blocks(text):
+    for b in scan_code_blocks(text):
+        yield b.span(), b.lineno, b.groupdict()
+
+
+def test_same_blocks_as_regex():
+    text = cleandoc(
+        """
+        <!-- doctest: +SKIP -->
+        <!-- doctest: +NUMBER -->
+        ```python
+        >>> 1 + 1
+        2
+        ```
+
+        ````python
+        ```
+        not closed by three backticks
+        ````
+
+          ```pycon
+          >>> 1
+          1
+          ```
+        """
+    )
+    blocks = list(scanner_blocks(text))
+    assert blocks == list(regex_blocks(text))
+    assert [b[2]["code_class"] for b in blocks] == ["python", "python", "pycon"]
+    assert [b[1] for b in blocks] == [1, 8, 13]
+
+
+def test_differential_random():
+    rng = random.Random(0)
+    for _ in range(3000):
+        lines = [rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 14))]
+        text = "\n".join(lines) + rng.choice(["", "\n"])
+        assert list(scanner_blocks(text)) == list(regex_blocks(text)), text
+
+
+def test_pathological_input_is_fast():
+    # many unclosed fences and comment runs make the regex backtrack.
+    text = ("<!-- c -->\n" * 50 + "`````python\n" + "x = 1\n" * 20) * 200
+    blocks = scan_code_blocks(text + "```")
+    assert len(blocks) == 1
+    assert blocks[0].code_class is None
+
+
+def test_long_whitespace_is_fast():
+    # a line ending with whitespace and backticks may close fences of many
+    # indents, the scan must stay linear in its length.
+    width = 1 << 20
+    start = time.perf_counter()
+    assert scan_code_blocks("x" + " " * width + "```") == []
+    indent = " " * width
+    blocks = scan_code_blocks(indent + "```python\n>>> 1\n1\n" + "x" + indent + "```\n")
+    assert [b.code_content for b in blocks] == [">>> 1\n1\nx"]
+    assert time.perf_counter() - start < 5
+
+
+def test_bytes_scanner_same_as_text_scanner():
+    rng = random.Random(1)
+    classes = ("python", "py", "pycon")
+    fragments = FRAGMENTS + ["```py", "```pycon", "héllo wörld", ">>> print('ü')"]
+    for _ in range(1000):
+        lines = [rng.choice(fragments) for _ in range(rng.randint(0, 14))]
+        text = "\n".join(lines) + rng.choice(["", "\n"])
+        expected = [b for b in scan_code_blocks(text) if b.code_class in classes]
+        blocks = scan_code_blocks_bytes(text.encode("utf-8"), "utf-8", classes)
+        assert [(b.lineno, b.fence_lineno, b.groupdict()) for b in blocks] == [
+            (b.lineno, b.fence_lineno, b.groupdict()) for b in expected
+        ], text
+
+
+def test_mmap_collection(pytester: Pytester):
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_mmap = true
+        markdoctest_parse_cache_size = 0
+        """
+    )
+    md = cleandoc(
+        """
+        Ünïcode prose.
+        <!-- doctest: +ELLIPSIS -->
+        ```python
+        >>> print("héllo")
+        h...o
+        ```
+
+        ```python
+        assert False
+        ```
+        """
+    )
+    pytester.makefile(".md", test_unix=md, test_empty="")
+    pytester.path.joinpath("test_windows.md").write_bytes(md.replace("\n", "\r\n").encode("utf-8"))
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=2, failed=2)
+    result.stdout.fnmatch_lines(
+        [
+            "FAILED test_unix.md::<python block at line 8>",
+            "FAILED test_windows.md::<python block at line 8>",
+        ]
+    )
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from inspect import cleandoc
+
+import pytest
+from pytest import Pytester
+
+pytest.importorskip("xdist")
+
+from pytest_markdoctest.scheduling import markdown_scope, sort_by_duration  # noqa: E402
+
+
+def test_markdown_scope():
+    assert markdown_scope("docs/a.md::<python block at line 3>") == "docs/a.md"
+    assert markdown_scope("tests/test_a.py::test_a") is None
+
+
+def test_sort_by_duration():
+    workqueue = OrderedDict((scope, {}) for scope in ["a.md", "b.md", "test_c.py::test_c", "d.md"])
+    order = list(sort_by_duration(workqueue, {"a.md": 1.0, "b.md": 5.0}))
+    assert order == ["b.md", "d.md", "a.md", "test_c.py::test_c"]
+
+
+def blocks(n):
+    # each block depends on the previous one through the shared globals.
+    md = ["```python\nx = 0\n```"]
+    md += ["```python\n>>> x += 1\n>>> x\n%d\n```" % (i + 1) for i in range(n)]
+    return "\n\n".join(md)
+
+
+@pytest.mark.parametrize("dist", [["--markdoctest-dist"], ["--dist", "loadgroup"]])
+def test_markdown_files_stay_on_one_worker(pytester: Pytester, dist):
+    pytester.makefile(".md", test_a=blocks(20), test_b=blocks(20), test_c=blocks(20))
+    pytester.makepyfile(
+        cleandoc(
+            """
+            import pytest
+
+            @pytest.mark.parametrize("i", range(10))
+            def test_py(i):
+                pass
+            """
+        )
+    )
+    result = pytester.runpytest_subprocess("-n", "3", *dist)
+    result.assert_outcomes(passed=73)
+
+    # durations are recorded for the next run.
+    result = pytester.runpytest_subprocess("-n", "3", *dist)
+    result.assert_outcomes(passed=73)
+    assert pytester.path.joinpath(".pytest_cache", "v", "markdoctest", "durations").exists()
+
+
+@pytest.mark.parametrize("dist", [["--markdoctest-dist"], ["--dist", "loadgroup"]])
+def test_independent_groups_of_blocks(pytester: Pytester, dist):
+    # two independent chains of blocks, interleaved in one file.
+    md = ["```python\nx = 0\ny = 0\n```"]
+    for i in range(20):
+        md.append("```python\n>>> x += 1\n>>> x\n%d\n```" % (i + 1))
+        md.append("```python\n>>> z = %d\n>>> z\n%d\n```" % (i, i))
+    pytester.makefile(".md", test_a="\n\n".join(md))
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_block_dependencies = true
+        """
+    )
+    result = pytester.runpytest_subprocess("-n", "3", *dist)
+    result.assert_outcomes(passed=41)
@@ -0,0 +1,95 @@
+import doctest
+from inspect import cleandoc
+from pytest import Pytester
+from pytest_markdoctest import AnyOutputChecker
+
+
+def test_whole_block(pytester: Pytester):
+    md = cleandoc(
+        """
+        <!-- doctest: +WHOLE_BLOCK -->
+        ```python
+        import math
+        def f(x):
+            return math.sqrt(x)
+        a = f(4)
+        ```
+
+        <!-- doctest: +WHOLE_BLOCK -->
+        ```python
+        b = a + 1
+        c = f(
+            -1,
+        )
+        d = 3
+        ```
+
+        ```python
+        >>> a, b
+        (2.0, 3.0)
+        >>> d
+        Traceback (most recent call last):
+        NameError: name 'd' is not defined
+        ```
+        """
+    )
+    pytester.makefile(".md", md)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=2, failed=1)
+    result.stdout.fnmatch_lines(
+        [
+            "011 b = a + 1",
+            "012 c = f(",
+            "UNEXPECTED EXCEPTION: ValueError('math domain error')",
+        ],
+        consecutive=True,
+    )
+    result.stdout.fnmatch_lines(["*test_whole_block.md:12: UnexpectedException"])
+
+
+def test_whole_block_ini(pytester: Pytester):
+    md = cleandoc(
+        """
+        ```python
+        log = []
+        log.append(1 / 0)
+        log.append(2)
+        ```
+
+        <!-- doctest: -WHOLE_BLOCK -->
+        ```python
+        log2 = []
+        log2.append(1 / 0)
+        log2.append(2)
+        ```
+
+        ```python
+        >>> log, log2
+        ([], [2])
+        ```
+        """
+    )
+    pytester.makefile(".md", md)
+    pytester.makeini(
+        """
+        [pytest]
+        markdoctest_whole_block = true
+        """
+    )
+    # with --doctest-continue-on-failure, the statements after a failure
+    # run only if the block runs statement by statement.
+    result = pytester.runpytest("--doctest-continue-on-failure")
+    result.assert_outcomes(passed=1, failed=2)
+
+
+def test_any_output_checker():
+    class Checker(doctest.OutputChecker):
+        def check_output(self, want, got, optionflags):
+            assert want != "...", "script block output compared"
+            return super().check_output(want, got, optionflags)
+
+    checker = AnyOutputChecker(Checker())
+    assert checker.check_output("...", "x" * 10**6, doctest.ELLIPSIS)
+    assert checker.check_output("...\n", "x\n", doctest.ELLIPSIS)
+    assert not checker.check_output("...\n", "", doctest.ELLIPSIS)
+    assert checker.output_difference(doctest.Example("1", "2"), "3\n", 0).startswith("Expected:")
@@ -0,0 +1,103 @@
+import json
+from inspect import cleandoc
+
+from pytest import Pytester
+
+MD = cleandoc(
+    """
+    # Trace
+
+    ```python
+    >>> x = 1
+    >>> 1 / 0
+    Traceback (most recent call last):
+    ZeroDivisionError: division by zero
+    ```
+
+    <!-- doctest: +ELLIPSIS -->
+    ```python
+    >>> x
+    2
+    ```
+    """
+)
+
+CONFTEST = cleandoc(
+    """
+    calls = []
+
+    def pytest_markdoctest_block_start(block, lineno, options):
+        calls.append(("block_start", block, lineno, sorted(options)))
+
+    def pytest_markdoctest_block_finish(block, failed):
+        calls.append(("block_finish", block, failed))
+
+    def pytest_markdoctest_example_start(example, lineno):
+        calls.append(("example_start", example.source.strip(), lineno))
+
+    def pytest_markdoctest_example_finish(lineno, duration, exception):
+        assert duration >= 0
+        calls.append(("example_finish", lineno, type(exception).__name__ if exception else None))
+
+    def pytest_sessionfinish(session):
+        import json
+        with open("calls.json", "w") as f:
+            json.dump(calls, f)
+    """
+)
+
+
+def test_hooks(pytester: Pytester):
+    pytester.makefile(".md", test_trace=MD)
+    pytester.makeconftest(CONFTEST)
+    result = pytester.runpytest()
+    result.assert_outcomes(passed=1, failed=1)
+    with open(str(pytester.path / "calls.json")) as f:
+        calls = [tuple(call) for call in json.load(f)]
+    assert calls == [
+        ("block_start", "<python block at line 3>", 3, []),
+        ("example_start", "x = 1", 4),
+        ("example_finish", 4, None),
+        ("example_start", "1 / 0", 5),
+        ("example_finish", 5, "ZeroDivisionError"),
+        ("block_finish", "<python block at line 3>", False),
+        ("block_start", "<python block at line 11>", 11, ["ELLIPSIS"]),
+        ("example_start", "x", 12),
+        ("example_finish", 12, None),
+        ("block_finish", "<python block at line 11>", True),
+    ]
+
+
+def test_trace_file(pytester: Pytester):
+    pytester.makefile(".md", test_trace=MD)
+    result = pytester.runpytest("--markdoctest-trace=trace.jsonl")
+    result.assert_outcomes(passed=1, failed=1)
+    with open(str(pytester.path / "trace.jsonl")) as f:
+        spans = [json.loads(line) for line in f]
+    assert [(s["kind"], s["name"], s["status"]) for s in spans] == [
+        ("example", "x = 1", "ok"),
+        ("example", "1 / 0", "ok"),
+        ("block", "<python block at line 3>", "ok"),
+        ("example", "x", "ok"),
+        ("block", "<python block at line 11>", "error"),
+    ]
+    assert len({s["trace_id"] for s in spans}) == 1
+    assert len({s["span_id"] for s in spans}) == 5
+    # examples are children of their block
+    assert [s["parent_id"] for s in spans] == [spans[2]["span_id"]] * 2 + [None, spans[4]["span_id"], None]
+    for s in spans:
+        assert s["start_time"] <= s["end_time"]
+        assert s["attributes"]["markdoctest.file"].endswith("test_trace.md")
+    assert spans[1]["attributes"]["markdoctest.lineno"] == 5
+    assert spans[1]["attributes"]["markdoctest.exception"] == "ZeroDivisionError: division by zero"
+    assert spans[4]["attributes"]["markdoctest.options"] == ["ELLIPSIS"]
+
+
+def test_trace_file_xdist(pytester: Pytester):
+    pytester.makefile(".md", test_trace=MD)
+    result = pytester.runpytest("-n", "2", "--markdoctest-trace=trace.jsonl")
+    result.assert_outcomes(passed=1, failed=1)
+    with open(str(pytester.path / "trace.jsonl")) as f:
+        spans = [json.loads(line) for line in f]
+    assert len(spans) == 5
+    assert len({s["trace_id"] for s in spans}) == 1
@@ -0,0 +1,118 @@
+import signal
+import subprocess
+import sys
+import threading
+import time
+from inspect import cleandoc
+from pathlib import Path
+
+import pytest
+from pytest import Pytester
+from pytest_markdoctest.checkpoint import MemoryCheckpoints
+from pytest_markdoctest.watch import InotifyWatcher, PollingWatcher
+
+MD = cleandoc(
+    """
+    # Tutorial
+
+    ```python
+    with open("runs.txt", "a") as f:
+        _ = f.write("run\\n")
+    x = 1
+    ```
+
+    ```python
+    >>> x + 1
+    2
+    ```
+
+    ```python
+    >>> x + 2
+    3
+    ```
+    """
+)
+
+
+def test_memory_checkpoints():
+    checkpoints = MemoryCheckpoints(2)
+    checkpoints.save("a", {"x": 1, "lock": threading.Lock()})
+    checkpoints.save("b", {"x": 2})
+    assert checkpoints.load("a", {"x"}) == {"x": 1}
+    assert checkpoints.load("a", {"lock"}) is None
+    checkpoints.save("c", {"x": 3})
+    # b is the least recently used
+    assert "a" in checkpoints and "b" not in checkpoints and "c" in checkpoints
+
+
+@pytest.mark.parametrize(
+    "make_watcher",
+    [
+        pytest.param(
+            InotifyWatcher,
+            marks=pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is only available on Linux"),
+        ),
+        lambda paths: PollingWatcher(paths, 0.01),
+    ],
+)
+def test_watcher(tmp_path: Path, make_watcher):
+    a, b = tmp_path / "a.md", tmp_path / "b.md"
+    a.write_text("a")
+    b.write_text("b")
+    watcher = make_watcher([a, b])
+    try:
+        assert watcher.wait(0.05) == set()
+        (tmp_path / "c.md").write_text("c")
+        b.write_text("bb")
+        assert watcher.wait(1) == {b}
+    finally:
+        watcher.close()
+
+
+class Output:
+    """
+    Lines written by a process, read in a thread.
+    """
+
+    def __init__(self, popen: subprocess.Popen):
+        self.lines = []
+        self._thread = threading.Thread(target=self._read, args=(popen.stdout,), daemon=True)
+        self._thread.start()
+
+    def _read(self, stdout) -> None:
+        for line in stdout:
+            self.lines.append(line.decode())
+
+    def wait_for(self, text: str, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        while not any(text in line for line in self.lines):
+            assert time.monotonic() < deadline, "%r not in output:\n%s" % (text, "".join(self.lines))
+            time.sleep(0.05)
+
+
+def test_watch(pytester: Pytester, monkeypatch):
+    md = pytester.makefile(".md", test_tutorial=MD)
+    monkeypatch.setenv("PYTHONUNBUFFERED", "1")
+    popen = pytester.popen(
+        [sys.executable, "-m", "pytest", "-p", "no:xdist", "--markdoctest-watch", "test_tutorial.md"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    try:
+        output = Output(popen)
+        output.wait_for("watching 1 markdown files")
+
+        md.write_text(MD.replace("3\n```", "4\n```"))
+        output.wait_for("0 passed, 1 failed")
+        md.write_text(MD.replace("x + 2\n3", "x + 3\n4"))
+        output.wait_for("1 passed, 0 failed")
+    finally:
+        popen.send_signal(signal.SIGINT)
+        popen.wait(30)
+        popen.stdout.close()
+
+    text = "".join(output.lines)
+    assert text.count("test_tutorial.md changed, running from <python block at line 14>") == 2
+    assert "Expected:\n    4\nGot:\n    3" in text
+    # the blocks before the edited one did not run again
+    assert (pytester.path / "runs.txt").read_text() == "run\n"